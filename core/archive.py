@@ -0,0 +1,206 @@
+# core/archive.py - Archiviazione dei post vecchi (hot/cold)
+#
+# `manage.py archive_posts` sposta i post creati prima di una data, con commenti, like,
+# reaction e oggetti rilevati, in ArchivedPost: una riga per post con tutto in un JSON
+# compresso con zlib. Le tabelle usate dal feed restano piccole e i loro indici in memoria;
+# un post archiviato resta leggibile per id (PostViewSet.retrieve) con la stessa forma.
+#
+# Si lavora a blocchi di post ordinati per id, una transazione per blocco: il job si può
+# interrompere e rilanciare. I post del blocco sono bloccati (SELECT ... FOR UPDATE) finché
+# non vengono cancellati, così un like o un commento arrivato nel frattempo non va perso.
+#
+# GroupDetectionStat e i contatori dei badge non cambiano: i ricalcoli completi
+# (rebuild_group_stats, rebuild_badge_progress) leggono anche l'archivio con payloads().
+
+import datetime
+import json
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, models
+from django.utils.dateparse import parse_datetime
+
+from . import sharding
+from .models import ArchivedPost, Comment, DetectedObject, Post, PostLike, PostReaction, User
+
+DEFAULTS = {
+    'AFTER_DAYS': 365,
+    'BATCH_SIZE': 200,
+    'COMPRESSION_LEVEL': 6,
+}
+
+# Righe archiviate insieme al post: chiave nel payload -> modello (tutti con FK `post`)
+CHILDREN = {
+    'comments': Comment,
+    'likes': PostLike,
+    'reactions': PostReaction,
+    'detected_objects': DetectedObject,
+}
+
+PAYLOAD_VERSION = 1
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'HAPPYGREEN_ARCHIVE', {})}
+
+
+def _columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+class _PayloadEncoder(DjangoJSONEncoder):
+    """Date con i microsecondi: DjangoJSONEncoder li tronca ai millisecondi"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def pack(post, children):
+    """Post e righe collegate ({chiave di CHILDREN: [righe]}) come JSON compresso"""
+    data = {'v': PAYLOAD_VERSION, 'post': post, **children}
+    raw = json.dumps(data, cls=_PayloadEncoder, ensure_ascii=False, separators=(',', ':'))
+    return zlib.compress(raw.encode('utf-8'), get_config()['COMPRESSION_LEVEL'])
+
+
+def unpack(payload):
+    # Alcuni backend restituiscono i BinaryField come memoryview
+    return json.loads(zlib.decompress(bytes(payload)).decode('utf-8'))
+
+
+def _archive_batch(db, posts, after_id, batch_size):
+    """Archivia il blocco successivo ad `after_id`. Restituisce (ultimo id, post archiviati), None a fine lavoro"""
+    with sharding.atomic(db):
+        batch = list(
+            posts.select_for_update().filter(id__gt=after_id).order_by('id').values(*_columns(Post))[:batch_size]
+        )
+        if not batch:
+            return None
+        ids = [post['id'] for post in batch]
+
+        children = {post_id: {key: [] for key in CHILDREN} for post_id in ids}
+        for key, model in CHILDREN.items():
+            for row in model.objects.using(db).filter(post_id__in=ids).order_by('id').values(*_columns(model)):
+                children[row.pop('post_id')][key].append(row)
+
+        ArchivedPost.objects.bulk_create(
+            [
+                ArchivedPost(
+                    id=post['id'], group_id=post['group_id'], user_id=post['user_id'],
+                    created_at=post['created_at'], payload=pack(post, children[post['id']]),
+                )
+                for post in batch
+            ],
+            # Già archiviati da un'esecuzione interrotta prima della cancellazione
+            ignore_conflicts=True,
+        )
+        # La cascata cancella commenti, like, reaction, oggetti rilevati, token e notifiche
+        Post.objects.using(db).filter(id__in=ids).delete()
+    return ids[-1], len(ids)
+
+
+def archive_posts(before, batch_size=None, log=None):
+    """Archivia i post creati prima di `before` su tutti gli shard. Restituisce il numero di post"""
+    batch_size = batch_size or get_config()['BATCH_SIZE']
+    total = 0
+    for alias in sharding.data_aliases():
+        # Sempre dal primario: una replica in ritardo farebbe perdere le ultime righe
+        db = alias or DEFAULT_DB_ALIAS
+        posts = Post.objects.filter(created_at__lt=before)
+        if alias is not None:
+            posts = sharding.resident(posts, alias)
+            if posts is None:
+                continue
+            # I gruppi in spostamento vengono archiviati alla prossima esecuzione
+            frozen = sharding.shard_map.frozen_groups()
+            if frozen:
+                posts = posts.exclude(group_id__in=frozen)
+        else:
+            posts = posts.using(db)
+
+        last_id = 0
+        while True:
+            result = _archive_batch(db, posts, last_id, batch_size)
+            if result is None:
+                break
+            last_id, archived = result
+            total += archived
+            if log:
+                log(f'{db}: {archived} post archiviati (fino all\'id {last_id})')
+    return total
+
+
+def payload_chunks(chunk_size=100, **filters):
+    """Payload decompressi dei post archiviati (filtrati con `filters`), a blocchi ordinati per id"""
+    queryset = ArchivedPost.objects.filter(**filters)
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', 'payload')[:chunk_size])
+        if not chunk:
+            return
+        yield [unpack(payload) for _, payload in chunk]
+        last_id = chunk[-1][0]
+
+
+def payloads(chunk_size=100, **filters):
+    for chunk in payload_chunks(chunk_size, **filters):
+        yield from chunk
+
+
+def _instance(model, row, **extra):
+    """Istanza non salvata di `model` da una riga del payload; le colonne non più esistenti vengono ignorate"""
+    values = {}
+    for field in model._meta.concrete_fields:
+        if field.attname not in row:
+            continue
+        value = row[field.attname]
+        if isinstance(field, models.DateTimeField) and isinstance(value, str):
+            value = parse_datetime(value)
+        values[field.attname] = value
+    instance = model(**values, **extra)
+    instance._state.adding = False
+    return instance
+
+
+def _evaluated(model, rows):
+    """QuerySet già valutato su `rows`, come quelli lasciati da prefetch_related: nessuna query"""
+    queryset = model.objects.none()
+    queryset._result_cache = list(rows)
+    queryset._prefetch_done = True
+    return queryset
+
+
+def restore(archived, latest_comments):
+    """
+    Post non salvato con utenti, like, reaction e gli ultimi `latest_comments` commenti già
+    caricati, pronto per PostSerializer. Le righe di utenti nel frattempo cancellati vengono saltate
+    """
+    data = unpack(archived.payload)
+    user_ids = {data['post']['user_id']}
+    for key in ('comments', 'likes', 'reactions'):
+        user_ids.update(row['user_id'] for row in data[key])
+    users = User.objects.in_bulk(user_ids)
+
+    post = _instance(Post, data['post'])
+    post.user = users[post.user_id]
+
+    def related(model, key):
+        rows = [row for row in data[key] if row['user_id'] in users]
+        instances = [_instance(model, row, post_id=post.id) for row in rows]
+        for instance in instances:
+            instance.user = users[instance.user_id]
+        return instances
+
+    comments = sorted(related(Comment, 'comments'), key=lambda comment: (comment.created_at, comment.id))
+    post.comments_total = len(comments)
+    post.latest_comments = comments[-latest_comments:] if latest_comments else []
+    post._prefetched_objects_cache = {
+        'likes': _evaluated(PostLike, related(PostLike, 'likes')),
+        'reactions': _evaluated(PostReaction, related(PostReaction, 'reactions')),
+        'detectedobject_set': _evaluated(
+            DetectedObject, [_instance(DetectedObject, row, post_id=post.id) for row in data['detected_objects']]
+        ),
+    }
+    return post
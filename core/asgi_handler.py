@@ -0,0 +1,46 @@
+# core/asgi_handler.py - ASGIHandler che consuma le StreamingHttpResponse fuori dall'event loop
+#
+# Django 4.1 scorre il contenuto delle risposte in streaming direttamente nell'event loop:
+# un generatore che esegue query (es. l'export dei gruppi) fallirebbe con
+# SynchronousOnlyOperation. Qui ogni pezzo viene prodotto nel thread delle view sincrone,
+# come fa Django dalla 4.2.
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+
+_DONE = object()
+
+
+class StreamingASGIHandler(ASGIHandler):
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            response_headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            response_headers.append((b'Set-Cookie', cookie.output(header='').encode('ascii').strip()))
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': response_headers,
+        })
+
+        iterator = iter(response)
+        next_part = sync_to_async(next, thread_sensitive=True)
+        try:
+            while True:
+                part = await next_part(iterator, _DONE)
+                if part is _DONE:
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            await sync_to_async(response.close, thread_sensitive=True)()
@@ -0,0 +1,164 @@
+# core/async_views.py - Varianti async degli endpoint di sola lettura più chiamati
+#
+# Servite da asgi.py: mentre aspettano il database non occupano un worker,
+# a differenza delle view DRF sincrone.
+
+from asgiref.sync import sync_to_async
+from django.db import connections, router
+from django.db.models import Max
+from django.http import JsonResponse
+from rest_framework.authtoken.models import Token
+
+from . import sharding
+from .models import User, Group, GroupMembership, Post, GameScore
+from .serializers import UserSerializer, PostSerializer
+
+LEADERBOARD_SIZE = 50
+
+
+async def _authenticate(request):
+    """Equivalente async di TokenAuthentication: restituisce l'utente o None"""
+    header = request.headers.get('Authorization', '').split()
+    if len(header) != 2 or header[0].lower() != 'token':
+        return None
+
+    try:
+        token = await Token.objects.select_related('user').aget(key=header[1])
+    except Token.DoesNotExist:
+        return None
+
+    return token.user if token.user.is_active else None
+
+
+def _unauthorized():
+    return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+
+async def _user_group_ids(user):
+    user_groups = [
+        group_id async for group_id in
+        GroupMembership.objects.filter(user=user).values_list('group_id', flat=True)
+    ]
+    owned_groups = [
+        group_id async for group_id in
+        Group.objects.filter(owner=user).values_list('id', flat=True)
+    ]
+    return list(set(user_groups) | set(owned_groups))
+
+
+async def current_user(request):
+    """
+    Restituisce i dati dell'utente corrente (come views.current_user)
+    """
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+    user = await _authenticate(request)
+    if user is None:
+        return _unauthorized()
+
+    return JsonResponse(UserSerializer(user).data)
+
+
+def _global_leaderboard_rows():
+    with connections[router.db_for_read(GameScore)].cursor() as cursor:
+        cursor.execute("""
+            SELECT
+                user_id,
+                SUM(max_score) as total_score
+            FROM (
+                SELECT
+                    user_id,
+                    game_id,
+                    MAX(score) as max_score
+                FROM
+                    core_gamescore
+                GROUP BY
+                    user_id, game_id
+            ) best_scores
+            GROUP BY
+                user_id
+            ORDER BY
+                total_score DESC
+            LIMIT %s
+        """, [LEADERBOARD_SIZE])
+        return cursor.fetchall()
+
+
+async def get_leaderboard(request):
+    """
+    Classifica globale o per gioco specifico (come views.get_leaderboard)
+    """
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+    user = await _authenticate(request)
+    if user is None:
+        return _unauthorized()
+
+    game_id = request.GET.get('game_id')
+    score_key = 'score' if game_id else 'ecoPoints'
+
+    if game_id:
+        rows = [
+            (entry['user'], entry['best_score'])
+            async for entry in GameScore.objects.filter(game_id=game_id).values('user').annotate(
+                best_score=Max('score')
+            ).order_by('-best_score')[:LEADERBOARD_SIZE]
+        ]
+    else:
+        # Il cursore raw non ha un'interfaccia async: solo questa query passa da un thread
+        rows = await sync_to_async(_global_leaderboard_rows)()
+
+    users = await User.objects.only('id', 'username', 'avatar').ain_bulk([user_id for user_id, _ in rows])
+
+    leaderboard_data = []
+    for user_id, score in rows:
+        entry_user = users.get(user_id)
+        if entry_user is None:
+            continue
+        leaderboard_data.append({
+            'userId': entry_user.id,
+            'username': entry_user.username,
+            score_key: int(score),
+            'avatar': entry_user.avatar,
+        })
+
+    return JsonResponse(leaderboard_data, safe=False)
+
+
+async def post_feed(request):
+    """
+    Feed dei post dei gruppi dell'utente, opzionalmente filtrato con ?group= (come PostViewSet.list)
+    """
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+    user = await _authenticate(request)
+    if user is None:
+        return _unauthorized()
+
+    group_ids = await _user_group_ids(user)
+    group_id = request.GET.get('group')
+    if group_id is not None:
+        try:
+            group_id = int(group_id)
+        except (ValueError, TypeError):
+            return JsonResponse([], safe=False)
+        group_ids = [group_id] if group_id in group_ids else []
+
+    queryset = Post.objects.filter(group_id__in=group_ids).select_related('user', 'group').prefetch_related(
+        'likes__user', 'reactions__user'
+    ).order_by('-created_at')
+    if sharding.enabled():
+        # Un feed per shard, uniti per data (la mappa dei gruppi può richiedere query)
+        posts = await sync_to_async(sharding.scatter)(queryset)
+        posts.sort(key=lambda post: post.created_at, reverse=True)
+    else:
+        posts = [post async for post in queryset]
+
+    # Il serializer usa il request solo per user_liked/user_reaction
+    request.user = user
+    serializer = PostSerializer(posts, many=True, context={'request': request})
+    data = await sync_to_async(lambda: serializer.data)()
+    return JsonResponse(data, safe=False)
@@ -0,0 +1,221 @@
+# core/badges.py - Assegnazione dei badge guidata dagli eventi
+#
+# Le view chiamano record()/set_progress() quando un'azione cambia un contatore dell'utente
+# (post pubblicati, like ricevuti, punti eco...). Il contatore è una riga di UserProgress
+# aggiornata con un UPDATE atomico; vengono valutate solo le regole della metrica cambiata
+# e solo quelle la cui soglia è stata appena superata, quindi il costo per azione è
+# costante e non dipende dal numero di post, commenti o punteggi dell'utente.
+
+import bisect
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, post_save
+
+from . import archive, sharding
+from .models import Badge, Comment, Post, PostLike, PostReaction, User, UserBadge, UserProgress
+
+logger = logging.getLogger(__name__)
+
+RULES_TTL_SECONDS = 300
+
+
+class BadgeRules:
+    """Soglie dei badge automatici per metrica, in memoria e ordinate: {metric: ([soglie], [badge_id])}"""
+
+    def __init__(self, ttl=RULES_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._rules = {}
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return
+            rules = {}
+            for badge in Badge.objects.exclude(metric='').order_by('threshold', 'id').values(
+                'id', 'metric', 'threshold'
+            ):
+                thresholds, badge_ids = rules.setdefault(badge['metric'], ([], []))
+                thresholds.append(badge['threshold'])
+                badge_ids.append(badge['id'])
+            self._rules = rules
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self, **kwargs):
+        with self._lock:
+            self._loaded_at = None
+
+    def crossed(self, metric, previous, value):
+        """Badge con soglia in (previous, value]: quelli appena raggiunti"""
+        if value <= previous:
+            return []
+        self._ensure_loaded()
+        thresholds, badge_ids = self._rules.get(metric, ([], []))
+        start = bisect.bisect_right(thresholds, previous)
+        end = bisect.bisect_right(thresholds, value)
+        return badge_ids[start:end]
+
+    def reached(self, metric, value):
+        """Tutti i badge della metrica con soglia <= value (per il ricalcolo completo)"""
+        return self.crossed(metric, float('-inf'), value)
+
+
+rules = BadgeRules()
+
+post_save.connect(rules.invalidate, sender=Badge, dispatch_uid='badge_rules_save')
+post_delete.connect(rules.invalidate, sender=Badge, dispatch_uid='badge_rules_delete')
+
+
+def award(user_id, badge_ids):
+    """Inserisce i badge in blocco; quelli già ottenuti vengono ignorati (unique user/badge)"""
+    if not badge_ids:
+        return
+    UserBadge.objects.bulk_create(
+        [UserBadge(user_id=user_id, badge_id=badge_id) for badge_id in badge_ids],
+        ignore_conflicts=True,
+    )
+    logger.info(f'Badge {badge_ids} assegnati all\'utente {user_id}')
+
+
+def _save_progress(user_id, metric, value, initial):
+    """UPDATE del contatore (una query nel caso comune); la riga viene creata al primo evento"""
+    progress = UserProgress.objects.filter(user_id=user_id, metric=metric)
+    if progress.update(value=value):
+        return progress, False
+    try:
+        with transaction.atomic():
+            UserProgress.objects.create(user_id=user_id, metric=metric, value=initial)
+        return progress, True
+    except IntegrityError:
+        # Creata nel frattempo da un'altra richiesta
+        progress.update(value=value)
+        return progress, False
+
+
+def _increment(user_id, metric, delta):
+    """
+    Incrementa il contatore con un UPDATE atomico e restituisce il valore scritto. UPDATE e
+    lettura stanno nella stessa transazione: la riga resta bloccata dall'UPDATE fino al commit,
+    così due incrementi concorrenti leggono ognuno il proprio valore e nessuna soglia viene saltata.
+    Senza savepoint: dentro una transazione già aperta basta quella (nessuna query in più)
+    """
+    with transaction.atomic(savepoint=False):
+        progress, created = _save_progress(user_id, metric, F('value') + delta, delta)
+        if created:
+            return delta
+        return progress.values_list('value', flat=True).get()
+
+
+def record(user_id, metric, delta=1):
+    """Aggiorna un contatore di `delta` e assegna i badge la cui soglia è stata appena superata"""
+    value = _increment(user_id, metric, delta)
+    if delta > 0:
+        award(user_id, rules.crossed(metric, value - delta, value))
+    return value
+
+
+def forget_post(post):
+    """
+    Toglie dai contatori il post e ciò che la sua cancellazione porta via in cascata: commenti,
+    like (dati e ricevuti) e reaction ricevute. Da chiamare prima di post.delete()
+    """
+    deltas = Counter({(post.user_id, 'posts'): 1})
+    comments = Comment.objects.filter(post=post).values_list('user_id').annotate(total=Count('id')).order_by()
+    for user_id, total in comments:
+        deltas[user_id, 'comments'] += total
+    likes = PostLike.objects.filter(post=post).values_list('user_id').annotate(total=Count('id')).order_by()
+    for user_id, total in likes:
+        deltas[user_id, 'likes_given'] += total
+        if user_id != post.user_id:
+            deltas[post.user_id, 'likes_received'] += total
+    reactions = PostReaction.objects.filter(post=post).exclude(user_id=post.user_id).count()
+    if reactions:
+        deltas[post.user_id, 'reactions_received'] += reactions
+    for (user_id, metric), delta in deltas.items():
+        record(user_id, metric, -delta)
+
+
+def set_progress(user_id, metric, previous, value):
+    """Per le metriche già memorizzate altrove (es. User.eco_points): salva il valore e valuta le regole"""
+    _save_progress(user_id, metric, value, value)
+    award(user_id, rules.crossed(metric, previous, value))
+
+
+def current_values():
+    """
+    Valori reali delle metriche calcolati dalle tabelle, {metric: {user_id: valore}}.
+    Costoso: usato solo per il ricalcolo completo (`manage.py rebuild_badge_progress`)
+    """
+    archived = _archived_values()
+
+    def counts(metric, queryset, field):
+        # Con lo sharding si sommano i conteggi di tutti gli shard; più quelli dei post archiviati
+        totals = Counter(archived[metric])
+        for alias in sharding.data_aliases():
+            totals.update(dict(queryset.using(alias).values_list(field).annotate(total=Count('id')).order_by()))
+        return dict(totals)
+
+    return {
+        'eco_points': dict(User.objects.exclude(eco_points=0).values_list('id', 'eco_points')),
+        'posts': counts('posts', Post.objects.all(), 'user_id'),
+        'comments': counts('comments', Comment.objects.all(), 'user_id'),
+        'likes_given': counts('likes_given', PostLike.objects.all(), 'user_id'),
+        'likes_received': counts('likes_received', PostLike.objects.exclude(user=F('post__user')), 'post__user_id'),
+        'reactions_received': counts(
+            'reactions_received', PostReaction.objects.exclude(user=F('post__user')), 'post__user_id'
+        ),
+    }
+
+
+def _archived_values():
+    """Le stesse metriche per i post archiviati (manage.py archive_posts), dai payload"""
+    metrics = ('posts', 'comments', 'likes_given', 'likes_received', 'reactions_received')
+    totals = {metric: Counter() for metric in metrics}
+    for data in archive.payloads():
+        author = data['post']['user_id']
+        totals['posts'][author] += 1
+        for comment in data['comments']:
+            totals['comments'][comment['user_id']] += 1
+        for like in data['likes']:
+            totals['likes_given'][like['user_id']] += 1
+            if like['user_id'] != author:
+                totals['likes_received'][author] += 1
+        for reaction in data['reactions']:
+            if reaction['user_id'] != author:
+                totals['reactions_received'][author] += 1
+    return totals
+
+
+@transaction.atomic
+def rebuild():
+    """Riscrive tutti i contatori e assegna i badge già raggiunti. Restituisce (contatori, badge nuovi)"""
+    values = current_values()
+    UserProgress.objects.all().delete()
+    UserProgress.objects.bulk_create(
+        [
+            UserProgress(user_id=user_id, metric=metric, value=value)
+            for metric, per_user in values.items()
+            for user_id, value in per_user.items()
+        ],
+        batch_size=1000,
+    )
+
+    rules.invalidate()
+    before = UserBadge.objects.count()
+    UserBadge.objects.bulk_create(
+        [
+            UserBadge(user_id=user_id, badge_id=badge_id)
+            for metric, per_user in values.items()
+            for user_id, value in per_user.items()
+            for badge_id in rules.reached(metric, value)
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    return sum(len(per_user) for per_user in values.values()), UserBadge.objects.count() - before
@@ -0,0 +1,213 @@
+# core/benchmark.py - Carico di lavoro realistico sulle rotte reali dell'API
+#
+# Usato da `manage.py bench_happygreen` (e da `index_advisor` per raccogliere le query).
+# Le richieste passano dal vero URLconf e dai middleware: in-process con il
+# test client di Django, oppure via HTTP verso un server in esecuzione.
+
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+
+from .seeding import GAME_IDS
+
+
+class BenchmarkRoute:
+    def __init__(self, name, method, path, weight, body=None, authenticated=True):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.weight = weight
+        self.body = body
+        self.authenticated = authenticated
+
+
+# Mix di richieste osservato nell'app: soprattutto letture del feed
+WORKLOAD = [
+    BenchmarkRoute('posts', 'GET', '/posts/', 40),
+    BenchmarkRoute('my_groups', 'GET', '/groups/my_groups/', 20),
+    BenchmarkRoute('leaderboard', 'GET', '/leaderboard/', 20),
+    BenchmarkRoute(
+        'update_points', 'POST', '/user/update-points/', 15,
+        body=lambda rng, user: {'points': rng.randint(1, 1000), 'game_id': rng.choice(GAME_IDS)},
+    ),
+    BenchmarkRoute(
+        'login', 'POST', '/auth/login/', 5,
+        body=lambda rng, user: {'username': user['username'], 'password': user['password']},
+        authenticated=False,
+    ),
+]
+
+
+def percentile(values, percent):
+    """Percentile con il metodo nearest-rank su una lista di valori"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class InProcessTransport:
+    """Richieste tramite il test client di Django, con conteggio delle query per richiesta"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _client(self):
+        from django.test import Client
+
+        if not hasattr(self._local, 'client'):
+            self._local.client = Client(raise_request_exception=False)
+        return self._local.client
+
+    def request(self, method, path, body=None, token=None):
+        headers = {}
+        if token:
+            headers['HTTP_AUTHORIZATION'] = f'Token {token}'
+
+        query_count = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal query_count
+            query_count += 1
+            return execute(sql, params, many, context)
+
+        client = self._client()
+        with connection.execute_wrapper(count_query):
+            start = time.perf_counter()
+            if method == 'GET':
+                response = client.get(path, **headers)
+            else:
+                response = client.generic(method, path, json.dumps(body or {}), 'application/json', **headers)
+            elapsed = time.perf_counter() - start
+
+        return response.status_code, response.content, elapsed, query_count
+
+    def close(self):
+        # Ogni thread ha aperto la propria connessione al database
+        connection.close()
+
+
+class HttpTransport:
+    """Richieste HTTP verso un server già avviato (es. docker-compose con MariaDB)"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def request(self, method, path, body=None, token=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        request.add_header('Content-Type', 'application/json')
+        if token:
+            request.add_header('Authorization', f'Token {token}')
+
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                content = response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            content = e.read()
+            status = e.code
+        elapsed = time.perf_counter() - start
+        return status, content, elapsed, None
+
+    def close(self):
+        pass
+
+
+def login_users(transport, users):
+    """Ottiene i token degli utenti tramite auth/login/ (fuori dalle misure)"""
+    tokens = {}
+    for user in users:
+        status, content, _, _ = transport.request(
+            'POST', '/auth/login/', {'username': user['username'], 'password': user['password']}
+        )
+        if status == 200:
+            tokens[user['username']] = json.loads(content)['token']
+    return tokens
+
+
+def run_benchmark(transport, users, requests=1000, concurrency=8, random_seed=1, workload=None):
+    """
+    Esegue `requests` richieste distribuite secondo il peso delle rotte, con `concurrency`
+    thread. `users` è una lista di dict con username e password.
+    Restituisce le statistiche per rotta e complessive.
+    """
+    workload = workload or WORKLOAD
+    rng = random.Random(random_seed)
+
+    tokens = login_users(transport, users)
+    active_users = [user for user in users if user['username'] in tokens]
+    if not active_users:
+        raise RuntimeError('Nessun utente è riuscito ad autenticarsi')
+
+    plan = [
+        (route, rng.choice(active_users), random.Random(rng.random()))
+        for route in rng.choices(workload, weights=[route.weight for route in workload], k=requests)
+    ]
+    plan_lock = threading.Lock()
+    samples = defaultdict(list)
+    samples_lock = threading.Lock()
+
+    def worker():
+        try:
+            while True:
+                with plan_lock:
+                    if not plan:
+                        return
+                    route, user, request_rng = plan.pop()
+
+                body = route.body(request_rng, user) if route.body else None
+                token = tokens[user['username']] if route.authenticated else None
+                status, _, elapsed, query_count = transport.request(route.method, route.path, body, token)
+
+                with samples_lock:
+                    samples[route.name].append((status, elapsed, query_count))
+        finally:
+            transport.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    wall_time = time.perf_counter() - start
+
+    return {
+        'wall_time_s': round(wall_time, 3),
+        'routes': {name: _summarize(route_samples, wall_time) for name, route_samples in sorted(samples.items())},
+        'total': _summarize([sample for route_samples in samples.values() for sample in route_samples], wall_time),
+    }
+
+
+def _summarize(samples, wall_time):
+    latencies = [elapsed * 1000 for _, elapsed, _ in samples]
+    query_counts = [count for _, _, count in samples if count is not None]
+
+    def rounded(value):
+        return round(value, 2) if value is not None else None
+
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for status, _, _ in samples if status >= 400),
+        'throughput_rps': rounded(len(samples) / wall_time if wall_time else 0.0),
+        'latency_ms': {
+            'mean': rounded(sum(latencies) / len(latencies) if latencies else None),
+            'p50': rounded(percentile(latencies, 50)),
+            'p95': rounded(percentile(latencies, 95)),
+            'p99': rounded(percentile(latencies, 99)),
+            'max': rounded(max(latencies) if latencies else None),
+        },
+        'queries_per_request': {
+            'mean': rounded(sum(query_counts) / len(query_counts)) if query_counts else None,
+            'max': max(query_counts) if query_counts else None,
+        },
+    }
@@ -0,0 +1,247 @@
+# core/db_routers.py - Letture sulle repliche del database per le richieste GET
+#
+# ReplicaRoutingMiddleware sceglie, per le richieste GET/HEAD/OPTIONS, una delle repliche di
+# settings.DATABASE_REPLICAS con ritardo di replica sotto MAX_LAG_SECONDS; ReplicaRouter vi
+# manda le letture di quella richiesta. Le scritture vanno sempre su `default`.
+#
+# Read-your-writes: dopo una richiesta che ha scritto, il client resta sul primario per
+# STICKY_SECONDS, tramite il cookie PIN_COOKIE (browser) e una chiave in cache legata al
+# token dell'header Authorization (app). Con più worker la cache deve essere condivisa.
+#
+# In locale bastano due alias SQLite o MariaDB: le repliche possono puntare allo stesso
+# database del primario (ritardo zero) oppure a una copia del file SQLite.
+
+import contextlib
+import contextvars
+import hashlib
+import logging
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'hg_db_pin'
+# Token e sessioni appena creati (login) devono essere visibili subito
+PRIMARY_APPS = {'authtoken', 'sessions'}
+
+DEFAULTS = {
+    'STICKY_SECONDS': 5,
+    'MAX_LAG_SECONDS': 2,
+    # Ogni quanto rileggere il ritardo di una replica
+    'LAG_CHECK_SECONDS': 5,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'HAPPYGREEN_REPLICAS', {})}
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+class RoutingState:
+    """Stato della richiesta corrente: replica scelta (None = primario) e se ha già scritto"""
+
+    def __init__(self, replica=None):
+        self.replica = replica
+        self.wrote = False
+
+
+_state = contextvars.ContextVar('happygreen_db_routing', default=None)
+
+
+@contextlib.contextmanager
+def use_replica(alias):
+    """Manda su `alias` le letture del blocco (usato dal middleware, utile anche nei comandi)"""
+    state = RoutingState(alias)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+def read_alias(model=None):
+    """Alias da usare per le letture dirette con cursor() (query SQL scritte a mano)"""
+    state = _state.get()
+    if state is None or state.replica is None or state.wrote:
+        return DEFAULT_DB_ALIAS
+    if model is not None and model._meta.app_label in PRIMARY_APPS:
+        return DEFAULT_DB_ALIAS
+    # Dentro una transazione sul primario si legge ciò che si è appena scritto
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return DEFAULT_DB_ALIAS
+    return state.replica
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return read_alias(model)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primario e repliche contengono gli stessi dati
+        return True
+
+
+class LagMonitor:
+    """Ritardo delle repliche in secondi, riletto al massimo ogni LAG_CHECK_SECONDS per processo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = {}
+
+    def lag(self, alias, max_age):
+        with self._lock:
+            checked = self._checked.get(alias)
+        if checked is not None and time.monotonic() - checked[0] < max_age:
+            return checked[1]
+        lag = self.measure(alias)
+        with self._lock:
+            self._checked[alias] = (time.monotonic(), lag)
+        return lag
+
+    def measure(self, alias):
+        """Secondi di ritardo, 0 se l'alias non è una replica, None se la replica non è utilizzabile"""
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'mysql':
+                    cursor.execute('SHOW SLAVE STATUS')
+                    row = cursor.fetchone()
+                    if row is None:
+                        return 0
+                    status = dict(zip([column[0] for column in cursor.description], row))
+                    # NULL se la replica è ferma
+                    lag = status.get('Seconds_Behind_Master')
+                    return None if lag is None else float(lag)
+                if connection.vendor == 'postgresql':
+                    cursor.execute(
+                        'SELECT CASE WHEN pg_is_in_recovery() '
+                        'THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) '
+                        'ELSE 0 END'
+                    )
+                    return float(cursor.fetchone()[0])
+                cursor.execute('SELECT 1')
+                return 0
+        except DatabaseError:
+            logger.warning(f'Replica {alias} non raggiungibile, letture sul primario', exc_info=True)
+            return None
+
+    def reset(self):
+        with self._lock:
+            self._checked = {}
+
+
+lag_monitor = LagMonitor()
+
+
+def choose_replica(config=None):
+    """Una replica a caso tra quelle con ritardo accettabile, None se nessuna lo è"""
+    config = config or get_config()
+    healthy = []
+    for alias in replica_aliases():
+        lag = lag_monitor.lag(alias, config['LAG_CHECK_SECONDS'])
+        if lag is not None and lag <= config['MAX_LAG_SECONDS']:
+            healthy.append(alias)
+    return random.choice(healthy) if healthy else None
+
+
+def _token_pin_key(request):
+    authorization = request.headers.get('Authorization')
+    if not authorization:
+        return None
+    return 'db-pin:' + hashlib.sha256(authorization.encode('utf-8')).hexdigest()
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = get_config()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def is_pinned(self, request):
+        if request.COOKIES.get(PIN_COOKIE):
+            return True
+        key = _token_pin_key(request)
+        return key is not None and cache.get(key) is not None
+
+    def pin(self, request, response):
+        seconds = self.config['STICKY_SECONDS']
+        response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+        key = _token_pin_key(request)
+        if key is not None:
+            cache.set(key, 1, timeout=seconds)
+
+    def replica_for(self, request):
+        if request.method in SAFE_METHODS and not self.is_pinned(request):
+            return choose_replica(self.config)
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not replica_aliases():
+            return self.get_response(request)
+
+        with use_replica(self.replica_for(request)) as state:
+            response = self.get_response(request)
+
+        if state.wrote:
+            self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        if not replica_aliases():
+            return await self.get_response(request)
+
+        # Cache e controllo del ritardo fanno I/O sincrono: nel thread delle query della richiesta.
+        # Lo stato è in una ContextVar, che sync_to_async copia nei thread
+        replica = await sync_to_async(self.replica_for, thread_sensitive=True)(request)
+        with use_replica(replica) as state:
+            response = await self.get_response(request)
+
+        if state.wrote:
+            await sync_to_async(self.pin, thread_sensitive=True)(request, response)
+        return response
+
+
+@contextlib.contextmanager
+def execute_wrapper_all(wrapper):
+    """connection.execute_wrapper() su tutti gli alias, per strumentare anche le query sulle repliche"""
+    with contextlib.ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        yield
+
+
+@contextlib.asynccontextmanager
+async def aexecute_wrapper_all(wrapper):
+    """
+    execute_wrapper_all() per i middleware async: le connessioni sono per thread e sotto ASGI
+    le query della richiesta girano nel thread di sync_to_async(thread_sensitive=True), dove
+    il wrapper viene installato e poi tolto
+    """
+    manager = execute_wrapper_all(wrapper)
+    await sync_to_async(manager.__enter__, thread_sensitive=True)()
+    try:
+        yield
+    finally:
+        await sync_to_async(manager.__exit__, thread_sensitive=True)(None, None, None)
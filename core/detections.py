@@ -0,0 +1,170 @@
+# core/detections.py - Catalogo dei consigli di riciclo e inserimento in blocco degli oggetti rilevati
+#
+# Descrizione e consigli di riciclo dipendono solo dall'etichetta: stanno una volta sola in
+# RecyclingTip e ogni processo ne tiene una copia in memoria (ricaricata quando un
+# RecyclingTip viene salvato o cancellato in questo processo, oppure dopo CATALOG_TTL_SECONDS).
+# Un DetectedObject salva i propri testi solo se diversi da quelli del catalogo.
+# GroupDetectionStat conta gli oggetti rilevati per etichetta e gruppo ed è aggiornato a ogni
+# inserimento o cancellazione, così la classifica degli oggetti più rilevati è una sola query.
+
+import threading
+import time
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.signals import post_delete, post_save
+
+from . import archive, sharding
+from .models import DetectedObject, GroupDetectionStat, RecyclingTip
+
+CATALOG_TTL_SECONDS = 300
+MAX_DETECTIONS = 50
+
+
+def normalize_label(label):
+    """Chiave del catalogo: minuscolo e spazi compattati ("Bottiglia  PET" -> "bottiglia pet")"""
+    return ' '.join(str(label).split()).lower()
+
+
+class TipCatalog:
+    def __init__(self, ttl=CATALOG_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._by_label = {}
+        self._by_id = {}
+
+    def _add(self, tips):
+        for tip in tips:
+            self._by_label[tip['label']] = tip
+            self._by_id[tip['id']] = tip
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return
+            self._by_label, self._by_id = {}, {}
+            self._add(RecyclingTip.objects.values('id', 'label', 'description', 'recycle_tips'))
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self, **kwargs):
+        with self._lock:
+            self._loaded_at = None
+
+    def get(self, tip_id):
+        """Voce del catalogo per id; le voci create da altri processi vengono lette dal DB"""
+        if tip_id is None:
+            return None
+        self._ensure_loaded()
+        tip = self._by_id.get(tip_id)
+        if tip is None:
+            tips = list(RecyclingTip.objects.filter(id=tip_id).values('id', 'label', 'description', 'recycle_tips'))
+            with self._lock:
+                self._add(tips)
+            tip = tips[0] if tips else None
+        return tip
+
+    def resolve(self, items):
+        """
+        `items`: dizionari con label e, facoltativi, description e recycle_tips. Restituisce
+        {etichetta normalizzata: voce del catalogo}; le etichette nuove vengono aggiunte al
+        catalogo (con i testi della prima occorrenza) in un solo bulk_create
+        """
+        self._ensure_loaded()
+        labels = {normalize_label(item['label']) for item in items}
+        missing = {}
+        for item in items:
+            label = normalize_label(item['label'])
+            if label not in self._by_label and label not in missing:
+                missing[label] = RecyclingTip(
+                    label=label,
+                    description=item.get('description') or '',
+                    recycle_tips=item.get('recycle_tips') or '',
+                )
+
+        if missing:
+            # ignore_conflicts: la stessa etichetta può essere appena stata creata da un'altra richiesta
+            RecyclingTip.objects.bulk_create(missing.values(), ignore_conflicts=True)
+            sharding.replicate_rows(RecyclingTip, RecyclingTip.objects.filter(label__in=missing))
+            tips = list(RecyclingTip.objects.filter(label__in=missing).values('id', 'label', 'description', 'recycle_tips'))
+            with self._lock:
+                self._add(tips)
+
+        return {label: self._by_label[label] for label in labels if label in self._by_label}
+
+    def texts(self, detected_object):
+        """(description, recycle_tips) di un oggetto rilevato, dal catalogo se non ha testi propri"""
+        tip = self.get(detected_object.tip_id) or {}
+        return (
+            detected_object.description or tip.get('description', ''),
+            detected_object.recycle_tips or tip.get('recycle_tips', ''),
+        )
+
+
+catalog = TipCatalog()
+
+post_save.connect(catalog.invalidate, sender=RecyclingTip, dispatch_uid='tip_catalog_save')
+post_delete.connect(catalog.invalidate, sender=RecyclingTip, dispatch_uid='tip_catalog_delete')
+
+
+def build_detection(post, item, tips):
+    """DetectedObject non salvato per `item`, con i testi vuoti se coincidono con il catalogo"""
+    tip = tips[normalize_label(item['label'])]
+    description = item.get('description') or ''
+    recycle_tips = item.get('recycle_tips') or ''
+    return DetectedObject(
+        post=post,
+        label=item['label'],
+        tip_id=tip['id'],
+        description='' if description == tip['description'] else description,
+        recycle_tips='' if recycle_tips == tip['recycle_tips'] else recycle_tips,
+    )
+
+
+def update_group_stats(group_id, labels, sign=1):
+    """Aggiunge (sign=1) o toglie (sign=-1) le etichette al conteggio del gruppo: due query in tutto"""
+    counts = Counter(normalize_label(label) for label in labels)
+    if not counts:
+        return
+    if sign > 0:
+        GroupDetectionStat.objects.bulk_create(
+            [GroupDetectionStat(group_id=group_id, label=label, count=0) for label in counts],
+            ignore_conflicts=True,
+        )
+    GroupDetectionStat.objects.filter(group_id=group_id, label__in=counts).update(
+        count=F('count') + Case(
+            *[When(label=label, then=Value(sign * count)) for label, count in counts.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
+
+
+def create_detections(post, items):
+    """Salva tutti gli oggetti rilevati di una foto con un solo bulk_create"""
+    tips = catalog.resolve(items)
+    objects = DetectedObject.objects.bulk_create([build_detection(post, item, tips) for item in items])
+    update_group_stats(post.group_id, [item['label'] for item in items])
+    return objects
+
+
+@transaction.atomic
+def rebuild_group_stats():
+    """Ricalcola tutti i conteggi per gruppo dagli oggetti rilevati. Restituisce il numero di righe"""
+    counts = Counter()
+    for alias in sharding.data_aliases():
+        rows = DetectedObject.objects.using(alias).values_list('post__group_id', 'label').order_by()
+        for group_id, label in rows.iterator():
+            counts[(group_id, normalize_label(label))] += 1
+    # Oggetti dei post archiviati (manage.py archive_posts)
+    for data in archive.payloads():
+        for detected in data['detected_objects']:
+            counts[(data['post']['group_id'], normalize_label(detected['label']))] += 1
+
+    GroupDetectionStat.objects.all().delete()
+    GroupDetectionStat.objects.bulk_create(
+        [GroupDetectionStat(group_id=group_id, label=label, count=count) for (group_id, label), count in counts.items()],
+        batch_size=1000,
+    )
+    return len(counts)
@@ -0,0 +1,140 @@
+# core/events.py - Pub/sub degli eventi di attività dei gruppi (post, commenti, like, reactions)
+
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = 'core.events.InMemoryBackend'
+
+
+class InMemoryBackend:
+    """
+    Backend in-process: gli eventi arrivano solo ai client connessi allo stesso processo.
+    Va bene per lo sviluppo o con un solo worker ASGI.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._enqueue, queue, message)
+            except RuntimeError:
+                # Event loop già chiuso: il subscriber verrà rimosso alla disconnessione
+                pass
+
+    @staticmethod
+    def _enqueue(queue, message):
+        if queue.full():
+            # Client lento: scarta l'evento più vecchio invece di bloccare chi pubblica
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+    async def subscribe(self, channel):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        entry = (loop, queue)
+
+        with self._lock:
+            self._subscribers[channel].add(entry)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(entry)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+
+class RedisBackend:
+    """
+    Backend Redis pub/sub: condivide gli eventi tra più worker (WSGI e ASGI).
+    Richiede il pacchetto opzionale `redis`.
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', prefix='happygreen:'):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("RedisBackend richiede il pacchetto 'redis'")
+
+        self.url = url
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def publish(self, channel, message):
+        self._client.publish(self.prefix + channel, message)
+
+    async def subscribe(self, channel):
+        from redis import asyncio as aioredis
+
+        client = aioredis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(self.prefix + channel)
+        try:
+            async for item in pubsub.listen():
+                if item['type'] == 'message':
+                    yield item['data'].decode('utf-8')
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.close()
+            await client.close()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Istanzia (una sola volta) il backend configurato in settings.HAPPYGREEN_EVENTS"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = getattr(settings, 'HAPPYGREEN_EVENTS', {})
+                backend_class = import_string(config.get('BACKEND', DEFAULT_BACKEND))
+                _backend = backend_class(**config.get('OPTIONS', {}))
+    return _backend
+
+
+def group_channel(group_id):
+    return f'group.{group_id}'
+
+
+def publish_group_event(group_id, event_type, data):
+    """
+    Pubblica un evento sul canale del gruppo dopo il commit della transazione,
+    così i client non ricevono mai eventi di scritture annullate
+    """
+    message = json.dumps({
+        'type': event_type,
+        'group': group_id,
+        'data': data,
+        'timestamp': timezone.now(),
+    }, cls=DjangoJSONEncoder)
+
+    def _publish():
+        try:
+            get_backend().publish(group_channel(group_id), message)
+        except Exception as e:
+            logger.error(f"Error publishing {event_type} event for group {group_id}: {str(e)}")
+
+    transaction.on_commit(_publish)
@@ -0,0 +1,152 @@
+# core/exports.py - Esportazione in streaming dell'attività di un gruppo (NDJSON o CSV)
+#
+# Le righe vengono lette a blocchi di CHUNK_SIZE con una condizione id > ultimo id, non con
+# QuerySet.iterator(): con MySQL/MariaDB il driver scarica comunque tutto il risultato in
+# memoria, mentre a blocchi la memoria resta costante e il primo blocco parte subito.
+
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_datetime
+
+from .archive import payload_chunks
+from .detections import catalog
+from .models import GroupMembership, Post, Comment, DetectedObject, User
+from .sharding import shard_for_group
+
+CHUNK_SIZE = 500
+# Dimensione dei pezzi inviati al client: una riga alla volta sarebbe troppo frammentato
+BUFFER_SIZE = 64 * 1024
+
+CSV_COLUMNS = [
+    'type', 'id', 'post_id', 'user_id', 'username', 'role', 'text', 'label',
+    'latitude', 'longitude', 'score', 'created_at',
+]
+
+
+def iterate_in_chunks(queryset, chunk_size=CHUNK_SIZE):
+    """Scorre un queryset di .values() (con 'id') a blocchi ordinati per id"""
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id).order_by('id')[:chunk_size])
+        if not chunk:
+            return
+        yield from chunk
+        last_id = chunk[-1]['id']
+
+
+def group_rows(group):
+    """Tutte le righe esportate di un gruppo: membri con punteggio, post, commenti, oggetti rilevati (anche archiviati)"""
+    memberships = GroupMembership.objects.filter(group=group).values(
+        'id', 'user_id', 'user__username', 'role', 'user__eco_points', 'joined_at'
+    )
+    for row in iterate_in_chunks(memberships):
+        yield {
+            'type': 'member', 'id': row['id'], 'user_id': row['user_id'], 'username': row['user__username'],
+            'role': row['role'], 'score': row['user__eco_points'], 'created_at': row['joined_at'],
+        }
+
+    # Post, commenti e oggetti rilevati dallo shard del gruppo (None senza sharding)
+    alias = shard_for_group(group.id)
+
+    # image_url escluso: può contenere immagini base64 di diversi MB
+    posts = Post.objects.using(alias).filter(group=group).values(
+        'id', 'user_id', 'user__username', 'caption', 'latitude', 'longitude', 'created_at'
+    )
+    for row in iterate_in_chunks(posts):
+        yield {
+            'type': 'post', 'id': row['id'], 'user_id': row['user_id'], 'username': row['user__username'],
+            'text': row['caption'], 'latitude': row['latitude'], 'longitude': row['longitude'],
+            'created_at': row['created_at'],
+        }
+
+    comments = Comment.objects.using(alias).filter(post__group=group).values(
+        'id', 'post_id', 'user_id', 'user__username', 'content', 'created_at'
+    )
+    for row in iterate_in_chunks(comments):
+        yield {
+            'type': 'comment', 'id': row['id'], 'post_id': row['post_id'], 'user_id': row['user_id'],
+            'username': row['user__username'], 'text': row['content'], 'created_at': row['created_at'],
+        }
+
+    detected = DetectedObject.objects.using(alias).filter(post__group=group).values(
+        'id', 'post_id', 'label', 'tip_id', 'description'
+    )
+    for row in iterate_in_chunks(detected):
+        tip = catalog.get(row['tip_id']) or {}
+        yield {
+            'type': 'detected_object', 'id': row['id'], 'post_id': row['post_id'],
+            'label': row['label'], 'text': row['description'] or tip.get('description', ''),
+        }
+
+    # Post archiviati (manage.py archive_posts): stesse righe, dai payload
+    for chunk in payload_chunks(group_id=group.id):
+        user_ids = {data['post']['user_id'] for data in chunk}
+        user_ids.update(comment['user_id'] for data in chunk for comment in data['comments'])
+        usernames = dict(User.objects.filter(id__in=user_ids).values_list('id', 'username'))
+        for data in chunk:
+            yield from _archived_rows(data, usernames)
+
+
+def _archived_rows(data, usernames):
+    post = data['post']
+    yield {
+        'type': 'post', 'id': post['id'], 'user_id': post['user_id'], 'username': usernames.get(post['user_id']),
+        'text': post['caption'], 'latitude': post['latitude'], 'longitude': post['longitude'],
+        'created_at': parse_datetime(post['created_at']),
+    }
+    for comment in data['comments']:
+        yield {
+            'type': 'comment', 'id': comment['id'], 'post_id': post['id'], 'user_id': comment['user_id'],
+            'username': usernames.get(comment['user_id']), 'text': comment['content'],
+            'created_at': parse_datetime(comment['created_at']),
+        }
+    for detected in data['detected_objects']:
+        tip = catalog.get(detected['tip_id']) or {}
+        yield {
+            'type': 'detected_object', 'id': detected['id'], 'post_id': post['id'],
+            'label': detected['label'], 'text': detected['description'] or tip.get('description', ''),
+        }
+
+
+def _buffered(parts):
+    buffer, size = [], 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= BUFFER_SIZE:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def ndjson_stream(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    return _buffered(encoder.encode(row) + '\n' for row in rows)
+
+
+class _Echo:
+    """Pseudo-file per csv.writer: restituisce la riga invece di scriverla"""
+
+    def write(self, value):
+        return value
+
+
+def csv_stream(rows):
+    writer = csv.DictWriter(_Echo(), fieldnames=CSV_COLUMNS)
+
+    def lines():
+        yield writer.writerow(dict(zip(CSV_COLUMNS, CSV_COLUMNS)))
+        for row in rows:
+            if row.get('created_at') is not None:
+                row['created_at'] = row['created_at'].isoformat()
+            yield writer.writerow(row)
+
+    return _buffered(lines())
+
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson; charset=utf-8', ndjson_stream),
+    'csv': ('text/csv; charset=utf-8', csv_stream),
+}
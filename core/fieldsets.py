@@ -0,0 +1,198 @@
+# core/fieldsets.py - Campi a richiesta nelle letture (?fields=, ?omit=, ?expand=)
+#
+#   ?fields=id,caption,user.username   solo questi campi (sotto-campi dei serializer annidati col punto)
+#   ?omit=likes,user.avatar            tutti i campi tranne questi
+#   ?expand=detected_objects           in più i campi facoltativi (Meta.expandable_fields)
+#
+# I campi esclusi non vengono prodotti: i SerializerMethodField non sono nemmeno chiamati.
+# Nelle view con SparseFieldsetsViewMixin anche il queryset di list/retrieve viene ridotto:
+# only() sulle colonne dei campi rimasti e select_related/prefetch_related solo per le
+# relazioni ancora servite. I campi che non corrispondono a una colonna dichiarano cosa
+# leggono in Meta.field_columns / Meta.field_prefetches; se un campo non si sa caricare il
+# queryset resta invariato. Solo GET/HEAD: in scrittura il serializer ha sempre tutti i campi.
+# Un nome che il serializer non ha dà 400 con l'elenco dei campi sconosciuti.
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+PARAMS = ('fields', 'omit', 'expand')
+
+
+def _parse(value):
+    """'id,user.username,user.id' -> {'id': {}, 'user': {'username': {}, 'id': {}}}"""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+class Fieldset:
+    """Campi richiesti per un serializer; child() dà quelli dei suoi serializer annidati"""
+
+    def __init__(self, fields=None, omit=None, expand=None, prefix=''):
+        # fields None: tutti i campi (tranne quelli espandibili non richiesti)
+        self.fields = fields
+        self.omit = omit or {}
+        self.expand = expand or {}
+        # Percorso dei campi annidati ('user.'), per i messaggi di errore
+        self.prefix = prefix
+
+    @classmethod
+    def from_request(cls, request):
+        """Fieldset dai parametri della richiesta, None se non ce ne sono"""
+        params = request.query_params
+        if not any(params.get(name) for name in PARAMS):
+            return None
+        fields = _parse(params['fields']) if params.get('fields') else None
+        return cls(fields, _parse(params.get('omit', '')), _parse(params.get('expand', '')))
+
+    def select(self, names, expandable=()):
+        """I nomi da mantenere, nell'ordine del serializer"""
+        kept = []
+        for name in names:
+            if self.fields is not None and name not in self.fields:
+                continue
+            # I campi espandibili vanno chiesti con ?expand= o elencati in ?fields=
+            if name in expandable and name not in self.expand and self.fields is None:
+                continue
+            # ?omit=user.avatar toglie un sotto-campo, non il campo
+            if name in self.omit and not self.omit[name]:
+                continue
+            kept.append(name)
+        return kept
+
+    def unknown(self, names):
+        """Nomi richiesti (in fields, omit o expand) che non sono tra `names`, col percorso completo"""
+        requested = set(self.fields or ()) | set(self.omit) | set(self.expand)
+        return sorted(self.prefix + name for name in requested - set(names))
+
+    def child(self, name):
+        fields = (self.fields or {}).get(name) or None
+        omit = self.omit.get(name)
+        expand = self.expand.get(name)
+        if not (fields or omit or expand):
+            return None
+        return Fieldset(fields, omit, expand, f'{self.prefix}{name}.')
+
+
+def apply(serializer, fieldset):
+    """Assegna `fieldset` al serializer (al child se many=True), prima che ne vengano letti i campi"""
+    if fieldset is None:
+        return serializer
+    target = getattr(serializer, 'child', serializer)
+    if isinstance(target, SparseFieldsetsMixin):
+        target.fieldset = fieldset
+    return serializer
+
+
+class SparseFieldsetsMixin:
+    """Per i serializer: tiene solo i campi del Fieldset assegnato con apply()"""
+
+    fieldset = None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expandable = getattr(getattr(self, 'Meta', None), 'expandable_fields', ())
+        fieldset = self.fieldset or Fieldset()
+        unknown = fieldset.unknown(fields)
+        kept = fieldset.select(fields, expandable)
+        if len(kept) != len(fields):
+            fields = {name: fields[name] for name in kept}
+        if self.fieldset is not None:
+            for name, field in fields.items():
+                child = self.fieldset.child(name)
+                # Sotto-campi chiesti a un campo che non li sa selezionare (i SerializerMethodField
+                # passano da sé il fieldset figlio al serializer che costruiscono)
+                target = getattr(field, 'child', field)
+                if child is not None and not isinstance(target, (SparseFieldsetsMixin, serializers.SerializerMethodField)):
+                    unknown += child.unknown(())
+                apply(field, child)
+        if unknown:
+            raise ValidationError({'error': f"Campi sconosciuti: {', '.join(unknown)}"})
+        return fields
+
+
+def load_plan(serializer, prefix=''):
+    """
+    (colonne per only(), select_related, prefetch_related) che servono ai campi del serializer;
+    None se un campo non si sa caricare
+    """
+    meta = serializer.Meta
+    model = meta.model
+    declared_columns = getattr(meta, 'field_columns', {})
+    declared_prefetches = getattr(meta, 'field_prefetches', {})
+    columns, selects, prefetches = {prefix + model._meta.pk.name}, set(), set()
+
+    for name, field in serializer.fields.items():
+        if name in declared_columns or name in declared_prefetches:
+            columns.update(prefix + path for path in declared_columns.get(name, ()))
+            prefetches.update(prefix + path for path in declared_prefetches.get(name, ()))
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+        if not model_field.concrete:
+            return None
+        columns.add(prefix + model_field.name)
+        if isinstance(field, serializers.BaseSerializer):
+            # Solo relazioni dirette (FK): le altre vanno dichiarate in Meta.field_prefetches
+            if isinstance(field, serializers.ListSerializer) or not model_field.is_relation:
+                return None
+            nested = load_plan(field, f'{prefix}{model_field.name}__')
+            if nested is None:
+                return None
+            columns |= nested[0]
+            selects |= nested[1] | {prefix + model_field.name}
+            prefetches |= nested[2]
+
+    # Le colonne delle tabelle collegate arrivano con select_related
+    selects.update(path.rsplit('__', 1)[0] for path in columns if '__' in path)
+    return columns, selects, prefetches
+
+
+def trim_queryset(queryset, serializer, always=()):
+    """Il queryset ridotto a quello che serve al serializer (più le colonne `always`)"""
+    plan = load_plan(getattr(serializer, 'child', serializer))
+    if plan is None:
+        return queryset
+    columns, selects, prefetches = plan
+    columns |= set(always)
+    selects.update(path.rsplit('__', 1)[0] for path in always if '__' in path)
+
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if selects:
+        queryset = queryset.select_related(*selects)
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    return queryset.only(*columns)
+
+
+class SparseFieldsetsViewMixin:
+    """Per le view: ?fields=/?omit=/?expand= sul serializer delle letture e sul queryset di list/retrieve"""
+
+    # Colonne caricate comunque perché usate dalla view (es. ordinamento in Python)
+    sparse_always = ()
+
+    def get_fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = Fieldset.from_request(self.request) if self.request.method in SAFE_METHODS else None
+        return self._fieldset
+
+    def get_serializer(self, *args, **kwargs):
+        return apply(super().get_serializer(*args, **kwargs), self.get_fieldset())
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.get_fieldset() is not None and self.action in ('list', 'retrieve'):
+            queryset = trim_queryset(queryset, self.get_serializer(), self.sparse_always)
+        return queryset
+
+    def wants(self, name):
+        """False se il campo `name` è stato escluso dalla richiesta (per saltare annotazioni e subquery)"""
+        return self.get_fieldset() is None or name in self.get_serializer().fields
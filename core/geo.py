@@ -0,0 +1,131 @@
+# core/geo.py - Geohash per le query geografiche sui post
+
+import math
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9  # ~5m, sufficiente per i post geotaggati
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+# Numero massimo di celle usate per coprire un bounding box
+MAX_COVER_CELLS = 32
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Codifica latitudine/longitudine in un geohash della precisione richiesta"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits = bits << 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits = bits << 1
+                lat_range[1] = mid
+
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """Restituisce (altezza, larghezza) in gradi di una cella geohash"""
+    total_bits = precision * 5
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+
+def cover_bbox(south, west, north, east, max_cells=MAX_COVER_CELLS):
+    """
+    Restituisce i prefissi geohash che coprono il bounding box.
+    Sceglie la precisione più alta che resta entro max_cells celle,
+    così la query diventa pochi range scan sull'indice del geohash.
+    """
+    best = None
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width = cell_size(precision)
+        rows = math.floor((north + 90) / height) - math.floor((south + 90) / height) + 1
+        cols = math.floor((east + 180) / width) - math.floor((west + 180) / width) + 1
+        if rows * cols > max_cells:
+            break
+        best = precision
+
+    if best is None:
+        best = 1
+
+    height, width = cell_size(best)
+    cells = set()
+    row_start = math.floor((south + 90) / height)
+    row_end = math.floor((north + 90) / height)
+    col_start = math.floor((west + 180) / width)
+    col_end = math.floor((east + 180) / width)
+
+    for row in range(row_start, row_end + 1):
+        lat = min(-90 + (row + 0.5) * height, 90.0)
+        for col in range(col_start, col_end + 1):
+            lon = min(-180 + (col + 0.5) * width, 180.0)
+            cells.add(encode_geohash(lat, lon, best))
+
+    return sorted(cells)
+
+
+def radius_bbox(latitude, longitude, radius_km):
+    """Bounding box (south, west, north, east) che contiene il cerchio richiesto"""
+    lat_delta = radius_km / KM_PER_DEGREE_LAT
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    lon_delta = min(radius_km / (KM_PER_DEGREE_LAT * cos_lat), 180.0)
+    return (
+        max(latitude - lat_delta, -90.0),
+        max(longitude - lon_delta, -180.0),
+        min(latitude + lat_delta, 90.0),
+        min(longitude + lon_delta, 180.0),
+    )
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distanza in km tra due punti sulla superficie terrestre"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def precision_for_zoom(zoom):
+    """Precisione geohash delle celle di clustering per un livello di zoom della mappa"""
+    if zoom <= 2:
+        return 1
+    if zoom <= 5:
+        return 2
+    if zoom <= 7:
+        return 3
+    if zoom <= 10:
+        return 4
+    if zoom <= 13:
+        return 5
+    if zoom <= 16:
+        return 6
+    return 7
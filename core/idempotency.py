@@ -0,0 +1,156 @@
+# core/idempotency.py - Header Idempotency-Key per le creazioni ripetute dai client mobili
+#
+# Se la richiesta porta "Idempotency-Key: <chiave>", la prima risposta (non 5xx) viene salvata
+# in IdempotencyKey insieme all'impronta dei dati inviati. Un nuovo tentativo con la stessa
+# chiave riceve la risposta originale senza rieseguire la scrittura. Le chiavi scadono dopo
+# HAPPYGREEN_IDEMPOTENCY_TTL_HOURS e vengono rimosse da `manage.py purge_idempotency_keys`.
+#
+# Mentre la richiesta originale è in corso la chiave è bloccata per
+# HAPPYGREEN_IDEMPOTENCY_LEASE_SECONDS: se il worker muore prima di salvare la risposta,
+# scaduto il blocco un nuovo tentativo riesegue la richiesta invece di ricevere 409.
+# Per le creazioni dei ViewSet si salva solo l'id dell'oggetto creato: la risposta ripetuta
+# viene riserializzata dal database (un post con l'immagine base64 pesa qualche MB).
+
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+def ttl():
+    return timedelta(hours=getattr(settings, 'HAPPYGREEN_IDEMPOTENCY_TTL_HOURS', 24))
+
+
+def lease():
+    return timedelta(seconds=getattr(settings, 'HAPPYGREEN_IDEMPOTENCY_LEASE_SECONDS', 60))
+
+
+def request_fingerprint(request):
+    """Impronta dei dati della richiesta: la stessa chiave con dati diversi è un errore del client"""
+    payload = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{payload}'.encode('utf-8')).hexdigest()
+
+
+def _replay(entry, viewset):
+    """Risposta salvata; per gli oggetti creati da un ViewSet riserializzati dal database"""
+    body = entry.response_body
+    if entry.object_id is not None:
+        instance = viewset.get_queryset().filter(pk=entry.object_id).first() if viewset is not None else None
+        # Oggetto cancellato nel frattempo: basta l'id
+        body = viewset.get_serializer(instance).data if instance is not None else {'id': entry.object_id}
+    response = Response(body, status=entry.status_code)
+    response[REPLAY_HEADER] = 'true'
+    return response
+
+
+def _claim(user, scope, key, fingerprint, viewset=None):
+    """
+    Registra la chiave come in corso. Restituisce (entry, None) se la richiesta va eseguita,
+    oppure (None, risposta) se esiste già una richiesta con la stessa chiave
+    """
+    from .models import IdempotencyKey
+
+    now = timezone.now()
+    for _ in range(3):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user=user, scope=scope, key=key, request_hash=fingerprint,
+                    expires_at=now + ttl(), locked_until=now + lease(),
+                ), None
+        except IntegrityError:
+            existing = IdempotencyKey.objects.filter(user=user, scope=scope, key=key).first()
+            if existing is None:
+                continue
+            if existing.expires_at <= now:
+                # Chiave scaduta non ancora rimossa: si riparte da zero
+                existing.delete()
+                continue
+            if existing.request_hash != fingerprint:
+                return None, Response(
+                    {'error': f'{HEADER} già usata con dati diversi'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            if existing.status_code is not None:
+                return None, _replay(existing, viewset)
+            if existing.locked_until is not None and existing.locked_until > now:
+                return None, Response(
+                    {'error': 'Richiesta con la stessa chiave ancora in corso'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            # Blocco scaduto senza risposta (worker terminato): la richiesta viene rieseguita.
+            # L'UPDATE condizionato fa vincere un solo tentativo
+            locked_until = now + lease()
+            if IdempotencyKey.objects.filter(
+                pk=existing.pk, status_code__isnull=True, locked_until=existing.locked_until
+            ).update(locked_until=locked_until):
+                existing.locked_until = locked_until
+                return existing, None
+
+    return None, Response(
+        {'error': 'Impossibile registrare la chiave di idempotenza'},
+        status=status.HTTP_409_CONFLICT
+    )
+
+
+def idempotent(scope):
+    """
+    Decoratore per view DRF (metodi di ViewSet o funzioni @api_view) che rende la richiesta
+    idempotente per utente, `scope` e valore dell'header Idempotency-Key. Senza header non cambia nulla
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            viewset = None if isinstance(args[0], Request) else args[0]
+            request = args[0] if viewset is None else args[1]
+            key = request.headers.get(HEADER)
+            if not key or not request.user.is_authenticated:
+                return view(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {'error': f'{HEADER} troppo lunga (massimo {MAX_KEY_LENGTH} caratteri)'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            entry, replay = _claim(request.user, scope, key, request_fingerprint(request), viewset)
+            if replay is not None:
+                return replay
+            # Solo finché il blocco è nostro: scaduto, la chiave può essere di un altro tentativo
+            owned = type(entry).objects.filter(pk=entry.pk, locked_until=entry.locked_until)
+
+            try:
+                response = view(*args, **kwargs)
+            except Exception:
+                owned.delete()
+                raise
+
+            if response.status_code >= 500:
+                # Errore del server: il client può riprovare con la stessa chiave
+                owned.delete()
+                return response
+
+            object_id = None
+            if viewset is not None and response.status_code == status.HTTP_201_CREATED and \
+                    isinstance(response.data, dict) and 'id' in response.data:
+                object_id = response.data['id']
+            owned.update(
+                status_code=response.status_code,
+                object_id=object_id,
+                response_body=response.data if object_id is None else None,
+                locked_until=None,
+            )
+            return response
+        return wrapper
+    return decorator
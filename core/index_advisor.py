@@ -0,0 +1,193 @@
+# core/index_advisor.py - Analisi dei piani di esecuzione delle query del workload
+#
+# Usato da `manage.py index_advisor`: per ogni forma di query (impronta) eseguita dal
+# workload di core/benchmark.py legge il piano EXPLAIN, segnala scansioni complete e
+# ordinamenti senza indice, propone l'indice composto mancante e confronta gli indici
+# esistenti delle tabelle dell'app con quelli effettivamente usati dai piani.
+
+import re
+
+from django.apps import apps
+from django.db import connection
+
+from .slowlog import explain_rows
+
+_QUOTE = '["`]'
+_SQLITE_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(.*)$')
+_SQLITE_INDEX_RE = re.compile(r'USING (?:COVERING )?INDEX (\w+)')
+_PG_SEQ_SCAN_RE = re.compile(r'Seq Scan on (\w+)')
+_PG_INDEX_RE = re.compile(r'Index (?:Only )?Scan (?:Backward )?using (\w+)|Bitmap Index Scan on (\w+)')
+
+
+def app_tables():
+    """Tabelle dei modelli dell'app core"""
+    return {model._meta.db_table for model in apps.get_app_config('core').get_models()}
+
+
+def table_indexes(tables):
+    """Indici non unici e non primari per tabella: {tabella: {nome: [colonne]}}"""
+    indexes = {}
+    with connection.cursor() as cursor:
+        for table in tables:
+            constraints = connection.introspection.get_constraints(cursor, table)
+            indexes[table] = {
+                name: info['columns'] for name, info in constraints.items()
+                if info['index'] and not info['primary_key'] and not info['unique']
+            }
+    return indexes
+
+
+def all_index_columns(tables):
+    """Colonne di tutti gli indici (compresi unici e primari) per tabella"""
+    columns = {}
+    with connection.cursor() as cursor:
+        for table in tables:
+            constraints = connection.introspection.get_constraints(cursor, table)
+            columns[table] = [
+                info['columns'] for info in constraints.values()
+                if (info['index'] or info['unique'] or info['primary_key']) and info['columns']
+            ]
+    return columns
+
+
+def unique_columns(tables):
+    """Colonne che da sole identificano una riga (chiave primaria, unique su una colonna) per tabella"""
+    columns = {}
+    with connection.cursor() as cursor:
+        for table in tables:
+            constraints = connection.introspection.get_constraints(cursor, table)
+            columns[table] = {
+                info['columns'][0] for info in constraints.values()
+                if (info['primary_key'] or info['unique']) and len(info['columns'] or []) == 1
+            }
+    return columns
+
+
+def analyze_plan(columns, rows):
+    """
+    Dal piano EXPLAIN ricava gli indici usati, le tabelle lette per intero e le tabelle
+    ordinate senza indice. Gestisce SQLite, MySQL/MariaDB e PostgreSQL.
+    """
+    used, full_scans, sorts = set(), set(), set()
+
+    if connection.vendor == 'sqlite':
+        for row in rows:
+            detail = row[-1]
+            used.update(_SQLITE_INDEX_RE.findall(detail))
+            scan = _SQLITE_SCAN_RE.match(detail)
+            if scan and 'INDEX' not in scan.group(2):
+                full_scans.add(scan.group(1))
+            if 'TEMP B-TREE FOR ORDER BY' in detail:
+                sorts.add(None)
+    elif connection.vendor == 'mysql':
+        names = [column.lower() for column in columns]
+        for row in rows:
+            record = dict(zip(names, row))
+            table, key, extra = record.get('table'), record.get('key'), record.get('extra') or ''
+            if key:
+                used.add(key)
+            if record.get('type') == 'ALL' and table:
+                full_scans.add(table)
+            if 'Using filesort' in extra:
+                sorts.add(table)
+    else:
+        for row in rows:
+            line = str(row[0])
+            used.update(name for match in _PG_INDEX_RE.findall(line) for name in match if name)
+            full_scans.update(_PG_SEQ_SCAN_RE.findall(line))
+            if line.lstrip().startswith('->  Sort') or line.startswith('Sort'):
+                sorts.add(None)
+
+    return used, full_scans, sorts
+
+
+def _clauses(sql):
+    """Parti WHERE e ORDER BY della query più esterna (euristica sul testo SQL)"""
+    upper = sql.upper()
+    where_at = upper.find(' WHERE ')
+    order_at = upper.rfind(' ORDER BY ')
+    where = sql[where_at:order_at if order_at > where_at else None] if where_at >= 0 else ''
+    order = sql[order_at:] if order_at >= 0 else ''
+    return where, order
+
+
+def order_table(sql):
+    """Tabella della prima colonna di ORDER BY, per i piani che non dicono cosa ordinano"""
+    _, order = _clauses(sql)
+    match = re.search(rf'{_QUOTE}(\w+){_QUOTE}\.{_QUOTE}\w+{_QUOTE}', order)
+    return match.group(1) if match else None
+
+
+def suggest_index(sql, table):
+    """Colonne di un indice per `table`: prima i filtri di uguaglianza/IN, poi l'ordinamento"""
+    where, order = _clauses(sql)
+    column_re = rf'{_QUOTE}{re.escape(table)}{_QUOTE}\.{_QUOTE}(\w+){_QUOTE}'
+    equality = re.findall(column_re + r'\s*(?:=|IN\s*\()', where, re.IGNORECASE)
+    ordering = re.findall(column_re, order)
+
+    suggestion = []
+    for column in equality + ordering:
+        if column not in suggestion:
+            suggestion.append(column)
+    return suggestion
+
+
+def is_covered(suggestion, existing, unique=()):
+    """
+    True se un indice esistente inizia con le colonne suggerite, o se la prima è già unica
+    (es. WHERE id IN (...)): trovata la riga, le altre colonne non restringono niente
+    """
+    if suggestion and suggestion[0] in unique:
+        return True
+    return any(list(columns[:len(suggestion)]) == suggestion for columns in existing)
+
+
+def advise(queries):
+    """
+    `queries`: {impronta: {'sql', 'params', 'count'}}. Restituisce le forme di query con i
+    problemi dei piani, gli indici suggeriti e gli indici delle tabelle dell'app mai usati.
+    """
+    tables = app_tables()
+    index_columns = all_index_columns(tables)
+    unique = unique_columns(tables)
+    shapes, suggestions, used_everywhere = [], {}, set()
+
+    for fingerprint, query in sorted(queries.items(), key=lambda item: -item[1]['count']):
+        plan = explain_rows(query['sql'], query['params'])
+        if plan is None:
+            continue
+        used, full_scans, sorts = analyze_plan(*plan)
+        sorts = {table or order_table(query['sql']) for table in sorts}
+        used_everywhere.update(used)
+
+        problems = [f'scansione completa di {table}' for table in sorted(full_scans)]
+        problems += ['ordinamento senza indice' + (f' su {table}' if table else '') for table in sorted(sorts, key=str)]
+
+        for table in full_scans | {table for table in sorts if table}:
+            if table not in tables:
+                continue
+            columns = suggest_index(query['sql'], table)
+            if columns and not is_covered(columns, index_columns.get(table, []), unique.get(table, ())):
+                key = (table, tuple(columns))
+                entry = suggestions.setdefault(key, {'table': table, 'columns': columns, 'queries': 0})
+                entry['queries'] += query['count']
+
+        shapes.append({
+            'fingerprint': fingerprint,
+            'count': query['count'],
+            'indexes': sorted(used),
+            'problems': problems,
+        })
+
+    unused = [
+        {'table': table, 'index': name, 'columns': columns}
+        for table, table_idx in sorted(table_indexes(tables).items())
+        for name, columns in sorted(table_idx.items())
+        if name not in used_everywhere
+    ]
+
+    return {
+        'shapes': shapes,
+        'missing': sorted(suggestions.values(), key=lambda entry: -entry['queries']),
+        'unused': unused,
+    }
@@ -0,0 +1,37 @@
+# core/management/commands/archive_posts.py
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core.archive import archive_posts, get_config
+
+
+class Command(BaseCommand):
+    help = (
+        "Sposta nell'archivio i post creati prima di una data, con commenti, like, reaction e "
+        "oggetti rilevati (es. a fine anno scolastico). Restano leggibili per id; si può "
+        "interrompere e rilanciare"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Archivia i post più vecchi di tanti giorni (default HAPPYGREEN_ARCHIVE["AFTER_DAYS"])',
+        )
+        parser.add_argument('--before', help='Archivia i post creati prima di questa data (AAAA-MM-GG)')
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        if options['before']:
+            day = parse_date(options['before'])
+            if day is None:
+                raise CommandError('Data non valida, usare AAAA-MM-GG')
+            before = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+        else:
+            days = options['days'] if options['days'] is not None else get_config()['AFTER_DAYS']
+            before = timezone.now() - datetime.timedelta(days=days)
+
+        total = archive_posts(before, batch_size=options['batch_size'], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f'{total} post archiviati (creati prima di {before:%Y-%m-%d %H:%M})'))
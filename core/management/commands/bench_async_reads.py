@@ -0,0 +1,156 @@
+# core/management/commands/bench_async_reads.py
+import asyncio
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.backends.signals import connection_created
+from rest_framework.authtoken.models import Token
+
+from core.benchmark import percentile
+from core.models import User
+
+# (nome, rotta sincrona DRF, rotta async)
+ENDPOINTS = [
+    ('current_user', '/users/me/', '/async/users/me/'),
+    ('leaderboard', '/leaderboard/', '/async/leaderboard/'),
+    ('post_feed', '/posts/', '/async/posts/'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Confronta quante richieste concorrenti un singolo processo ASGI sostiene "
+        "sulle view sincrone e sulle varianti async, con latenza del DB simulata"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help='Utente con cui autenticare le richieste')
+        parser.add_argument('--requests', type=int, default=200, help='Richieste per endpoint e variante')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--latency-ms', type=float, default=20.0, help='Latenza aggiunta a ogni query')
+        parser.add_argument('--json', action='store_true', help='Stampa i risultati in JSON')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"Utente {options['username']} non trovato")
+
+        token, _ = Token.objects.get_or_create(user=user)
+        latency = options['latency_ms'] / 1000
+
+        def slow_query(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def add_latency(sender, connection, **kwargs):
+            # Ogni thread ha la sua connessione: il wrapper va aggiunto a ognuna
+            if not getattr(connection, '_bench_latency', False):
+                connection.execute_wrappers.append(slow_query)
+                connection._bench_latency = True
+
+        connection_created.connect(add_latency)
+
+        from happygreen_backend.asgi import application
+
+        results = []
+        try:
+            for name, sync_path, async_path in ENDPOINTS:
+                for variant, path in (('sync', sync_path), ('async', async_path)):
+                    result = asyncio.run(self._run(
+                        application, path, token.key, options['requests'], options['concurrency']
+                    ))
+                    result.update({'endpoint': name, 'variant': variant, 'path': path})
+                    results.append(result)
+        finally:
+            connection_created.disconnect(add_latency)
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'latency_ms': options['latency_ms'],
+                'concurrency': options['concurrency'],
+                'requests': options['requests'],
+                'results': results,
+            }, indent=2))
+            return
+
+        self.stdout.write(
+            f"latenza DB simulata {options['latency_ms']}ms, concorrenza {options['concurrency']}, "
+            f"{options['requests']} richieste per variante"
+        )
+        self.stdout.write(f"{'endpoint':<14}{'variante':<9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'errori':>8}")
+        for result in results:
+            self.stdout.write(
+                f"{result['endpoint']:<14}{result['variant']:<9}{result['throughput']:>9.1f}"
+                f"{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['errors']:>8}"
+            )
+
+    async def _run(self, application, path, token_key, total, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        errors = 0
+
+        async def one_request():
+            nonlocal errors
+            async with semaphore:
+                status = await self._call(application, path, token_key)
+                if status != 200:
+                    errors += 1
+
+        async def timed_request():
+            start = time.perf_counter()
+            await one_request()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(timed_request() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+        return {
+            'throughput': total / elapsed if elapsed else 0.0,
+            'elapsed_s': elapsed,
+            'p50_ms': statistics.median(latencies) if latencies else 0.0,
+            'p95_ms': percentile(latencies, 95) or 0.0,
+            'errors': errors,
+        }
+
+    @staticmethod
+    async def _call(application, path, token_key):
+        """Esegue una richiesta GET direttamente sull'applicazione ASGI, senza rete"""
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': b'',
+            'root_path': '',
+            'headers': [
+                (b'host', b'localhost'),
+                (b'authorization', f'Token {token_key}'.encode()),
+            ],
+            'client': ('127.0.0.1', 0),
+            'server': ('localhost', 80),
+        }
+        request_sent = False
+        status = None
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # Il client resta connesso finché la risposta non è completa
+            await asyncio.Event().wait()
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        await application(scope, receive, send)
+        return status
@@ -0,0 +1,88 @@
+# core/management/commands/bench_happygreen.py
+import json
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from core.benchmark import InProcessTransport, HttpTransport, WORKLOAD, run_benchmark
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Esegue richieste concorrenti sulle rotte reali (posts/, groups/my_groups/, leaderboard/, "
+        "user/update-points/, auth/login/) con gli utenti generati da seed_happygreen e "
+        "riporta latenze p50/p95/p99, throughput e query per richiesta in JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--users', type=int, default=50, help='Quanti utenti generati usare')
+        parser.add_argument('--prefix', default='seed', help='Prefisso degli utenti generati')
+        parser.add_argument('--password', default='happygreen')
+        parser.add_argument('--base-url', help='Server da interrogare via HTTP invece che in-process')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='File in cui scrivere il JSON (default: stdout)')
+
+    def handle(self, *args, **options):
+        usernames = list(
+            User.objects.filter(username__startswith=f"{options['prefix']}_", is_active=True)
+            .order_by('id').values_list('username', flat=True)[:options['users']]
+        )
+        if not usernames:
+            raise CommandError('Nessun utente generato trovato: eseguire prima seed_happygreen')
+
+        users = [{'username': username, 'password': options['password']} for username in usernames]
+
+        if options['base_url']:
+            transport = HttpTransport(options['base_url'])
+        else:
+            transport = InProcessTransport()
+
+        try:
+            results = run_benchmark(
+                transport, users,
+                requests=options['requests'],
+                concurrency=options['concurrency'],
+                random_seed=options['seed'],
+            )
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        report = {
+            'meta': {
+                'timestamp': timezone.now().isoformat(),
+                'commit': self._git_commit(),
+                'python': sys.version.split()[0],
+                'database': connection.vendor,
+                'target': options['base_url'] or 'in-process',
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'users': len(users),
+                'workload': {route.name: route.weight for route in WORKLOAD},
+            },
+            **results,
+        }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Risultati scritti in {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    @staticmethod
+    def _git_commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,124 @@
+# core/management/commands/bench_renderers.py
+import base64
+import io
+import json
+import os
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import resolve
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core import renderers
+from core.models import User
+
+# (nome, rotta): le risposte vengono prodotte dalle view reali e poi serializzate più volte
+ENDPOINTS = [
+    ('post_feed', '/posts/'),
+    ('leaderboard', '/leaderboard/'),
+    ('my_groups', '/groups/my_groups/'),
+]
+
+
+def _timed(function, iterations):
+    """Mediana in ms di `iterations` chiamate"""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+class Command(BaseCommand):
+    help = (
+        "Confronta JSONRenderer/JSONParser di DRF con quelli di core/renderers.py (e MessagePack se "
+        "installato) sulle risposte reali del feed e della classifica e su un avatar base64: "
+        "tempi e dimensioni, e verifica che il JSON prodotto sia identico byte per byte"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help='Utente con cui produrre le risposte')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--avatar-kb', type=int, default=1024, help='Dimensione dell\'avatar di prova')
+        parser.add_argument('--json', action='store_true', help='Stampa i risultati in JSON')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"Utente {options['username']} non trovato")
+        if renderers.orjson is None:
+            self.stderr.write('orjson non installato: FastJSONRenderer usa la libreria standard')
+
+        iterations = options['iterations']
+        factory = APIRequestFactory()
+        results, mismatches = [], []
+
+        for name, path in ENDPOINTS:
+            request = factory.get(path)
+            force_authenticate(request, user=user)
+            response = resolve(path).func(request)
+            data = response.data
+            context = getattr(response, 'renderer_context', None) or {}
+
+            accepted = 'application/json'
+            expected = JSONRenderer().render(data, accepted, context)
+            rendered = renderers.FastJSONRenderer().render(data, accepted, context)
+            if rendered != expected:
+                mismatches.append(name)
+            result = {
+                'name': name,
+                'kind': 'render',
+                'bytes': len(expected),
+                'drf_ms': _timed(lambda: JSONRenderer().render(data, accepted, context), iterations),
+                'fast_ms': _timed(lambda: renderers.FastJSONRenderer().render(data, accepted, context), iterations),
+                'identical': rendered == expected,
+            }
+            if renderers.msgpack is not None:
+                packed = renderers.MessagePackRenderer().render(data)
+                result['msgpack_bytes'] = len(packed)
+                result['msgpack_ms'] = _timed(lambda: renderers.MessagePackRenderer().render(data), iterations)
+            results.append(result)
+
+        # Corpo di update_user_avatar / creazione post con un'immagine base64
+        image = os.urandom(options['avatar_kb'] * 1024)
+        body = json.dumps({'avatar': 'data:image/png;base64,' + base64.b64encode(image).decode('ascii')}).encode()
+        if renderers.FastJSONParser().parse(io.BytesIO(body)) != JSONParser().parse(io.BytesIO(body)):
+            mismatches.append('avatar_body')
+        result = {
+            'name': 'avatar_body',
+            'kind': 'parse',
+            'bytes': len(body),
+            'drf_ms': _timed(lambda: JSONParser().parse(io.BytesIO(body)), iterations),
+            'fast_ms': _timed(lambda: renderers.FastJSONParser().parse(io.BytesIO(body)), iterations),
+            'identical': 'avatar_body' not in mismatches,
+        }
+        if renderers.msgpack is not None:
+            packed = renderers.msgpack.packb({'avatar': b'\x89PNG\r\n\x1a\n' + image}, use_bin_type=True)
+            result['msgpack_bytes'] = len(packed)
+            result['msgpack_ms'] = _timed(lambda: renderers.MessagePackParser().parse(io.BytesIO(packed)), iterations)
+        results.append(result)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'iterations': iterations, 'results': results}, indent=2))
+        else:
+            self.stdout.write(
+                f"{'payload':<13}{'tipo':<8}{'byte':>10}{'drf ms':>9}{'fast ms':>9}{'x':>6}"
+                f"{'msgpack byte':>14}{'msgpack ms':>12}"
+            )
+            for result in results:
+                speedup = result['drf_ms'] / result['fast_ms'] if result['fast_ms'] else 0.0
+                msgpack_bytes = result.get('msgpack_bytes', '-')
+                msgpack_ms = f"{result['msgpack_ms']:.2f}" if 'msgpack_ms' in result else '-'
+                self.stdout.write(
+                    f"{result['name']:<13}{result['kind']:<8}{result['bytes']:>10}{result['drf_ms']:>9.2f}"
+                    f"{result['fast_ms']:>9.2f}{speedup:>6.1f}{msgpack_bytes:>14}{msgpack_ms:>12}"
+                )
+
+        if mismatches:
+            raise CommandError(f"Output diverso da DRF per: {', '.join(mismatches)}")
+        self.stdout.write(self.style.SUCCESS('JSON identico a quello di DRF su tutti i payload'))
@@ -0,0 +1,178 @@
+# core/management/commands/check_query_budgets.py
+import json
+import sys
+from collections import Counter
+from urllib.parse import urlencode
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.query_budgets import ROUTE_BUDGETS, build_context, route_kwargs
+from core.querylog import QueryRecorder, normalize_sql
+from core.seeding import seed
+
+
+def _iter_patterns(patterns, prefix=''):
+    for entry in patterns:
+        if isinstance(entry, URLResolver):
+            yield from _iter_patterns(entry.url_patterns, prefix + str(entry.pattern))
+        elif isinstance(entry, URLPattern):
+            yield prefix + str(entry.pattern), entry
+
+
+def _allowed_methods(callback):
+    """Metodi HTTP serviti da una view (ViewSet, APIView, @api_view o view Django)"""
+    actions = getattr(callback, 'actions', None)
+    if actions:
+        return sorted(method.upper() for method in actions)
+    view_class = getattr(callback, 'cls', None) or getattr(callback, 'view_class', None)
+    if view_class is not None:
+        return sorted(m.upper() for m in view_class.http_method_names if m not in ('options', 'head')
+                      and hasattr(view_class, m))
+    return ['GET']
+
+
+def collect_routes():
+    """Tutte le rotte con nome di core/urls.py (comprese quelle di core/auth_urls.py)"""
+    routes = {}
+    for pattern, entry in _iter_patterns(get_resolver('core.urls').url_patterns):
+        if not entry.name or 'format' in entry.pattern.regex.groupindex:
+            continue
+        routes.setdefault(entry.name, (pattern, list(entry.pattern.regex.groupindex), _allowed_methods(entry.callback)))
+    return routes
+
+
+class Command(BaseCommand):
+    help = (
+        "Esegue ogni rotta dell'API su un database di test con due dimensioni di dati e fallisce "
+        "se il numero di query cresce con i dati o supera il budget dichiarato in core/query_budgets.py"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--small', type=int, default=20, help='Utenti generati per il dataset piccolo')
+        parser.add_argument('--large', type=int, default=80, help='Utenti generati per il dataset grande')
+        parser.add_argument('--route', action='append', help='Limita il controllo a queste rotte (nome)')
+
+    def handle(self, *args, **options):
+        routes = collect_routes()
+        if options['route']:
+            unknown = set(options['route']) - set(routes)
+            if unknown:
+                raise CommandError(f"Rotte sconosciute: {', '.join(sorted(unknown))}")
+            routes = {name: routes[name] for name in options['route']}
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            counts = {}
+            for size in (options['small'], options['large']):
+                counts[size] = self._measure(routes, size)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        failures = self._report(routes, counts, options['small'], options['large'])
+        if failures:
+            self.stderr.write(self.style.ERROR(f'{failures} controlli falliti'))
+            sys.exit(1)
+        self.stdout.write(self.style.SUCCESS('Tutte le rotte rispettano il budget di query'))
+
+    def _measure(self, routes, size):
+        """Ricrea i dati con `size` utenti ed esegue ogni rotta dichiarata registrando le query"""
+        call_command('flush', interactive=False, verbosity=0)
+        seed(users=size, image_kb=1, random_seed=size)
+        ctx = build_context(size)
+        client = APIClient(raise_request_exception=False)
+        client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.get_or_create(user=ctx['user'])[0].key}")
+
+        results = {}
+        for name, (_, kwarg_names, methods) in sorted(routes.items()):
+            for method in methods:
+                spec = ROUTE_BUDGETS.get(name, {}).get(method)
+                if spec is None:
+                    continue
+                path = reverse(name, kwargs=route_kwargs(name, kwarg_names, ctx))
+                params = spec['params'](ctx) if 'params' in spec else None
+                data = spec['data'](ctx) if 'data' in spec else None
+
+                recorder = QueryRecorder()
+                with connection.execute_wrapper(recorder):
+                    if method == 'GET':
+                        response = client.get(path, params)
+                    else:
+                        response = client.generic(method, path + self._query_string(params),
+                                                  self._encode(data), 'application/json')
+
+                results[(name, method)] = {
+                    'path': path,
+                    'status': response.status_code,
+                    'queries': recorder.queries,
+                }
+        return results
+
+    @staticmethod
+    def _query_string(params):
+        return '?' + urlencode(params) if params else ''
+
+    @staticmethod
+    def _encode(data):
+        return json.dumps(data if data is not None else {})
+
+    def _report(self, routes, counts, small, large):
+        failures = 0
+
+        for name, (pattern, _, methods) in sorted(routes.items()):
+            for method in methods:
+                spec = ROUTE_BUDGETS.get(name, {}).get(method)
+                if spec is None:
+                    if method == 'GET':
+                        failures += 1
+                        self.stdout.write(self.style.ERROR(
+                            f'{method:6} {name:32} nessun budget dichiarato in core/query_budgets.py'
+                        ))
+                    continue
+
+                small_result = counts[small][(name, method)]
+                large_result = counts[large][(name, method)]
+                small_count = len(small_result['queries'])
+                large_count = len(large_result['queries'])
+                budget = spec['budget']
+
+                problems = []
+                if large_count > small_count:
+                    problems.append(f'cresce con i dati ({small_count} -> {large_count})')
+                if max(small_count, large_count) > budget:
+                    problems.append(f'oltre il budget di {budget}')
+                expected = spec.get('status')
+                if expected and large_result['status'] != expected:
+                    problems.append(f"status {large_result['status']} invece di {expected}")
+
+                line = (f'{method:6} {name:32} {small_count:>4} / {large_count:>4} query '
+                        f'(budget {budget}, status {large_result["status"]})')
+                if not problems:
+                    self.stdout.write(line)
+                    continue
+
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"{line}: {'; '.join(problems)}"))
+                self._print_queries(large_result['queries'])
+
+        return failures
+
+    def _print_queries(self, queries):
+        """Raggruppa le query per impronta e mostra da dove vengono, le più ripetute prima"""
+        by_fingerprint = Counter()
+        origins = {}
+        for query in queries:
+            fingerprint = normalize_sql(query['sql'])
+            by_fingerprint[fingerprint] += 1
+            origins.setdefault(fingerprint, query['origin'])
+
+        for fingerprint, count in by_fingerprint.most_common():
+            self.stdout.write(f'        {count:>4}x {fingerprint[:160]}')
+            self.stdout.write(f'              da {origins[fingerprint] or "?"}')
@@ -0,0 +1,29 @@
+# core/management/commands/decay_trending_scores.py
+from django.core.management.base import BaseCommand
+
+from core.trending import decay, rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Fa decadere i punteggi di popolarità dei post per il tempo trascorso dall'esecuzione "
+        "precedente. Da eseguire periodicamente (es. ogni ora con cron)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=float, default=None,
+            help='Ore di decadimento alla prima esecuzione; poi si usa il tempo dall\'esecuzione precedente',
+        )
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Ricalcola tutti i punteggi da like, reaction e commenti recenti invece di farli decadere',
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            count = rebuild()
+            self.stdout.write(self.style.SUCCESS(f'Ricalcolati i punteggi di {count} post'))
+            return
+        updated, zeroed = decay(options['hours'])
+        self.stdout.write(self.style.SUCCESS(f'{updated} punteggi ridotti, {zeroed} azzerati'))
@@ -0,0 +1,90 @@
+# core/management/commands/index_advisor.py
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+
+from core.benchmark import InProcessTransport, run_benchmark
+from core.index_advisor import advise
+from core.models import User
+from core.querylog import QueryRecorder, normalize_sql
+
+
+class Command(BaseCommand):
+    help = (
+        "Riesegue il workload di bench_happygreen in-process, raccoglie le forme di query eseguite "
+        "e ne legge il piano EXPLAIN per segnalare indici mancanti e indici mai usati"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument('--users', type=int, default=20, help='Quanti utenti generati usare')
+        parser.add_argument('--prefix', default='seed', help='Prefisso degli utenti generati')
+        parser.add_argument('--password', default='happygreen')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', action='store_true', help='Stampa il rapporto in JSON')
+
+    def handle(self, *args, **options):
+        usernames = list(
+            User.objects.filter(username__startswith=f"{options['prefix']}_", is_active=True)
+            .order_by('id').values_list('username', flat=True)[:options['users']]
+        )
+        if not usernames:
+            raise CommandError('Nessun utente generato trovato: eseguire prima seed_happygreen')
+        users = [{'username': username, 'password': options['password']} for username in usernames]
+
+        recorder = QueryRecorder(with_origin=False)
+
+        def add_recorder(sender, connection, **kwargs):
+            # I thread del benchmark aprono ognuno la propria connessione. In testa alla lista:
+            # i blocchi `with connection.execute_wrapper()` dei middleware tolgono l'ultimo
+            if recorder not in connection.execute_wrappers:
+                connection.execute_wrappers.insert(0, recorder)
+
+        connection_created.connect(add_recorder)
+        add_recorder(None, connection)
+        try:
+            run_benchmark(InProcessTransport(), users, requests=options['requests'], concurrency=1,
+                          random_seed=options['seed'])
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        finally:
+            connection_created.disconnect(add_recorder)
+            connection.execute_wrappers.remove(recorder)
+
+        queries = {}
+        for query in recorder.queries:
+            fingerprint = normalize_sql(query['sql'])
+            entry = queries.setdefault(fingerprint, {'sql': query['sql'], 'params': query['params'], 'count': 0})
+            entry['count'] += 1
+
+        report = advise(queries)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Forme di query ({len(report["shapes"])}) - {connection.vendor}'))
+        for shape in report['shapes']:
+            style = self.style.WARNING if shape['problems'] else (lambda text: text)
+            indexes = ', '.join(shape['indexes']) or '-'
+            self.stdout.write(style(f"{shape['count']:>6}x  {shape['fingerprint'][:140]}"))
+            self.stdout.write(f'         indici: {indexes}')
+            for problem in shape['problems']:
+                self.stdout.write(self.style.WARNING(f'         {problem}'))
+
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING('Indici mancanti'))
+        for entry in report['missing']:
+            self.stdout.write(f"  {entry['table']}({', '.join(entry['columns'])})  usato da {entry['queries']} query")
+        if not report['missing']:
+            self.stdout.write('  nessuno')
+
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING('Indici non usati dal workload'))
+        for entry in report['unused']:
+            self.stdout.write(f"  {entry['table']}.{entry['index']} ({', '.join(entry['columns'])})")
+        self.stdout.write(
+            "Nota: con poche righe il database può preferire una scansione completa; "
+            "eseguire su un dataset di dimensioni realistiche (seed_happygreen)."
+        )
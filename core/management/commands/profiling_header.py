@@ -0,0 +1,22 @@
+# core/management/commands/profiling_header.py
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import User
+from core.profiling import HEADER, sign_profile_header
+
+
+class Command(BaseCommand):
+    help = "Genera l'header firmato che attiva il profiler per una richiesta di un utente staff"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"Utente {options['username']} non trovato")
+        if not user.is_staff:
+            raise CommandError(f'{user.username} non è un utente staff')
+
+        self.stdout.write(f'{HEADER}: {sign_profile_header(user)}')
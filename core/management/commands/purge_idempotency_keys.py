@@ -0,0 +1,13 @@
+# core/management/commands/purge_idempotency_keys.py
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Cancella le chiavi Idempotency-Key scadute (da eseguire periodicamente, es. con cron)"
+
+    def handle(self, *args, **options):
+        deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+        self.stdout.write(f'{deleted} chiavi scadute cancellate')
@@ -0,0 +1,17 @@
+# core/management/commands/rebuild_badge_progress.py
+from django.core.management.base import BaseCommand
+
+from core.badges import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Ricalcola dai dati i contatori usati dalle regole dei badge e assegna i badge già raggiunti "
+        "(dopo il primo deploy del motore dei badge o dopo aver aggiunto un badge con soglia)"
+    )
+
+    def handle(self, *args, **options):
+        progress_count, awarded = rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ricalcolati {progress_count} contatori, {awarded} badge assegnati'
+        ))
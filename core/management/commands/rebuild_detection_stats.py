@@ -0,0 +1,12 @@
+# core/management/commands/rebuild_detection_stats.py
+from django.core.management.base import BaseCommand
+
+from core.detections import rebuild_group_stats
+
+
+class Command(BaseCommand):
+    help = "Ricalcola dagli oggetti rilevati i conteggi per gruppo usati da groups/<id>/top-detections/"
+
+    def handle(self, *args, **options):
+        rows = rebuild_group_stats()
+        self.stdout.write(self.style.SUCCESS(f'Ricalcolati {rows} conteggi per gruppo ed etichetta'))
@@ -0,0 +1,12 @@
+# core/management/commands/rebuild_notification_counters.py
+from django.core.management.base import BaseCommand
+
+from core.notifications import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Riallinea i contatori delle notifiche non lette al numero reale di notifiche non lette"
+
+    def handle(self, *args, **options):
+        count = rebuild_counters()
+        self.stdout.write(self.style.SUCCESS(f'Ricalcolati {count} contatori'))
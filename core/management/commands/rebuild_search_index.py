@@ -0,0 +1,37 @@
+# core/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+
+from core import sharding
+from core.models import Post, Comment, SearchToken
+from core.search import index_post, index_comment
+
+
+class Command(BaseCommand):
+    help = "Ricostruisce l'indice di ricerca full-text di post e commenti"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+
+        post_count = comment_count = 0
+        # Con lo sharding ogni shard indicizza i propri post
+        for alias in sharding.data_aliases():
+            SearchToken.objects.using(alias).all().delete()
+
+            posts = Post.objects.using(alias).only('id', 'group_id', 'caption')
+            for post in posts.iterator(chunk_size=chunk_size):
+                index_post(post)
+                post_count += 1
+
+            comments = Comment.objects.using(alias).select_related('post').only(
+                'id', 'post_id', 'content', 'post__group_id'
+            )
+            for comment in comments.iterator(chunk_size=chunk_size):
+                index_comment(comment, group_id=comment.post.group_id)
+                comment_count += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Indicizzati {post_count} post e {comment_count} commenti'
+        ))
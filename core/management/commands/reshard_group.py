@@ -0,0 +1,60 @@
+# core/management/commands/reshard_group.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from core import sharding
+from core.models import Group, GroupShard
+
+
+class Command(BaseCommand):
+    help = (
+        "Sposta i post, i commenti, i like e le reaction di un gruppo su un altro shard senza fermare "
+        "il servizio. Con --prepare prepara gli shard (dopo migrate --database <alias>): id e tabelle "
+        "condivise. Senza argomenti mostra quanti gruppi ha ogni shard"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('group', nargs='?', type=int, help='Id del gruppo da spostare')
+        parser.add_argument('alias', nargs='?', help='Shard di destinazione')
+        parser.add_argument('--prepare', action='store_true', help='Prepara tutti gli shard configurati')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--wait', type=float, default=None,
+            help='Secondi di attesa perché tutti i processi vedano la mappa aggiornata (default MAP_TTL_SECONDS)',
+        )
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('Sharding non configurato (HAPPYGREEN_SHARDS["ALIASES"] con almeno due alias)')
+
+        if options['prepare']:
+            for alias in sharding.shard_aliases():
+                try:
+                    copied = sharding.prepare(alias)
+                except sharding.ShardingError as error:
+                    raise CommandError(str(error))
+                self.stdout.write(f'{alias}: id preparati, {copied} righe condivise copiate')
+            self.stdout.write(self.style.SUCCESS('Shard pronti'))
+            return
+
+        if options['group'] is None:
+            counts = dict(GroupShard.objects.values_list('alias').annotate(total=Count('pk')).order_by())
+            counts['default'] = counts.get('default', 0) + Group.objects.filter(shard__isnull=True).count()
+            for alias in sharding.shard_aliases():
+                self.stdout.write(f'{alias}: {counts.get(alias, 0)} gruppi')
+            return
+
+        if options['alias'] is None:
+            raise CommandError('Indicare lo shard di destinazione')
+
+        try:
+            copied = sharding.move_group(
+                options['group'], options['alias'],
+                batch_size=options['batch_size'], wait=options['wait'], log=self.stdout.write,
+            )
+        except sharding.ShardingError as error:
+            raise CommandError(str(error))
+        total = sum(copied.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Gruppo {options['group']} spostato su {options['alias']} ({total} righe)"
+        ))
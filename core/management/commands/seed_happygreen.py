@@ -0,0 +1,50 @@
+# core/management/commands/seed_happygreen.py
+from django.core.management.base import BaseCommand
+
+from core.seeding import seed, clear_seeded_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera dati realistici (utenti, gruppi, post, commenti, like, reactions, punteggi) "
+        "per benchmark e test di carico, su SQLite o MariaDB"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--posts-per-user', type=float, default=5.0, help='Media, con coda lunga')
+        parser.add_argument('--comments-per-post', type=float, default=3.0, help='Media, con coda lunga')
+        parser.add_argument('--likes-per-post', type=float, default=6.0, help='Media, con coda lunga')
+        parser.add_argument('--image-ratio', type=float, default=0.3, help='Quota di post con immagine base64')
+        parser.add_argument('--image-kb', type=int, default=64, help='Dimensione delle immagini generate')
+        parser.add_argument('--geo-ratio', type=float, default=0.6, help='Quota di post geolocalizzati')
+        parser.add_argument('--history-days', type=int, default=365, help='Arco temporale dei post')
+        parser.add_argument('--password', default='happygreen', help='Password di tutti gli utenti generati')
+        parser.add_argument('--prefix', default='seed', help='Prefisso degli username generati')
+        parser.add_argument('--seed', type=int, default=42, help='Seed del generatore casuale')
+        parser.add_argument('--clear', action='store_true',
+                            help='Elimina prima gli utenti con lo stesso prefisso e tutti i loro dati')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted, _ = clear_seeded_data(options['prefix'])
+            self.stdout.write(f'Eliminate {deleted} righe generate in precedenza')
+
+        counts = seed(
+            users=options['users'],
+            posts_per_user=options['posts_per_user'],
+            comments_per_post=options['comments_per_post'],
+            likes_per_post=options['likes_per_post'],
+            image_ratio=options['image_ratio'],
+            image_kb=options['image_kb'],
+            geo_ratio=options['geo_ratio'],
+            history_days=options['history_days'],
+            password=options['password'],
+            prefix=options['prefix'],
+            random_seed=options['seed'],
+            log=lambda message: self.stdout.write(f'  {message}'),
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            'Dati generati: ' + ', '.join(f'{name}={count}' for name, count in counts.items())
+        ))
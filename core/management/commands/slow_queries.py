@@ -0,0 +1,38 @@
+# core/management/commands/slow_queries.py
+from django.core.management.base import BaseCommand
+
+from core.models import SlowQuery
+from core.views import SLOW_QUERY_ORDERING
+
+
+class Command(BaseCommand):
+    help = "Mostra le query lente registrate da SlowQueryMiddleware, aggregate per impronta"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--order', choices=list(SLOW_QUERY_ORDERING), default='total')
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--explain', action='store_true', help='Stampa anche il piano EXPLAIN')
+        parser.add_argument('--reset', action='store_true', help='Cancella le query registrate')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            deleted, _ = SlowQuery.objects.all().delete()
+            self.stdout.write(f'{deleted} query lente cancellate')
+            return
+
+        entries = SlowQuery.objects.order_by(SLOW_QUERY_ORDERING[options['order']])[:options['limit']]
+        for entry in entries:
+            routes = ', '.join(f'{route} ({count})' for route, count in
+                               sorted(entry.routes.items(), key=lambda item: -item[1]))
+            self.stdout.write(self.style.WARNING(
+                f"{entry.count}x  totale {entry.total_ms:.0f}ms  media {entry.total_ms / entry.count:.0f}ms  "
+                f"max {entry.max_ms:.0f}ms"
+            ))
+            self.stdout.write(f'  {entry.fingerprint}')
+            self.stdout.write(f'  rotte: {routes}')
+            if entry.origin:
+                self.stdout.write(f'  da {entry.origin}')
+            if options['explain'] and entry.explain:
+                for line in entry.explain.splitlines():
+                    self.stdout.write(f'    {line}')
+            self.stdout.write('')
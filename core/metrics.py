@@ -0,0 +1,113 @@
+# core/metrics.py - Metriche per endpoint (richieste, latenza, SQL) in formato Prometheus
+#
+# Il registro è per processo: con più worker Prometheus va configurato per
+# interrogarli singolarmente (o sommare le serie per istanza).
+
+import bisect
+import threading
+from collections import defaultdict
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+RESPONSE_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = defaultdict(int)
+            self.sql_seconds = defaultdict(float)
+            self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+            self.queries = defaultdict(lambda: Histogram(QUERY_COUNT_BUCKETS))
+            self.response_size = defaultdict(lambda: Histogram(RESPONSE_SIZE_BUCKETS))
+
+    def record(self, route, method, status, duration, query_count, sql_duration, response_size):
+        key = (route, method)
+        with self._lock:
+            self.requests[(route, method, str(status))] += 1
+            self.latency[key].observe(duration)
+            self.queries[key].observe(query_count)
+            self.sql_seconds[key] += sql_duration
+            if response_size is not None:
+                self.response_size[key].observe(response_size)
+
+    def render(self):
+        """Esporta il registro nel formato testuale di Prometheus (0.0.4)"""
+        lines = []
+        with self._lock:
+            lines.append('# HELP happygreen_http_requests_total Richieste HTTP per rotta, metodo e status.')
+            lines.append('# TYPE happygreen_http_requests_total counter')
+            for (route, method, status), value in sorted(self.requests.items()):
+                lines.append(
+                    f'happygreen_http_requests_total{_labels(route=route, method=method, status=status)} {value}'
+                )
+
+            _render_histogram(
+                lines, 'happygreen_http_request_duration_seconds',
+                'Durata delle richieste HTTP in secondi.', self.latency
+            )
+            _render_histogram(
+                lines, 'happygreen_db_queries_per_request',
+                'Numero di query SQL eseguite per richiesta.', self.queries
+            )
+
+            lines.append('# HELP happygreen_db_query_duration_seconds_total Tempo totale speso in SQL.')
+            lines.append('# TYPE happygreen_db_query_duration_seconds_total counter')
+            for (route, method), value in sorted(self.sql_seconds.items()):
+                lines.append(
+                    f'happygreen_db_query_duration_seconds_total{_labels(route=route, method=method)} {value:.6f}'
+                )
+
+            _render_histogram(
+                lines, 'happygreen_http_response_size_bytes',
+                'Dimensione del corpo delle risposte in byte.', self.response_size
+            )
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_bound(bound):
+    return repr(float(bound)) if isinstance(bound, float) else str(bound)
+
+
+def _render_histogram(lines, name, help_text, histograms):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for (route, method), histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            labels = _labels(route=route, method=method, le=_format_bound(bound))
+            lines.append(f'{name}_bucket{labels} {cumulative}')
+        labels = _labels(route=route, method=method, le='+Inf')
+        lines.append(f'{name}_bucket{labels} {histogram.count}')
+        lines.append(f'{name}_sum{_labels(route=route, method=method)} {histogram.total:.6f}')
+        lines.append(f'{name}_count{_labels(route=route, method=method)} {histogram.count}')
+
+
+registry = MetricsRegistry()
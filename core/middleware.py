@@ -0,0 +1,144 @@
+# core/middleware.py - Middleware di strumentazione delle richieste
+
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from .db_routers import aexecute_wrapper_all, execute_wrapper_all
+from .metrics import registry
+from .slowlog import SlowQueryCollector, get_config as slow_query_config, record_slow_queries
+
+logger = logging.getLogger(__name__)
+
+
+def route_name(request):
+    """Etichetta stabile della rotta risolta (il nome della view, non il path con gli id)"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route or 'unnamed'
+
+
+class QueryCounter:
+    """Execute wrapper che conta le query e il tempo speso nel database"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """
+    Registra per ogni rotta: numero di richieste, latenza, query SQL, tempo SQL
+    e dimensione della risposta. I dati sono esposti da /metrics/.
+    Sincrono sotto WSGI, async sotto ASGI: le view async non passano da un thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        start = time.perf_counter()
+
+        with execute_wrapper_all(counter):
+            response = self.get_response(request)
+
+        self.record(request, response, counter, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+
+        async with aexecute_wrapper_all(counter):
+            response = await self.get_response(request)
+
+        self.record(request, response, counter, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, counter, duration):
+        route = route_name(request)
+        if route == 'metrics':
+            return
+
+        if response.streaming:
+            size = response.get('Content-Length')
+            size = int(size) if size else None
+        else:
+            size = len(response.content)
+
+        registry.record(
+            route=route,
+            method=request.method,
+            status=response.status_code,
+            duration=duration,
+            query_count=counter.count,
+            sql_duration=counter.duration,
+            response_size=size,
+        )
+
+
+class SlowQueryMiddleware:
+    """
+    Registra le query più lente di HAPPYGREEN_SLOW_QUERIES['THRESHOLD_MS'] con la rotta
+    che le ha eseguite. Il salvataggio avviene a risposta pronta, fuori dal wrapper.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = slow_query_config()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.config['ENABLED']:
+            return self.get_response(request)
+
+        collector = SlowQueryCollector(self.config['THRESHOLD_MS'])
+        with execute_wrapper_all(collector):
+            response = self.get_response(request)
+
+        if collector.queries:
+            self.save(collector, request)
+        return response
+
+    async def __acall__(self, request):
+        if not self.config['ENABLED']:
+            return await self.get_response(request)
+
+        collector = SlowQueryCollector(self.config['THRESHOLD_MS'])
+        async with aexecute_wrapper_all(collector):
+            response = await self.get_response(request)
+
+        if collector.queries:
+            await sync_to_async(self.save, thread_sensitive=True)(collector, request)
+        return response
+
+    def save(self, collector, request):
+        try:
+            record_slow_queries(collector.queries, route_name(request))
+        except Exception:
+            # Il log delle query lente non deve mai far fallire la richiesta
+            logger.exception('Salvataggio delle query lente fallito')
@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-19 09:00
+
+from django.db import migrations, models
+
+from core.geo import encode_geohash
+
+
+def backfill_geohash(apps, schema_editor):
+    Post = apps.get_model('core', 'Post')
+    posts = Post.objects.filter(latitude__isnull=False, longitude__isnull=False).only('id', 'latitude', 'longitude')
+    batch = []
+    for post in posts.iterator(chunk_size=1000):
+        post.geohash = encode_geohash(post.latitude, post.longitude)
+        batch.append(post)
+        if len(batch) >= 1000:
+            Post.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    if batch:
+        Post.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_alter_comment_options_alter_post_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12, null=True),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
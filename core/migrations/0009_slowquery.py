@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-19 17:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_searchtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint_hash', models.CharField(max_length=40, unique=True)),
+                ('fingerprint', models.TextField()),
+                ('sample_sql', models.TextField(blank=True)),
+                ('explain', models.TextField(blank=True)),
+                ('origin', models.CharField(blank=True, max_length=255)),
+                ('routes', models.JSONField(default=dict)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('first_seen', models.DateTimeField(auto_now_add=True)),
+                ('last_seen', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['-total_ms'],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-19 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_slowquery'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created_at'], name='core_comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gamescore',
+            index=models.Index(fields=['game_id', 'user', 'score'], name='core_score_game_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gamescore',
+            index=models.Index(fields=['user', 'game_id', 'score'], name='core_score_user_game_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='groupmembership',
+            index=models.Index(fields=['user', 'role'], name='core_member_user_role_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-created_at'], name='core_post_group_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postreaction',
+            index=models.Index(fields=['post', 'reaction'], name='core_reaction_post_emoji_idx'),
+        ),
+    ]
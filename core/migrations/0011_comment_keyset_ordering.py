@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-19 17:16
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='comment',
+            options={'ordering': ['created_at', 'id']},
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2 on 2026-10-19 17:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+DEFAULT_BADGES = [
+    ('eco-100', 'Eco Hero', '100 punti eco raggiunti', 'eco_points', 100),
+    ('posts-10', 'Reporter Green', '10 post pubblicati', 'posts', 10),
+    ('first-reaction', 'Prima reaction', 'Prima reaction ricevuta su un post', 'reactions_received', 1),
+]
+
+
+def remove_duplicate_user_badges(apps, schema_editor):
+    UserBadge = apps.get_model('core', 'UserBadge')
+    seen = set()
+    for user_badge in UserBadge.objects.order_by('earned_at', 'id').only('id', 'user_id', 'badge_id'):
+        key = (user_badge.user_id, user_badge.badge_id)
+        if key in seen:
+            user_badge.delete()
+        seen.add(key)
+
+
+def create_default_badges(apps, schema_editor):
+    Badge = apps.get_model('core', 'Badge')
+    for code, name, description, metric, threshold in DEFAULT_BADGES:
+        Badge.objects.get_or_create(code=code, defaults={
+            'name': name, 'description': description, 'icon_url': '',
+            'metric': metric, 'threshold': threshold,
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_user_name_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='badge',
+            name='code',
+            field=models.SlugField(blank=True, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='badge',
+            name='metric',
+            field=models.CharField(blank=True, choices=[('eco_points', 'Punti eco'), ('posts', 'Post pubblicati'), ('comments', 'Commenti scritti'), ('likes_given', 'Like messi'), ('likes_received', 'Like ricevuti'), ('reactions_received', 'Reactions ricevute')], max_length=30),
+        ),
+        migrations.AddField(
+            model_name='badge',
+            name='threshold',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(remove_duplicate_user_badges, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='userbadge',
+            unique_together={('user', 'badge')},
+        ),
+        migrations.CreateModel(
+            name='UserProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('eco_points', 'Punti eco'), ('posts', 'Post pubblicati'), ('comments', 'Commenti scritti'), ('likes_given', 'Like messi'), ('likes_received', 'Like ricevuti'), ('reactions_received', 'Reactions ricevute')], max_length=30)),
+                ('value', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'metric')},
+            },
+        ),
+        migrations.RunPython(create_default_badges, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2 on 2026-10-19 17:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+from collections import Counter
+
+
+def normalize_label(label):
+    return ' '.join(str(label).split()).lower()
+
+
+def build_catalog(apps, schema_editor):
+    """Una voce di catalogo per etichetta (testi della prima riga), poi i testi duplicati vengono svuotati"""
+    RecyclingTip = apps.get_model('core', 'RecyclingTip')
+    DetectedObject = apps.get_model('core', 'DetectedObject')
+    GroupDetectionStat = apps.get_model('core', 'GroupDetectionStat')
+
+    tips, stats = {}, Counter()
+    for obj in DetectedObject.objects.select_related('post').order_by('id').iterator():
+        label = normalize_label(obj.label)
+        tip = tips.get(label)
+        if tip is None:
+            tip = tips[label] = RecyclingTip.objects.create(
+                label=label, description=obj.description, recycle_tips=obj.recycle_tips
+            )
+        obj.tip_id = tip.id
+        if obj.description == tip.description:
+            obj.description = ''
+        if obj.recycle_tips == tip.recycle_tips:
+            obj.recycle_tips = ''
+        obj.save(update_fields=['tip', 'description', 'recycle_tips'])
+        stats[(obj.post.group_id, label)] += 1
+
+    GroupDetectionStat.objects.bulk_create([
+        GroupDetectionStat(group_id=group_id, label=label, count=count)
+        for (group_id, label), count in stats.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_badge_rules_userprogress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecyclingTip',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=100, unique=True)),
+                ('description', models.TextField(blank=True)),
+                ('recycle_tips', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='detectedobject',
+            name='description',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='detectedobject',
+            name='recycle_tips',
+            field=models.TextField(blank=True),
+        ),
+        migrations.CreateModel(
+            name='GroupDetectionStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(max_length=100)),
+                ('count', models.IntegerField(default=0)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='detection_stats', to='core.group')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='detectedobject',
+            name='tip',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='core.recyclingtip'),
+        ),
+        migrations.AddIndex(
+            model_name='groupdetectionstat',
+            index=models.Index(fields=['group', '-count'], name='core_detstat_group_count_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='groupdetectionstat',
+            unique_together={('group', 'label')},
+        ),
+        migrations.RunPython(build_catalog, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2 on 2026-10-19 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_archived_posts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingDecay',
+            fields=[
+                ('alias', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('decayed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 18:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_trending_decay'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='object_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
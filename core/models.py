@@ -8,10 +8,13 @@ from django.contrib.auth.models import AbstractUser
 # core/models.py - Update the User model
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
 import uuid
 from django.utils import timezone
 from datetime import timedelta
 
+from .geo import encode_geohash
+
 
 class User(AbstractUser):
     avatar = models.TextField(blank=True, null=True)
@@ -23,6 +26,13 @@ class User(AbstractUser):
     verification_code = models.CharField(max_length=6, null=True, blank=True)
     verification_code_expires = models.DateTimeField(null=True, blank=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Ricerca per prefisso della rubrica utenti (username è già unico)
+            models.Index(fields=['first_name'], name='core_user_first_name_idx'),
+            models.Index(fields=['last_name'], name='core_user_last_name_idx'),
+        ]
+
     def set_verification_token(self):
         """Genera un nuovo token di verifica e imposta la scadenza (24 ore)"""
         self.verification_token = uuid.uuid4()
@@ -32,7 +42,8 @@ class User(AbstractUser):
     def verify_email(self):
         """Segna l'email dell'utente come verificata"""
         self.email_verified = True
-        self.verification_token = None
+        # Il campo non ammette NULL: un nuovo token invalida il link già usato
+        self.verification_token = uuid.uuid4()
         self.verification_token_expires = None
         self.save()
 
@@ -86,6 +97,10 @@ class GroupMembership(models.Model):
 
     class Meta:
         unique_together = ('user', 'group')
+        indexes = [
+            # Gruppi di un utente e controlli sul ruolo (es. admin)
+            models.Index(fields=['user', 'role'], name='core_member_user_role_idx'),
+        ]
 
 
 class Post(models.Model):
@@ -95,13 +110,41 @@ class Post(models.Model):
     caption = models.TextField(blank=True, null=True)
     latitude = models.FloatField(blank=True, null=True)
     longitude = models.FloatField(blank=True, null=True)
+    # Geohash calcolato da latitude/longitude, indicizzato per le query sulla mappa
+    geohash = models.CharField(max_length=12, blank=True, null=True, db_index=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Punteggio di popolarità: incrementato da like/reaction/commenti e fatto decadere
+    # periodicamente da `manage.py decay_trending_scores` (vedi core/trending.py)
+    trending_score = models.FloatField(default=0, editable=False)
 
     def __str__(self):
         return f"Post by {self.user.username} in {self.group.name}"
 
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = encode_geohash(self.latitude, self.longitude)
+        else:
+            self.geohash = None
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and ('latitude' in update_fields or 'longitude' in update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        if update_fields is None and not self._state.adding:
+            # trending_score viene aggiornato solo con UPDATE atomici: un salvataggio completo
+            # con il valore letto in precedenza annullerebbe gli incrementi nel frattempo
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'trending_score'
+            ]
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Feed: post dei gruppi dell'utente dal più recente
+            models.Index(fields=['group', '-created_at'], name='core_post_group_created_idx'),
+            # Post di tendenza per gruppo
+            models.Index(fields=['group', '-trending_score'], name='core_post_group_trending_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -114,7 +157,28 @@ class Comment(models.Model):
         return f"Comment by {self.user.username} on post {self.post.id}"
 
     class Meta:
-        ordering = ['created_at']
+        # (created_at, id): ordine totale, usato anche dalla paginazione a chiave dei commenti
+        ordering = ['created_at', 'id']
+        indexes = [
+            # Prefetch dei commenti dei post, già ordinati
+            models.Index(fields=['post', 'created_at'], name='core_comment_post_created_idx'),
+        ]
+
+
+# Indice invertito per la ricerca full-text (vedi core/search.py)
+class SearchToken(models.Model):
+    token = models.CharField(max_length=64)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='search_tokens')
+    # Valorizzato se il token proviene da un commento, altrimenti dalla didascalia
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True, related_name='search_tokens')
+    # Denormalizzato dal post per filtrare i permessi senza join
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='+')
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['token', 'group'], name='core_search_token_group_idx'),
+        ]
 
 
 # NUOVO: Modello per i Like
@@ -150,16 +214,45 @@ class PostReaction(models.Model):
 
     class Meta:
         unique_together = ('post', 'user')  # Un utente può avere solo una reaction per post
+        indexes = [
+            # Conteggio delle reactions di un post per emoji
+            models.Index(fields=['post', 'reaction'], name='core_reaction_post_emoji_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} reacted {self.reaction} to post {self.post.id}"
 
 
+class RecyclingTip(models.Model):
+    """Catalogo etichetta -> descrizione e consigli di riciclo, condiviso da tutti gli oggetti rilevati"""
+    label = models.CharField(max_length=100, unique=True)
+    description = models.TextField(blank=True)
+    recycle_tips = models.TextField(blank=True)
+
+    def __str__(self):
+        return self.label
+
+
 class DetectedObject(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE)
     label = models.CharField(max_length=100)
-    description = models.TextField()
-    recycle_tips = models.TextField()
+    tip = models.ForeignKey(RecyclingTip, on_delete=models.PROTECT, null=True, blank=True)
+    # Vuoti se uguali al catalogo: i testi vengono presi da `tip` (vedi core/detections.py)
+    description = models.TextField(blank=True)
+    recycle_tips = models.TextField(blank=True)
+
+
+class GroupDetectionStat(models.Model):
+    """Oggetti rilevati per etichetta nei post di un gruppo, aggiornato a ogni inserimento/cancellazione"""
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='detection_stats')
+    label = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('group', 'label')
+        indexes = [
+            models.Index(fields=['group', '-count'], name='core_detstat_group_count_idx'),
+        ]
 
 
 class Quiz(models.Model):
@@ -168,10 +261,25 @@ class Quiz(models.Model):
     options = models.JSONField()
 
 
+# Contatori per utente usati dalle regole dei badge (vedi core/badges.py)
+PROGRESS_METRICS = (
+    ('eco_points', 'Punti eco'),
+    ('posts', 'Post pubblicati'),
+    ('comments', 'Commenti scritti'),
+    ('likes_given', 'Like messi'),
+    ('likes_received', 'Like ricevuti'),
+    ('reactions_received', 'Reactions ricevute'),
+)
+
+
 class Badge(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
     icon_url = models.TextField()
+    # Regola di assegnazione automatica: metric >= threshold. Senza metric il badge è manuale
+    code = models.SlugField(max_length=50, unique=True, null=True, blank=True)
+    metric = models.CharField(max_length=30, choices=PROGRESS_METRICS, blank=True)
+    threshold = models.PositiveIntegerField(default=0)
 
 
 class UserBadge(models.Model):
@@ -179,6 +287,21 @@ class UserBadge(models.Model):
     badge = models.ForeignKey(Badge, on_delete=models.CASCADE)
     earned_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        unique_together = ('user', 'badge')
+
+
+class UserProgress(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='progress')
+    metric = models.CharField(max_length=30, choices=PROGRESS_METRICS)
+    value = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'metric')
+
+    def __str__(self):
+        return f"{self.user_id} {self.metric}={self.value}"
+
 
 class GameScore(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -187,4 +310,133 @@ class GameScore(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        ordering = ['-score']
\ No newline at end of file
+        ordering = ['-score']
+        indexes = [
+            # Classifica di un gioco: miglior punteggio per utente
+            models.Index(fields=['game_id', 'user', 'score'], name='core_score_game_user_idx'),
+            # Classifica globale (GROUP BY user_id, game_id) e miglior punteggio in update_user_points
+            models.Index(fields=['user', 'game_id', 'score'], name='core_score_user_game_idx'),
+        ]
+
+# Query lente aggregate per impronta (vedi core/slowlog.py)
+class SlowQuery(models.Model):
+    fingerprint_hash = models.CharField(max_length=40, unique=True)
+    fingerprint = models.TextField()
+    # Query più lenta osservata, con il suo piano di esecuzione
+    sample_sql = models.TextField(blank=True)
+    explain = models.TextField(blank=True)
+    origin = models.CharField(max_length=255, blank=True)
+    # Numero di esecuzioni lente per rotta
+    routes = models.JSONField(default=dict)
+    count = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-total_ms']
+
+    def __str__(self):
+        return f"{self.count}x {self.max_ms:.0f}ms {self.fingerprint[:80]}"
+
+
+# Risposte salvate per l'header Idempotency-Key (vedi core/idempotency.py)
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Endpoint a cui si riferisce la chiave, es. 'posts.create'
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    # NULL finché la richiesta originale è in corso
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    # Fin quando la richiesta in corso tiene la chiave: scaduto, un nuovo tentativo la riesegue
+    locked_until = models.DateTimeField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    # Oggetto creato da un ViewSet: al posto di response_body, la risposta viene riserializzata
+    object_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'scope', 'key')
+
+    def __str__(self):
+        return f"{self.scope} {self.key} ({self.user_id})"
+
+
+# Notifiche raggruppate: una riga per (destinatario, post, tipo), vedi core/notifications.py
+class Notification(models.Model):
+    KIND_CHOICES = [
+        ('like', 'Like'),
+        ('reaction', 'Reaction'),
+        ('comment', 'Commento'),
+    ]
+
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    # Senza vincolo nel database: con lo sharding il post può stare su un altro database
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+', db_constraint=False)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # Eventi arrivati dall'ultima lettura
+    count = models.PositiveIntegerField(default=1)
+    last_actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    is_read = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('recipient', 'post', 'kind')
+        indexes = [
+            models.Index(fields=['recipient', 'is_read', '-updated_at', '-id'], name='core_notif_feed_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.recipient_id} {self.kind} post {self.post_id} x{self.count}"
+
+
+class NotificationCounter(models.Model):
+    """Notifiche non lette per utente, per leggere il badge dell'app senza contare le righe"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread = models.IntegerField(default=0)
+
+
+# Sharding facoltativo: database che contiene post e attività di un gruppo, vedi core/sharding.py.
+# I gruppi senza riga stanno su `default`
+class GroupShard(models.Model):
+    group = models.OneToOneField(Group, on_delete=models.CASCADE, primary_key=True, related_name='shard')
+    alias = models.CharField(max_length=50)
+    # Scritture del gruppo sospese durante lo spostamento (manage.py reshard_group)
+    frozen = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.group_id} -> {self.alias}{' (in spostamento)' if self.frozen else ''}"
+
+
+# Archivio dei post vecchi (manage.py archive_posts, vedi core/archive.py): il post con commenti,
+# like, reaction e oggetti rilevati in un unico JSON compresso, fuori dalle tabelle usate dal feed
+class ArchivedPost(models.Model):
+    # Stesso id del post originale
+    id = models.BigIntegerField(primary_key=True)
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='+')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    payload = models.BinaryField()
+
+    def __str__(self):
+        return f"Archived post {self.id} in group {self.group_id}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', '-created_at'], name='core_archpost_grp_created_idx'),
+        ]
+
+
+# Ultimo decadimento dei punteggi di popolarità per database (vedi core/trending.py): il
+# decadimento successivo usa il tempo trascorso da qui e le rimozioni tolgono il peso già decaduto
+class TrendingDecay(models.Model):
+    alias = models.CharField(max_length=50, primary_key=True)
+    decayed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.alias}: {self.decayed_at}"
@@ -0,0 +1,97 @@
+# core/notifications.py - Notifiche in app per like, reaction e commenti ricevuti
+#
+# Le raffiche vengono raggruppate in scrittura: esiste al massimo una riga per
+# (destinatario, post, tipo). Un nuovo evento incrementa `count` se la notifica non è
+# ancora stata letta, altrimenti la riapre ripartendo da 1. Il numero di notifiche non lette
+# sta in NotificationCounter ed è aggiornato quando una riga passa da letta a non letta
+# (o viceversa) o una notifica non letta viene cancellata (anche in cascata con il suo post),
+# così l'endpoint del contatore è una lettura per chiave primaria.
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete
+from django.utils import timezone
+
+from .models import Notification, NotificationCounter
+
+
+def _add_unread(user_id, delta):
+    if NotificationCounter.objects.filter(user_id=user_id).update(unread=F('unread') + delta):
+        return
+    try:
+        with transaction.atomic():
+            NotificationCounter.objects.create(user_id=user_id, unread=max(delta, 0))
+    except IntegrityError:
+        NotificationCounter.objects.filter(user_id=user_id).update(unread=F('unread') + delta)
+
+
+def _forget_unread(sender, instance, using, **kwargs):
+    """
+    Notifica non letta cancellata (post eliminato o archiviato, cascata dallo shard): il
+    contatore scende nella stessa transazione della DELETE. Solo UPDATE: se il contatore
+    non esiste (o viene cancellato con l'utente) non c'è niente da togliere
+    """
+    if not instance.is_read:
+        NotificationCounter.objects.using(using).filter(user_id=instance.recipient_id).update(
+            unread=F('unread') - 1
+        )
+
+
+# Anche QuerySet.delete() e le cascate passano dal Collector, che con un ricevitore
+# carica le righe e invia il segnale per ognuna (al massimo una per tipo e post)
+post_delete.connect(_forget_unread, sender=Notification, dispatch_uid='notification_forget_unread')
+
+
+def notify(recipient_id, post_id, kind, actor):
+    """Registra un evento di `actor` sul post di `recipient_id`; le azioni sui propri post vengono ignorate"""
+    if recipient_id == actor.id:
+        return
+    now = timezone.now()
+    notifications = Notification.objects.filter(recipient_id=recipient_id, post_id=post_id, kind=kind)
+
+    # Caso comune durante una raffica: la notifica è già aperta, una sola UPDATE
+    if notifications.filter(is_read=False).update(count=F('count') + 1, last_actor=actor, updated_at=now):
+        return
+
+    reopened = notifications.filter(is_read=True).update(count=1, is_read=False, last_actor=actor, updated_at=now)
+    if not reopened:
+        try:
+            with transaction.atomic():
+                Notification.objects.create(
+                    recipient_id=recipient_id, post_id=post_id, kind=kind, last_actor=actor, updated_at=now
+                )
+        except IntegrityError:
+            # Creata nel frattempo da un'altra richiesta: si aggiunge l'evento a quella
+            notifications.update(count=F('count') + 1, last_actor=actor, updated_at=now)
+            return
+    _add_unread(recipient_id, 1)
+
+
+def mark_read(user, ids=None):
+    """Segna come lette le notifiche indicate (tutte se ids è None). Restituisce quante erano non lette"""
+    notifications = Notification.objects.filter(recipient=user, is_read=False)
+    if ids is not None:
+        notifications = notifications.filter(id__in=ids)
+    with transaction.atomic():
+        updated = notifications.update(is_read=True)
+        if updated:
+            _add_unread(user.id, -updated)
+    return updated
+
+
+def unread_count(user):
+    return NotificationCounter.objects.filter(user=user).values_list('unread', flat=True).first() or 0
+
+
+def rebuild_counters():
+    """Riallinea i contatori al numero reale di notifiche non lette. Restituisce i contatori scritti"""
+    totals = dict(
+        Notification.objects.filter(is_read=False).values_list('recipient_id').annotate(total=Count('id')).order_by()
+    )
+    with transaction.atomic():
+        NotificationCounter.objects.all().delete()
+        NotificationCounter.objects.bulk_create(
+            [NotificationCounter(user_id=user_id, unread=total) for user_id, total in totals.items()],
+            batch_size=1000,
+        )
+    return len(totals)
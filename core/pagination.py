@@ -0,0 +1,90 @@
+# core/pagination.py - Classi di paginazione per gli endpoint con risultati potenzialmente grandi
+
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class SearchPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+
+
+class DirectoryPagination(CursorPagination):
+    # username è unico: il cursore è una semplice condizione username > ultimo valore
+    ordering = 'username'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+
+
+class NotificationPagination(CursorPagination):
+    # Più recenti per prime; id rende l'ordinamento univoco anche a parità di updated_at
+    ordering = ('-updated_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginazione a chiave su (created_at, id), nello stesso ordine crescente di Comment.Meta.ordering.
+    Il cursore è la posizione dell'ultimo elemento restituito: ogni pagina costa una query
+    indicizzata, indipendentemente da quanto si è andati avanti nel thread
+    """
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self._get_page_size(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            created_at, pk = self._decode_cursor(cursor)
+            queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+
+        items = list(queryset.order_by('created_at', 'id')[:self.page_size + 1])
+        self.has_next = len(items) > self.page_size
+        self.page = items[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self._encode_cursor(last.created_at, last.id))
+
+    def _get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    @staticmethod
+    def _encode_cursor(created_at, pk):
+        return base64.urlsafe_b64encode(f'{created_at.isoformat()}|{pk}'.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        try:
+            created_at, pk = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+            return datetime.fromisoformat(created_at), int(pk)
+        except (ValueError, UnicodeError):
+            raise NotFound('Cursore non valido')
@@ -0,0 +1,231 @@
+# core/profiling.py - Profiler a campionamento delle richieste, output in formato collapsed-stack
+#
+# Un thread legge lo stack del thread che serve la richiesta ogni INTERVAL_MS millisecondi.
+# Ogni campione viene attribuito a una categoria (orm, serializer, base64, view) in base al
+# frame più interno riconosciuto, e gli stack vengono scritti come righe
+# "frame;frame;frame conteggio", leggibili da flamegraph.pl, speedscope e inferno.
+#
+# Si attiva per una frazione casuale delle richieste (SAMPLE_RATE) oppure su richiesta di
+# un utente staff con l'header X-Profile firmato (vedi `manage.py profiling_header`).
+# Quando non è attivo il costo è un confronto con random() e la lettura di un header.
+
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import SyncToAsync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+from .middleware import route_name
+
+HEADER = 'X-Profile'
+SIGNING_SALT = 'core.profiling'
+
+# Categorie in ordine di controllo sul frame: la prima che corrisponde vince
+CATEGORIES = [
+    ('base64', ('/base64.py', '/binascii')),
+    ('orm', ('/django/db/',)),
+    ('serializer', ('/rest_framework/serializers.py', '/rest_framework/fields.py',
+                    '/rest_framework/relations.py', '/core/serializers.py')),
+    ('render', ('/rest_framework/renderers.py', '/json/encoder.py', '/rest_framework/utils/encoders.py')),
+]
+
+DEFAULTS = {
+    'SAMPLE_RATE': 0.0,
+    'INTERVAL_MS': 5,
+    'OUTPUT_DIR': None,
+    'HEADER_MAX_AGE': 3600,
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'HAPPYGREEN_PROFILING', {}))
+    if not config['OUTPUT_DIR']:
+        config['OUTPUT_DIR'] = os.path.join(settings.BASE_DIR, 'profiles')
+    return config
+
+
+def sign_profile_header(user):
+    """Valore dell'header X-Profile per un utente staff"""
+    return signing.dumps({'user': user.pk}, salt=SIGNING_SALT)
+
+
+def read_profile_header(value, max_age):
+    """Id dell'utente per cui è stato firmato l'header, None se non valido o scaduto"""
+    try:
+        return signing.loads(value, salt=SIGNING_SALT, max_age=max_age)['user']
+    except (signing.BadSignature, KeyError, TypeError):
+        return None
+
+
+def _frame_label(code):
+    filename = code.co_filename
+    base_dir = str(settings.BASE_DIR)
+    if filename.startswith(base_dir):
+        filename = os.path.relpath(filename, base_dir)
+    elif 'site-packages' in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    # ';' separa i frame nel formato collapsed
+    return f'{code.co_name} ({filename})'.replace(';', ':')
+
+
+def categorize(filenames):
+    """Categoria di un campione dato l'elenco dei file dello stack, dal più interno al più esterno"""
+    for filename in filenames:
+        filename = filename.replace(os.sep, '/')
+        for category, markers in CATEGORIES:
+            if any(marker in filename for marker in markers):
+                return category
+    return 'view'
+
+
+class StackSampler:
+    """
+    Campiona a intervalli regolari, da un thread separato, lo stack dei thread indicati
+    ({id del thread: codice del frame radice}). Conta solo i campioni in cui il thread sta
+    eseguendo la richiesta, cioè ha la radice nello stack, e tiene i frame sotto di essa
+    """
+
+    def __init__(self, threads, interval):
+        self.threads = threads
+        self.interval = interval
+        self.stacks = Counter()
+        self.categories = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='happygreen-profiler', daemon=True)
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started_at
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, root_code in self.threads.items():
+                self._sample(frames.get(thread_id), root_code)
+
+    def _sample(self, frame, root_code):
+        codes = []
+        # Solo i frame sotto il middleware: il server e il resto dello stack non interessano
+        while frame is not None and frame.f_code is not root_code:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        if frame is None:
+            # Il thread sta facendo altro (un'altra richiesta nell'event loop) o è inattivo
+            return
+        category = categorize(code.co_filename for code in codes)
+        stack = ';'.join([category] + [_frame_label(code) for code in reversed(codes)])
+        self.stacks[stack] += 1
+        self.categories[category] += 1
+        self.samples += 1
+
+    def breakdown(self):
+        """Millisecondi stimati per categoria (campioni x intervallo)"""
+        return {category: count * self.interval * 1000 for category, count in self.categories.most_common()}
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class ProfilingMiddleware:
+    """
+    Profila le richieste campionate o richieste con l'header firmato. Il file .folded
+    finisce in OUTPUT_DIR e la ripartizione dei tempi nell'header Server-Timing.
+    Sotto ASGI campiona sia l'event loop (view async) sia il thread di sync_to_async della
+    richiesta (view sincrone e query)
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = get_config()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def wanted(self, request):
+        """(campionata, id dell'utente dell'header) se la richiesta va profilata, altrimenti None"""
+        header = request.headers.get(HEADER)
+        sampled = self.config['SAMPLE_RATE'] > 0 and random.random() < self.config['SAMPLE_RATE']
+        if not header and not sampled:
+            return None
+
+        requested_by = read_profile_header(header, self.config['HEADER_MAX_AGE']) if header else None
+        if requested_by is None and not sampled:
+            return None
+        return sampled, requested_by
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        wanted = self.wanted(request)
+        if wanted is None:
+            return self.get_response(request)
+
+        sampler = StackSampler(
+            {threading.get_ident(): ProfilingMiddleware.__call__.__code__}, self.config['INTERVAL_MS'] / 1000,
+        )
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+        return self.finish(request, response, sampler, *wanted)
+
+    async def __acall__(self, request):
+        wanted = self.wanted(request)
+        if wanted is None:
+            return await self.get_response(request)
+
+        sync_thread = await sync_to_async(threading.get_ident, thread_sensitive=True)()
+        sampler = StackSampler({
+            threading.get_ident(): ProfilingMiddleware.__acall__.__code__,
+            sync_thread: SyncToAsync.thread_handler.__code__,
+        }, self.config['INTERVAL_MS'] / 1000)
+        sampler.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            sampler.stop()
+        # request.user può richiedere query (sessione) e il file va scritto fuori dall'event loop
+        return await sync_to_async(self.finish, thread_sensitive=True)(request, response, sampler, *wanted)
+
+    def finish(self, request, response, sampler, sampled, requested_by):
+        if not sampled:
+            # L'utente è noto solo dopo l'autenticazione della view (token DRF)
+            user = getattr(request, 'user', None)
+            if not (user and user.is_authenticated and user.is_staff and user.pk == requested_by):
+                return response
+
+        filename = self._write(request, sampler)
+        response['Server-Timing'] = ', '.join(
+            f'{category};dur={ms:.1f}' for category, ms in sampler.breakdown().items()
+        )
+        if requested_by is not None:
+            response['X-Profile-File'] = filename
+        return response
+
+    def _write(self, request, sampler):
+        output_dir = self.config['OUTPUT_DIR']
+        os.makedirs(output_dir, exist_ok=True)
+        route = route_name(request).replace(':', '_').replace('/', '_')
+        filename = f"{timezone.now():%Y%m%d-%H%M%S}-{request.method.lower()}-{route}-{os.getpid()}-" \
+                   f"{threading.get_ident()}.folded"
+        with open(os.path.join(output_dir, filename), 'w') as f:
+            f.write(sampler.collapsed())
+        return filename
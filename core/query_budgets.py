@@ -0,0 +1,206 @@
+# core/query_budgets.py - Budget di query SQL per rotta, verificati da `manage.py check_query_budgets`
+#
+# Ogni rotta GET deve avere un budget. Le rotte di scrittura vengono eseguite solo se
+# dichiarate qui con i dati della richiesta. Il budget vale per entrambe le dimensioni
+# di dati e il numero di query non deve crescere passando dal dataset piccolo al grande.
+# Il budget include la query di autenticazione del token e, su SQLite, i BEGIN delle
+# transazioni (es. uno per ogni contatore dei badge incrementato).
+
+from django.db.models import Count
+
+from .models import User, Group, GroupMembership, Post, Comment, PostLike, PostReaction, DetectedObject, Quiz, Badge, \
+    UserBadge, RecyclingTip, GroupDetectionStat
+from .notifications import notify
+from .trending import rebuild as rebuild_trending_scores
+
+
+def build_context(size):
+    """Oggetti su cui eseguire le rotte, scelti nel gruppo con più post e membri del dataset generato"""
+    group = Group.objects.annotate(posts=Count('post', distinct=True)).order_by('-posts', 'id').first()
+    user = group.owner
+    # Post con commenti, like e reactions di altri utenti: i prefetch eseguono sempre le stesse query
+    post = Post.objects.filter(group=group).annotate(
+        comments_total=Count('comments', distinct=True),
+        likes_total=Count('likes', distinct=True),
+        reactions_total=Count('reactions', distinct=True),
+    ).filter(comments_total__gt=0, likes_total__gt=1, reactions_total__gt=1).order_by('-created_at').first()
+    post = post or Post.objects.filter(group=group).order_by('-created_at').first()
+    comment = Comment.objects.filter(post=post).order_by('-created_at').first()
+
+    # Stesso ramo di codice in entrambi i dataset per like e reactions
+    PostLike.objects.filter(post=post, user=user).delete()
+    PostReaction.objects.filter(post=post, user=user).delete()
+
+    # Modelli che il generatore non popola: pochi oggetti, proporzionali al dataset
+    extra = max(2, size // 4)
+    Quiz.objects.bulk_create([
+        Quiz(question=f'Domanda {i}', correct_answer='A', options=['A', 'B', 'C', 'D']) for i in range(extra)
+    ])
+    Badge.objects.bulk_create([
+        Badge(name=f'Badge {i}', description='Badge di prova', icon_url='') for i in range(extra)
+    ])
+    badge = Badge.objects.order_by('id').first()
+    UserBadge.objects.bulk_create([
+        UserBadge(user=member, badge=badge) for member in User.objects.order_by('id')[:extra]
+    ])
+    tip, _ = RecyclingTip.objects.get_or_create(
+        label='bottiglia', defaults={'description': 'Bottiglia di plastica', 'recycle_tips': 'Plastica'}
+    )
+    DetectedObject.objects.bulk_create([DetectedObject(post=post, label='bottiglia', tip=tip) for _ in range(extra)])
+    GroupDetectionStat.objects.bulk_create([
+        GroupDetectionStat(group=group, label=f'oggetto {i}', count=i + 1) for i in range(extra)
+    ])
+
+    actors = list(User.objects.exclude(id=user.id).order_by('id')[:extra])
+    for other_post in Post.objects.filter(group=group).order_by('id')[:extra]:
+        for actor in actors:
+            notify(user.id, other_post.id, 'like', actor)
+            notify(user.id, other_post.id, 'comment', actor)
+
+    rebuild_trending_scores()
+
+    unverified = User.objects.create_user(f'unverified_{size}', f'unverified_{size}@example.com', 'happygreen')
+    unverified.set_verification_token()
+
+    return {
+        'user': user,
+        'password': 'happygreen',
+        'group': group,
+        'post': post,
+        'verification_token': str(unverified.verification_token),
+        'objects': {
+            'user': user,
+            'group': group,
+            'post': post,
+            'comment': comment,
+            'groupmembership': GroupMembership.objects.filter(group=group).order_by('id').first(),
+            'detectedobject': DetectedObject.objects.order_by('id').first(),
+            'quiz': Quiz.objects.order_by('id').first(),
+            'badge': badge,
+            'userbadge': UserBadge.objects.order_by('id').first(),
+        },
+    }
+
+
+def route_kwargs(name, kwarg_names, ctx):
+    """Parametri dell'URL per la rotta `name` (es. pk dell'oggetto del basename del router)"""
+    kwargs = {}
+    for key in kwarg_names:
+        if key == 'pk':
+            kwargs[key] = ctx['objects'][name.split('-')[0]].pk
+        elif key == 'token':
+            kwargs[key] = ctx['verification_token']
+        elif key == 'userId':
+            kwargs[key] = ctx['user'].id
+    return kwargs
+
+
+ROUTE_BUDGETS = {
+    'api-root': {'GET': {'budget': 0}},
+    'current-user': {'GET': {'budget': 1}},
+    'get-leaderboard': {'GET': {'budget': 3}},
+    'update-user-points': {
+        'POST': {'budget': 7, 'data': lambda ctx: {'points': 10, 'game_id': 'eco_quiz'}, 'status': 200},
+    },
+    'async-current-user': {'GET': {'budget': 1}},
+    'async-get-leaderboard': {'GET': {'budget': 3}},
+    'async-post-feed': {'GET': {'budget': 10}},
+
+    'user-list': {'GET': {'budget': 2}},
+    'user-detail': {'GET': {'budget': 2}},
+    'user-directory': {'GET': {'budget': 2, 'params': lambda ctx: {'q': 'seed', 'exclude_group': ctx['group'].id}}},
+    'group-list': {'GET': {'budget': 2}},
+    'group-detail': {'GET': {'budget': 3}},
+    'group-my-groups': {'GET': {'budget': 4}},
+    # Solo la parte sincrona: le query dell'export partono durante lo streaming
+    'group-export': {'GET': {'budget': 2, 'status': 200}},
+    'group-top-detections': {'GET': {'budget': 5, 'params': lambda ctx: {'limit': 5}}},
+    'groupmembership-list': {'GET': {'budget': 1}},
+    'groupmembership-detail': {'GET': {'budget': 1}},
+
+    'post-list': {
+        'GET': {'budget': 10},
+        'POST': {
+            'budget': 21,
+            'data': lambda ctx: {'group': ctx['group'].id, 'caption': 'Raccolta della plastica', 'image_url': ''},
+            'status': 201,
+        },
+    },
+    'post-detail': {'GET': {'budget': 10}},
+    'post-trending': {'GET': {'budget': 10}},
+    'post-reactions': {'GET': {'budget': 8}},
+    'post-comments': {'GET': {'budget': 5, 'params': lambda ctx: {'page_size': 5}}},
+    # Il fixture ha già il like: toglierlo legge anche l'ultimo decadimento di trending
+    'post-toggle-like': {'POST': {'budget': 19, 'status': 200}},
+    'post-add-reaction': {'POST': {'budget': 22, 'data': lambda ctx: {'reaction': '🔥'}, 'status': 200}},
+    'post-batch-get': {
+        'POST': {'budget': 10, 'data': lambda ctx: {'ids': [ctx['post'].id, ctx['post'].id + 1, 0]}, 'status': 200},
+    },
+    'post-batch-actions': {
+        'POST': {
+            'budget': 26,
+            'data': lambda ctx: {'actions': [
+                {'post': ctx['post'].id, 'action': 'like'},
+                {'post': ctx['post'].id, 'action': 'reaction', 'reaction': '👍'},
+            ]},
+            'status': 200,
+        },
+    },
+    'post-detections': {
+        'POST': {
+            'budget': 10,
+            'data': lambda ctx: {'objects': [
+                {'label': 'bottiglia'},
+                {'label': 'Lattina', 'description': 'Lattina di alluminio', 'recycle_tips': 'Metalli'},
+                {'label': 'lattina'},
+            ]},
+            'status': 201,
+        },
+    },
+    'post-search': {'GET': {'budget': 12, 'params': lambda ctx: {'q': 'plastica riciclo'}}},
+    'post-nearby': {'GET': {'budget': 4, 'params': lambda ctx: {'lat': 45.4642, 'lng': 9.19, 'radius': 20}}},
+    'post-map': {
+        'GET': {'budget': 4, 'params': lambda ctx: {'south': 40, 'west': 7, 'north': 46, 'east': 15, 'zoom': 8}},
+    },
+
+    'comment-list': {
+        'GET': {'budget': 2},
+        'POST': {
+            'budget': 23,
+            'data': lambda ctx: {'post': ctx['post'].id, 'content': 'Bravissimi!'},
+            'status': 201,
+        },
+    },
+    'comment-detail': {'GET': {'budget': 2}},
+    # Testi dal catalogo in memoria: al massimo la query di caricamento
+    'detectedobject-list': {'GET': {'budget': 2}},
+    'detectedobject-detail': {'GET': {'budget': 2}},
+    'quiz-list': {'GET': {'budget': 1}},
+    'quiz-detail': {'GET': {'budget': 1}},
+    # Le domande sono in memoria: al massimo la query di caricamento
+    'quiz-session': {'GET': {'budget': 1, 'params': lambda ctx: {'count': 5}, 'status': 200}},
+    'quiz-grade': {
+        'POST': {
+            'budget': 1,
+            'data': lambda ctx: {'answers': {str(ctx['objects']['quiz'].id): 'A', '0': 'B'}},
+            'status': 200,
+        },
+    },
+    'notification-list': {'GET': {'budget': 2}},
+    'notification-unread-count': {'GET': {'budget': 2}},
+    'notification-mark-read': {'POST': {'budget': 5, 'data': lambda ctx: {}, 'status': 200}},
+    'badge-list': {'GET': {'budget': 1}},
+    'badge-detail': {'GET': {'budget': 1}},
+    'userbadge-list': {'GET': {'budget': 1}},
+    'userbadge-detail': {'GET': {'budget': 1}},
+
+    'login': {
+        'POST': {
+            'budget': 2,
+            'data': lambda ctx: {'username': ctx['user'].username, 'password': ctx['password']},
+            'status': 200,
+        },
+    },
+    'verify-email': {'GET': {'budget': 2}},
+    'slow-queries': {'GET': {'budget': 1, 'status': 403}},
+}
@@ -0,0 +1,63 @@
+# core/querylog.py - Registrazione delle query SQL con l'origine nel codice del progetto
+
+import os
+import re
+import time
+import traceback
+
+from django.conf import settings
+
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAM_RE = re.compile(r'%s')
+_IN_LIST_RE = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """
+    Impronta di una query: letterali e parametri sostituiti con ?, liste IN
+    compattate, spazi uniformati. Query che differiscono solo nei valori coincidono.
+    """
+    sql = _STRING_RE.sub('?', sql)
+    sql = _PARAM_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _WHITESPACE_RE.sub(' ', sql).strip()
+
+
+def project_origin(skip_files=()):
+    """Frame più interno dello stack che appartiene al codice del progetto (non a Django/DRF)"""
+    base_dir = str(settings.BASE_DIR)
+    this_file = os.path.abspath(__file__)
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if not filename.startswith(base_dir) or filename == this_file or filename in skip_files:
+            continue
+        if 'site-packages' in filename:
+            continue
+        return f'{os.path.relpath(filename, base_dir)}:{frame.lineno} in {frame.name}'
+    return None
+
+
+class QueryRecorder:
+    """Execute wrapper che registra sql, durata e origine di ogni query"""
+
+    def __init__(self, with_origin=True):
+        self.with_origin = with_origin
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'params': params,
+                'duration': time.perf_counter() - start,
+                'origin': project_origin() if self.with_origin else None,
+            })
+
+    def __len__(self):
+        return len(self.queries)
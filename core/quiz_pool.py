@@ -0,0 +1,72 @@
+# core/quiz_pool.py - Domande dei quiz tenute in memoria per le sessioni casuali
+#
+# La tabella Quiz è piccola e cambia di rado: ogni processo ne tiene una copia (domande
+# senza risposta e risposte corrette separate) e la ricarica quando un Quiz viene
+# salvato o cancellato in questo processo, oppure dopo POOL_TTL_SECONDS per vedere le
+# modifiche fatte dagli altri worker.
+
+import random
+import threading
+import time
+
+from django.db.models.signals import post_delete, post_save
+
+from .models import Quiz
+
+POOL_TTL_SECONDS = 300
+
+
+class QuizPool:
+    def __init__(self, ttl=POOL_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._ids = []
+        self._questions = {}
+        self._answers = {}
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return
+            questions, answers = {}, {}
+            for quiz in Quiz.objects.order_by('id').values('id', 'question', 'options', 'correct_answer'):
+                answers[quiz['id']] = quiz.pop('correct_answer')
+                questions[quiz['id']] = quiz
+            self._ids = list(questions)
+            self._questions = questions
+            self._answers = answers
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self, **kwargs):
+        with self._lock:
+            self._loaded_at = None
+
+    def sample(self, count):
+        """`count` domande casuali distinte (meno se il quiz ne ha meno), senza risposta corretta"""
+        self._ensure_loaded()
+        ids = random.sample(self._ids, min(count, len(self._ids)))
+        return [dict(self._questions[quiz_id]) for quiz_id in ids]
+
+    def grade(self, answers):
+        """
+        Corregge {quiz_id: risposta}. Restituisce (risultati, corrette); i quiz inesistenti
+        vengono segnalati con correct=None
+        """
+        self._ensure_loaded()
+        results, correct = [], 0
+        for quiz_id, answer in answers.items():
+            expected = self._answers.get(quiz_id)
+            if expected is None:
+                results.append({'quiz': quiz_id, 'correct': None, 'correct_answer': None})
+                continue
+            is_correct = str(answer).strip() == str(expected).strip()
+            correct += is_correct
+            results.append({'quiz': quiz_id, 'correct': is_correct, 'correct_answer': expected})
+        return results, correct
+
+
+pool = QuizPool()
+
+post_save.connect(pool.invalidate, sender=Quiz, dispatch_uid='quiz_pool_save')
+post_delete.connect(pool.invalidate, sender=Quiz, dispatch_uid='quiz_pool_delete')
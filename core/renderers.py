@@ -0,0 +1,129 @@
+# core/renderers.py - Renderer e parser JSON veloci, MessagePack facoltativo
+#
+# FastJSONRenderer/FastJSONParser usano orjson (in C) quando è installato e producono gli
+# stessi byte di JSONRenderer di DRF: le date passano dallo stesso encoder di DRF e i
+# separatori U+2028/U+2029 vengono sostituiti come fa DRF. Tutto ciò che orjson non sa
+# trattare (indentazione richiesta, interi oltre 64 bit, JSON non valido) torna al
+# renderer/parser della libreria standard, che dà lo stesso risultato o lo stesso errore.
+# Unica differenza: NaN e infiniti, che JSONRenderer rifiuta, vengono scritti come null.
+#
+# Con il pacchetto facoltativo `msgpack` l'API risponde e accetta anche application/msgpack
+# (Accept / Content-Type o ?format=msgpack): i campi immagine si possono inviare come byte
+# invece che in base64 e vengono convertiti in data URL prima di arrivare alle view.
+
+import base64
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Tipi che orjson serializzerebbe in modo diverso da DRF: passano dall'encoder di DRF
+_default = JSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if orjson is None or self.ensure_ascii or not self.compact or \
+                self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data, default=_default,
+                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except (orjson.JSONEncodeError, TypeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Come JSONRenderer: separatori di riga validi in JSON ma non in JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # Ricontrollato con la libreria standard: stesso risultato (es. interi enormi)
+            # o stesso messaggio di errore di JSONParser
+            return JSONParser().parse(_Body(body), media_type, parser_context)
+
+
+class _Body:
+    """Flusso già letto, per ripassarlo a JSONParser"""
+
+    def __init__(self, body):
+        self._body = body
+
+    def read(self, *args):
+        body, self._body = self._body, b''
+        return body
+
+
+# Primi byte dei formati immagine accettati come byte grezzi
+IMAGE_SIGNATURES = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+
+def _image_type(data):
+    for signature, content_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return content_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+
+def _bytes_to_data_urls(value):
+    """Sostituisce i valori binari con data URL base64, il formato atteso da avatar e image_url"""
+    if isinstance(value, bytes):
+        return f'data:{_image_type(value)};base64,{base64.b64encode(value).decode("ascii")}'
+    if isinstance(value, dict):
+        return {key: _bytes_to_data_urls(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_bytes_to_data_urls(item) for item in value]
+    return value
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_default, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            data = msgpack.unpackb(stream.read(), raw=False)
+        except ValueError as exc:
+            raise ParseError(f'MessagePack parse error - {exc or type(exc).__name__}')
+        return _bytes_to_data_urls(data)
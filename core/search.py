@@ -0,0 +1,95 @@
+# core/search.py - Indice invertito per la ricerca full-text su post e commenti
+
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import router, transaction
+
+from .models import SearchToken
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MIN_TOKEN_LENGTH = 2
+MAX_QUERY_TERMS = 8
+
+# Peso di un token nella didascalia rispetto a uno nei commenti
+CAPTION_WEIGHT = 3
+COMMENT_WEIGHT = 1
+
+STOPWORDS = {
+    'il', 'lo', 'la', 'le', 'gli', 'un', 'una', 'uno', 'di', 'da', 'in', 'con', 'su', 'per', 'tra', 'fra',
+    'del', 'della', 'dei', 'delle', 'al', 'alla', 'ai', 'alle', 'nel', 'nella', 'che', 'non', 'ma', 'ed',
+    'the', 'and', 'or', 'of', 'to', 'is', 'it', 'on', 'at', 'an', 'for',
+}
+
+
+def normalize(text):
+    """Minuscolo e senza accenti, così 'Perché' e 'perche' coincidono"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text):
+    """Restituisce i token indicizzabili del testo (con ripetizioni)"""
+    if not text:
+        return []
+    field_length = SearchToken._meta.get_field('token').max_length
+    return [
+        token[:field_length]
+        for token in TOKEN_RE.findall(normalize(text))
+        if len(token) >= MIN_TOKEN_LENGTH and token not in STOPWORDS
+    ]
+
+
+def query_terms(query):
+    """Token distinti della query di ricerca, nell'ordine in cui compaiono"""
+    terms = []
+    for token in tokenize(query):
+        if token not in terms:
+            terms.append(token)
+    return terms[:MAX_QUERY_TERMS]
+
+
+def _build_tokens(text, weight, post_id, group_id, comment_id=None):
+    """Righe SearchToken (non salvate) per un testo, con il peso moltiplicato per le occorrenze"""
+    return [
+        SearchToken(
+            token=token,
+            post_id=post_id,
+            group_id=group_id,
+            comment_id=comment_id,
+            weight=weight * occurrences,
+        )
+        for token, occurrences in Counter(tokenize(text)).items()
+    ]
+
+
+def post_tokens(post):
+    """Token (non salvati) della didascalia del post, per inserimenti in blocco"""
+    return _build_tokens(post.caption, CAPTION_WEIGHT, post.id, post.group_id)
+
+
+def comment_tokens(comment, group_id):
+    """Token (non salvati) del commento, per inserimenti in blocco"""
+    return _build_tokens(comment.content, COMMENT_WEIGHT, comment.post_id, group_id, comment.id)
+
+
+def index_post(post):
+    """(Re)indicizza la didascalia del post"""
+    # Stesso database del post (con lo sharding è lo shard del gruppo)
+    tokens = SearchToken.objects.db_manager(router.db_for_write(SearchToken, instance=post))
+    with transaction.atomic(using=tokens.db):
+        # Se il post è stato spostato di gruppo, anche i token dei commenti seguono
+        tokens.filter(post_id=post.id).exclude(group_id=post.group_id).update(group_id=post.group_id)
+        tokens.filter(post_id=post.id, comment__isnull=True).delete()
+        tokens.bulk_create(post_tokens(post))
+
+
+def index_comment(comment, group_id=None):
+    """(Re)indicizza il testo di un commento"""
+    if group_id is None:
+        group_id = comment.post.group_id
+    tokens = SearchToken.objects.db_manager(router.db_for_write(SearchToken, instance=comment))
+    with transaction.atomic(using=tokens.db):
+        tokens.filter(comment_id=comment.id).delete()
+        tokens.bulk_create(comment_tokens(comment, group_id))
@@ -0,0 +1,251 @@
+# core/seeding.py - Generatore di dati realistici per benchmark e test di carico
+#
+# L'attività degli utenti segue una distribuzione a coda lunga (pochi utenti e post
+# molto attivi, molti quasi inattivi), come nei dati reali.
+
+import base64
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .geo import encode_geohash
+from .models import User, Group, GroupMembership, Post, Comment, PostLike, PostReaction, GameScore, SearchToken
+from .search import post_tokens, comment_tokens
+
+BATCH_SIZE = 1000
+
+GAME_IDS = ['eco_detective', 'eco_sfida', 'eco_quiz', 'eco_memory']
+
+# Centri urbani attorno a cui geolocalizzare i post
+CITIES = [
+    (45.4642, 9.1900),   # Milano
+    (45.4408, 12.3155),  # Venezia
+    (45.0703, 7.6869),   # Torino
+    (44.4949, 11.3426),  # Bologna
+    (41.9028, 12.4964),  # Roma
+    (40.8518, 14.2681),  # Napoli
+]
+
+CAPTION_WORDS = [
+    'raccolta', 'differenziata', 'plastica', 'vetro', 'carta', 'parco', 'spiaggia', 'bottiglie',
+    'riciclo', 'compost', 'pulizia', 'scuola', 'classe', 'alberi', 'bicicletta', 'energia',
+    'solare', 'acqua', 'rifiuti', 'lattine', 'cartone', 'giardino', 'orto', 'fiume',
+]
+
+COMMENT_TEXTS = [
+    'Bravissimi!', 'Ottimo lavoro', 'Anche noi domani', 'Che bello!', 'Dove si trova?',
+    'Grande iniziativa', 'La plastica va nel giallo', 'Il vetro va nel verde', 'Complimenti alla classe',
+]
+
+
+def skewed_count(rng, mean, maximum):
+    """Intero >= 0 con distribuzione a coda lunga (Pareto) e media circa `mean`"""
+    if mean <= 0:
+        return 0
+    alpha = 2.0
+    # La media di paretovariate(alpha) è alpha / (alpha - 1) = 2
+    value = (rng.paretovariate(alpha) - 1) * mean
+    return min(int(value), maximum)
+
+
+def fake_image(rng, size_kb):
+    """Data URI base64 di una finta immagine JPEG della dimensione richiesta"""
+    payload = b'\xff\xd8\xff\xe0' + rng.randbytes(max(size_kb * 1024 - 4, 0))
+    return 'data:image/jpeg;base64,' + base64.b64encode(payload).decode('ascii')
+
+
+def _bulk_create(model, objects):
+    """
+    bulk_create che garantisce le pk sugli oggetti anche sui database che non le
+    restituiscono (MySQL): le ricava in ordine dopo l'inserimento
+    """
+    if not objects:
+        return objects
+    last_id = model.objects.aggregate(last=Max('id'))['last'] or 0
+    model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+    if objects[0].pk is None:
+        ids = model.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)
+        for obj, pk in zip(objects, ids):
+            obj.pk = pk
+    return objects
+
+
+def _next_user_index(prefix):
+    """
+    Primo numero libero per `<prefix>_<n>`: uno dopo il massimo esistente. Contare gli utenti
+    non basta: dopo una cancellazione il conteggio cade su un nome già usato
+    """
+    head = f'{prefix}_'
+    suffixes = (
+        username[len(head):]
+        for username in User.objects.filter(username__startswith=head).values_list('username', flat=True).iterator()
+    )
+    return max((int(suffix) + 1 for suffix in suffixes if suffix.isdigit()), default=0)
+
+
+def clear_seeded_data(prefix):
+    """Elimina gli utenti generati con il prefisso dato e, a cascata, i loro dati"""
+    return User.objects.filter(username__startswith=f'{prefix}_').delete()
+
+
+@transaction.atomic
+def seed(users=200, posts_per_user=5.0, comments_per_post=3.0, likes_per_post=6.0,
+         image_ratio=0.3, image_kb=64, geo_ratio=0.6, password='happygreen',
+         history_days=365, prefix='seed', random_seed=42, log=None):
+    """
+    Genera utenti, gruppi, iscrizioni, post (con e senza immagine base64), commenti,
+    like, reactions e punteggi di gioco. Restituisce il conteggio per modello.
+    """
+    rng = random.Random(random_seed)
+    log = log or (lambda message: None)
+    password_hash = make_password(password)
+
+    # Utenti
+    start = _next_user_index(prefix)
+    user_objs = [
+        User(
+            username=f'{prefix}_{start + i}',
+            email=f'{prefix}_{start + i}@example.com',
+            first_name=rng.choice(['Giulia', 'Marco', 'Sara', 'Luca', 'Anna', 'Paolo', 'Elena', 'Davide']),
+            last_name=rng.choice(['Rossi', 'Bianchi', 'Verdi', 'Russo', 'Ferrari', 'Esposito', 'Romano']),
+            password=password_hash,
+            email_verified=True,
+            is_active=True,
+        )
+        for i in range(users)
+    ]
+    _bulk_create(User, user_objs)
+    log(f'{len(user_objs)} utenti')
+
+    # Gruppi: circa una classe ogni 25 studenti, con un insegnante proprietario
+    group_count = max(1, users // 25)
+    owners = rng.sample(user_objs, group_count)
+    group_objs = [
+        Group(name=f'Classe {prefix} {i + 1}', description='Gruppo generato per i benchmark', owner=owner)
+        for i, owner in enumerate(owners)
+    ]
+    _bulk_create(Group, group_objs)
+    log(f'{len(group_objs)} gruppi')
+
+    # Iscrizioni: ogni utente in 1-3 gruppi, i gruppi più popolari ne attirano di più
+    group_weights = [1.0 / (rank + 1) for rank in range(group_count)]
+    members_by_group = {group.id: [group.owner] for group in group_objs}
+    member_ids = {group.id: {group.owner.id} for group in group_objs}
+    membership_objs = [GroupMembership(user=group.owner, group=group, role='admin') for group in group_objs]
+    for user in user_objs:
+        wanted = min(group_count, rng.choice([1, 1, 1, 2, 2, 3]))
+        chosen = set()
+        while len(chosen) < wanted:
+            chosen.add(rng.choices(group_objs, weights=group_weights)[0])
+        for group in chosen:
+            if user.id in member_ids[group.id]:
+                continue
+            member_ids[group.id].add(user.id)
+            members_by_group[group.id].append(user)
+            role = 'teacher' if rng.random() < 0.04 else 'student'
+            membership_objs.append(GroupMembership(user=user, group=group, role=role))
+    _bulk_create(GroupMembership, membership_objs)
+    log(f'{len(membership_objs)} iscrizioni')
+
+    groups_by_user = {}
+    for group in group_objs:
+        for member in members_by_group[group.id]:
+            groups_by_user.setdefault(member.id, []).append(group)
+
+    # Post
+    images = [fake_image(rng, image_kb) for _ in range(8)]
+    post_objs = []
+    for user in user_objs:
+        for _ in range(skewed_count(rng, posts_per_user, 200)):
+            latitude = longitude = None
+            if rng.random() < geo_ratio:
+                city_lat, city_lng = rng.choice(CITIES)
+                latitude = city_lat + rng.gauss(0, 0.05)
+                longitude = city_lng + rng.gauss(0, 0.05)
+            post_objs.append(Post(
+                user=user,
+                group=rng.choice(groups_by_user[user.id]),
+                image_url=rng.choice(images) if rng.random() < image_ratio else '',
+                caption=' '.join(rng.sample(CAPTION_WORDS, rng.randint(3, 8))),
+                latitude=latitude,
+                longitude=longitude,
+                # bulk_create non chiama save(): il geohash va calcolato qui
+                geohash=encode_geohash(latitude, longitude) if latitude is not None else None,
+            ))
+    _bulk_create(Post, post_objs)
+
+    # auto_now_add ignora i valori passati a bulk_create: le date si retrodatano dopo,
+    # con più post recenti che vecchi
+    now = timezone.now()
+    for post in post_objs:
+        post.created_at = now - timedelta(days=min(rng.expovariate(1 / (history_days / 4)), history_days))
+    Post.objects.bulk_update(post_objs, ['created_at'], batch_size=BATCH_SIZE)
+    log(f'{len(post_objs)} post')
+
+    # Commenti, like e reactions da membri del gruppo del post
+    reactions = [choice[0] for choice in PostReaction.REACTION_CHOICES]
+    comment_objs = []
+    like_objs = []
+    reaction_objs = []
+    for post in post_objs:
+        members = members_by_group[post.group_id]
+
+        for _ in range(skewed_count(rng, comments_per_post, 300)):
+            comment_objs.append(Comment(post=post, user=rng.choice(members), content=rng.choice(COMMENT_TEXTS)))
+
+        likers = rng.sample(members, min(len(members), skewed_count(rng, likes_per_post, 500)))
+        like_objs.extend(PostLike(post=post, user=liker) for liker in likers)
+
+        reactors = rng.sample(members, min(len(members), skewed_count(rng, likes_per_post / 2, 500)))
+        reaction_objs.extend(
+            PostReaction(post=post, user=reactor, reaction=rng.choice(reactions)) for reactor in reactors
+        )
+
+    _bulk_create(Comment, comment_objs)
+    for comment in comment_objs:
+        comment.created_at = min(comment.post.created_at + timedelta(hours=rng.expovariate(1 / 12)), now)
+    Comment.objects.bulk_update(comment_objs, ['created_at'], batch_size=BATCH_SIZE)
+    PostLike.objects.bulk_create(like_objs, batch_size=BATCH_SIZE)
+    PostReaction.objects.bulk_create(reaction_objs, batch_size=BATCH_SIZE)
+    log(f'{len(comment_objs)} commenti, {len(like_objs)} like, {len(reaction_objs)} reactions')
+
+    # Indice di ricerca
+    group_by_post = {post.id: post.group_id for post in post_objs}
+    tokens = [token for post in post_objs for token in post_tokens(post)]
+    tokens.extend(
+        token for comment in comment_objs for token in comment_tokens(comment, group_by_post[comment.post_id])
+    )
+    SearchToken.objects.bulk_create(tokens, batch_size=BATCH_SIZE)
+
+    # Punteggi di gioco: più partite per gli utenti più attivi
+    score_objs = []
+    eco_points = {}
+    for user in user_objs:
+        best = {}
+        for _ in range(skewed_count(rng, 4, 100)):
+            game_id = rng.choice(GAME_IDS)
+            score = rng.randint(10, 1000)
+            score_objs.append(GameScore(user=user, game_id=game_id, score=score))
+            best[game_id] = max(best.get(game_id, 0), score)
+        if best:
+            user.eco_points = sum(best.values())
+            eco_points[user.id] = user.eco_points
+    GameScore.objects.bulk_create(score_objs, batch_size=BATCH_SIZE)
+    User.objects.bulk_update([user for user in user_objs if user.id in eco_points], ['eco_points'],
+                             batch_size=BATCH_SIZE)
+    log(f'{len(score_objs)} punteggi')
+
+    return {
+        'users': len(user_objs),
+        'groups': len(group_objs),
+        'memberships': len(membership_objs),
+        'posts': len(post_objs),
+        'comments': len(comment_objs),
+        'likes': len(like_objs),
+        'reactions': len(reaction_objs),
+        'game_scores': len(score_objs),
+    }
@@ -1,8 +1,12 @@
 # core/serializers.py - Aggiornato con contatori reali
 
+from django.db import connections, router
 from rest_framework import serializers
 from .models import User, Group, GroupMembership, Post, Comment, DetectedObject, Quiz, Badge, UserBadge, GameScore, \
-    PostLike, PostReaction
+    PostLike, PostReaction, SlowQuery, GroupDetectionStat, Notification
+from .detections import catalog
+from .fieldsets import SparseFieldsetsMixin, apply as apply_fieldset
+from .sharding import shard_for_group
 
 
 class GameScoreSerializer(serializers.ModelSerializer):
@@ -16,7 +20,7 @@ class GameScoreSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'username', 'game_id', 'score', 'timestamp']
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = [
@@ -26,23 +30,48 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['email_verified']
 
 
+# Proiezione ridotta per la rubrica utenti: niente avatar né email
+class UserDirectorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'first_name', 'last_name']
+        read_only_fields = fields
+
+
 # AGGIORNATO: GroupSerializer con contatori reali
-class GroupSerializer(serializers.ModelSerializer):
+class GroupSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     member_count = serializers.SerializerMethodField()
     post_count = serializers.SerializerMethodField()
     owner_name = serializers.SerializerMethodField()
+    # Solo con ?expand=owner_details (vedi core/fieldsets.py)
+    owner_details = UserSerializer(source='owner', read_only=True)
 
     class Meta:
         model = Group
-        fields = ['id', 'name', 'description', 'created_at', 'owner', 'owner_name', 'member_count', 'post_count']
+        fields = [
+            'id', 'name', 'description', 'created_at', 'owner', 'owner_name', 'member_count', 'post_count',
+            'owner_details',
+        ]
+        expandable_fields = ['owner_details']
+        # Colonne lette dai campi calcolati; i conteggi sono annotati dalla view
+        field_columns = {
+            'owner_name': ['owner__first_name', 'owner__last_name', 'owner__username'],
+            'member_count': [],
+            'post_count': [],
+        }
 
     def get_member_count(self, obj):
         """Conta il numero reale di membri nel gruppo"""
+        # Annotato da annotate_group_counts() nelle liste, per evitare una query per gruppo
+        if hasattr(obj, 'member_count'):
+            return obj.member_count
         return GroupMembership.objects.filter(group=obj).count()
 
     def get_post_count(self, obj):
         """Conta il numero reale di post nel gruppo"""
-        return Post.objects.filter(group=obj).count()
+        if hasattr(obj, 'post_count'):
+            return obj.post_count
+        return Post.objects.using(shard_for_group(obj.id)).filter(group=obj).count()
 
     def get_owner_name(self, obj):
         """Restituisce il nome del proprietario"""
@@ -56,7 +85,7 @@ class GroupMembershipSerializer(serializers.ModelSerializer):
 
 
 # NUOVO: Serializer per PostLike
-class PostLikeSerializer(serializers.ModelSerializer):
+class PostLikeSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
     class Meta:
@@ -65,7 +94,7 @@ class PostLikeSerializer(serializers.ModelSerializer):
 
 
 # NUOVO: Serializer per PostReaction
-class PostReactionSerializer(serializers.ModelSerializer):
+class PostReactionSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
     class Meta:
@@ -74,14 +103,14 @@ class PostReactionSerializer(serializers.ModelSerializer):
 
 
 # AGGIORNATO: Serializer per Comment con user details
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
 
         # Formatta la data in ISO format
-        if instance.created_at:
+        if 'created_at' in representation and instance.created_at:
             representation['created_at'] = instance.created_at.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
 
         return representation
@@ -91,12 +120,76 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = ['id', 'post', 'user', 'content', 'created_at']
 
 
+# Commenti più recenti inclusi in ogni post: il thread completo è in /posts/<id>/comments/
+LATEST_COMMENTS = 3
+
+
+def attach_comment_previews(posts, limit=LATEST_COMMENTS):
+    """
+    Imposta su ogni post `latest_comments` (gli ultimi `limit` commenti, in ordine cronologico)
+    e `comments_total`. Il top-N per post e il totale sono calcolati con funzioni finestra
+    in una sola query sui post della pagina, poi una query carica i commenti con gli utenti
+    """
+    posts = [post for post in posts if not hasattr(post, 'latest_comments')]
+    if not posts:
+        return
+
+    # Con lo sharding i post possono venire da database diversi
+    by_database = {}
+    for post in posts:
+        by_database.setdefault(post._state.db, []).append(post)
+    for database_posts in by_database.values():
+        _attach_comment_previews(database_posts, limit)
+
+
+def _attach_comment_previews(posts, limit):
+    post_ids = [post.id for post in posts]
+    placeholders = ', '.join(['%s'] * len(post_ids))
+    # Stesso database dei post: la replica per le GET (vedi core/db_routers.py) o il loro shard
+    alias = router.db_for_read(Comment, instance=posts[0])
+    with connections[alias].cursor() as cursor:
+        cursor.execute(f"""
+            SELECT id, post_id, total FROM (
+                SELECT
+                    id,
+                    post_id,
+                    ROW_NUMBER() OVER (PARTITION BY post_id ORDER BY created_at DESC, id DESC) AS position,
+                    COUNT(*) OVER (PARTITION BY post_id) AS total
+                FROM core_comment
+                WHERE post_id IN ({placeholders})
+            ) ranked
+            WHERE position <= %s
+        """, [*post_ids, limit])
+        rows = cursor.fetchall()
+
+    totals = {post_id: total for _, post_id, total in rows}
+    latest = {post_id: [] for post_id in post_ids}
+    if rows:
+        for comment in Comment.objects.using(alias).filter(id__in=[row[0] for row in rows]).select_related('user'):
+            latest[comment.post_id].append(comment)
+
+    for post in posts:
+        post.latest_comments = latest[post.id]
+        post.comments_total = totals.get(post.id, 0)
+
+
+class PostListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        posts = list(data.all() if hasattr(data, 'all') else data)
+        if 'comments' in self.child.fields or 'comment_count' in self.child.fields:
+            attach_comment_previews(posts)
+        return super().to_representation(posts)
+
+
 # AGGIORNATO: Serializer per Post con like, reactions e commenti
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
-    comments = CommentSerializer(many=True, read_only=True)
+    # Solo gli ultimi LATEST_COMMENTS commenti, vedi attach_comment_previews
+    comments = serializers.SerializerMethodField()
     likes = PostLikeSerializer(many=True, read_only=True)
     reactions = PostReactionSerializer(many=True, read_only=True)
+    # Solo con ?expand=detected_objects (vedi core/fieldsets.py)
+    detected_objects = serializers.SerializerMethodField()
 
     # Campi calcolati
     like_count = serializers.SerializerMethodField()
@@ -108,21 +201,38 @@ class PostSerializer(serializers.ModelSerializer):
         return obj.likes.count()
 
     def get_comment_count(self, obj):
+        if hasattr(obj, 'comments_total'):
+            return obj.comments_total
         return obj.comments.count()
 
+    def get_comments(self, obj):
+        if hasattr(obj, 'latest_comments'):
+            comments = obj.latest_comments
+        else:
+            comments = obj.comments.select_related('user').order_by('-created_at', '-id')[:LATEST_COMMENTS]
+        comments = sorted(comments, key=lambda comment: (comment.created_at, comment.id))
+        serializer = CommentSerializer(comments, many=True, context=self.context)
+        return apply_fieldset(serializer, self.fieldset and self.fieldset.child('comments')).data
+
+    def get_detected_objects(self, obj):
+        serializer = DetectedObjectSerializer(obj.detectedobject_set.all(), many=True, context=self.context)
+        return apply_fieldset(serializer, self.fieldset and self.fieldset.child('detected_objects')).data
+
     def get_user_liked(self, obj):
         """Verifica se l'utente corrente ha messo like al post"""
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.likes.filter(user=request.user).exists()
+            # Scorre i like già prefetchati invece di fare una query per post
+            return any(like.user_id == request.user.id for like in obj.likes.all())
         return False
 
     def get_user_reaction(self, obj):
         """Ottiene la reaction dell'utente corrente al post"""
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            reaction = obj.reactions.filter(user=request.user).first()
-            return reaction.reaction if reaction else None
+            for reaction in obj.reactions.all():
+                if reaction.user_id == request.user.id:
+                    return reaction.reaction
         return None
 
     # Aggiungiamo metodi per formattare le date
@@ -130,33 +240,66 @@ class PostSerializer(serializers.ModelSerializer):
         representation = super().to_representation(instance)
 
         # Formatta le date in ISO format con timezone
-        if instance.created_at:
+        # (le date dei commenti sono già formattate da CommentSerializer)
+        if 'created_at' in representation and instance.created_at:
             representation['created_at'] = instance.created_at.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
 
-        # Formatta le date dei commenti
-        if 'comments' in representation:
-            for comment in representation['comments']:
-                if 'created_at' in comment:
-                    # Recupera l'oggetto comment per formattare la data
-                    comment_obj = instance.comments.filter(id=comment['id']).first()
-                    if comment_obj:
-                        comment['created_at'] = comment_obj.created_at.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-
         return representation
 
     class Meta:
         model = Post
+        list_serializer_class = PostListSerializer
         fields = [
             'id', 'user', 'group', 'image_url', 'caption', 'latitude', 'longitude',
             'created_at', 'comments', 'likes', 'reactions', 'like_count',
-            'comment_count', 'user_liked', 'user_reaction'
+            'comment_count', 'user_liked', 'user_reaction', 'detected_objects'
         ]
-
-
-class DetectedObjectSerializer(serializers.ModelSerializer):
+        expandable_fields = ['detected_objects']
+        # Relazioni lette dai campi che non sono colonne del post (vedi core/fieldsets.py);
+        # i commenti li carica attach_comment_previews
+        field_columns = {'comments': [], 'comment_count': []}
+        field_prefetches = {
+            'likes': ['likes__user'],
+            'like_count': ['likes'],
+            'user_liked': ['likes'],
+            'reactions': ['reactions__user'],
+            'user_reaction': ['reactions'],
+            'detected_objects': ['detectedobject_set'],
+        }
+
+
+class DetectedObjectSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     class Meta:
         model = DetectedObject
         fields = '__all__'
+        read_only_fields = ['tip']
+        field_columns = {
+            'description': ['description', 'tip'],
+            'recycle_tips': ['recycle_tips', 'tip'],
+        }
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Testi dal catalogo in memoria quando l'oggetto non ne ha di propri
+        description, recycle_tips = catalog.texts(instance)
+        if 'description' in data:
+            data['description'] = description
+        if 'recycle_tips' in data:
+            data['recycle_tips'] = recycle_tips
+        return data
+
+
+class DetectionItemSerializer(serializers.Serializer):
+    """Un oggetto rilevato nel caricamento in blocco; i testi sono facoltativi se l'etichetta è nel catalogo"""
+    label = serializers.CharField(max_length=100)
+    description = serializers.CharField(required=False, allow_blank=True)
+    recycle_tips = serializers.CharField(required=False, allow_blank=True)
+
+
+class GroupDetectionStatSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GroupDetectionStat
+        fields = ['label', 'count']
 
 
 class QuizSerializer(serializers.ModelSerializer):
@@ -185,7 +328,7 @@ class LeaderboardUserSerializer(serializers.ModelSerializer):
 
 # serializers.py - Aggiungiamo nuovi serializers
 
-class GroupMembershipDetailSerializer(serializers.ModelSerializer):
+class GroupMembershipDetailSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
     class Meta:
@@ -193,7 +336,7 @@ class GroupMembershipDetailSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'role', 'joined_at']
 
 
-class GroupDetailSerializer(serializers.ModelSerializer):
+class GroupDetailSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     members = serializers.SerializerMethodField()
     owner_details = UserSerializer(source='owner', read_only=True)
     member_count = serializers.SerializerMethodField()
@@ -203,15 +346,53 @@ class GroupDetailSerializer(serializers.ModelSerializer):
         model = Group
         fields = ['id', 'name', 'description', 'created_at', 'owner', 'owner_details', 'members', 'member_count',
                   'post_count']
+        field_columns = {'members': [], 'member_count': [], 'post_count': []}
 
     def get_members(self, obj):
-        memberships = GroupMembership.objects.filter(group=obj)
-        return GroupMembershipDetailSerializer(memberships, many=True).data
+        memberships = GroupMembership.objects.filter(group=obj).select_related('user')
+        serializer = GroupMembershipDetailSerializer(memberships, many=True)
+        return apply_fieldset(serializer, self.fieldset and self.fieldset.child('members')).data
 
     def get_member_count(self, obj):
         """Conta il numero reale di membri nel gruppo"""
+        if hasattr(obj, 'member_count'):
+            return obj.member_count
         return GroupMembership.objects.filter(group=obj).count()
 
     def get_post_count(self, obj):
         """Conta il numero reale di post nel gruppo"""
-        return Post.objects.filter(group=obj).count()
\ No newline at end of file
+        if hasattr(obj, 'post_count'):
+            return obj.post_count
+        return Post.objects.using(shard_for_group(obj.id)).filter(group=obj).count()
+
+
+class SlowQuerySerializer(serializers.ModelSerializer):
+    avg_ms = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SlowQuery
+        fields = ['id', 'fingerprint', 'sample_sql', 'explain', 'origin', 'routes', 'count', 'total_ms', 'avg_ms',
+                  'max_ms', 'first_seen', 'last_seen']
+
+    def get_avg_ms(self, obj):
+        return obj.total_ms / obj.count if obj.count else 0
+
+
+class NotificationSerializer(serializers.ModelSerializer):
+    last_actor = serializers.CharField(source='last_actor.username', read_only=True, default=None)
+    message = serializers.SerializerMethodField()
+
+    MESSAGES = {
+        'like': ('{actor} ha messo like al tuo post', '{count} persone hanno messo like al tuo post'),
+        'reaction': ('{actor} ha reagito al tuo post', '{count} reaction al tuo post'),
+        'comment': ('{actor} ha commentato il tuo post', '{count} nuovi commenti al tuo post'),
+    }
+
+    class Meta:
+        model = Notification
+        fields = ['id', 'kind', 'post', 'count', 'last_actor', 'message', 'is_read', 'updated_at']
+
+    def get_message(self, obj):
+        single, many = self.MESSAGES[obj.kind]
+        actor = obj.last_actor.username if obj.last_actor else 'Qualcuno'
+        return (single if obj.count == 1 else many).format(actor=actor, count=obj.count)
@@ -0,0 +1,573 @@
+# core/sharding.py - Sharding facoltativo per gruppo di post, commenti, like e reaction
+#
+# Con settings.HAPPYGREEN_SHARDS['ALIASES'] (almeno due alias, il primo `default`) le righe
+# di Post, Comment, PostLike, PostReaction, DetectedObject e SearchToken di un gruppo stanno
+# sul database indicato da GroupShard; i gruppi senza riga (quelli creati prima dello
+# sharding) restano su `default`. I gruppi nuovi vanno sullo shard con meno gruppi.
+#
+# - Tutti gli altri modelli restano su `default`. Utenti, gruppi e catalogo dei consigli sono
+#   copiati su ogni shard dopo ogni salvataggio, così chiavi esterne, cascate e JOIN (select_related,
+#   values('user__username')) funzionano anche sugli shard.
+# - ShardedViewMixin attiva lo shard della richiesta (dal post/commento dell'URL o dal gruppo);
+#   le richieste su più gruppi leggono ogni shard con scatter() e uniscono i risultati.
+# - Gli id restano unici tra gli shard: su MySQL/MariaDB e PostgreSQL ogni shard usa i valori
+#   ≡ posizione+1 (mod ID_STRIDE), su SQLite (solo sviluppo) blocchi di ID_BLOCK id.
+#   `manage.py reshard_group --prepare` imposta le sequenze e copia le tabelle condivise.
+# - `manage.py reshard_group <gruppo> <alias>` sposta un gruppo senza fermare il servizio:
+#   copia, sospende per poco le scritture del gruppo, copia le differenze e cambia lo shard.
+#
+# Senza configurazione (o con un solo alias) non cambia nulla: nessuna query in più.
+
+import contextlib
+import contextvars
+import copy
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import (
+    Comment, DetectedObject, Group, GroupShard, Notification, Post, PostLike, PostReaction, RecyclingTip,
+    SearchToken, User,
+)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+DEFAULTS = {
+    # Alias dei database con i dati dei gruppi, il primo deve essere `default`
+    'ALIASES': [],
+    # Ogni quanto ogni processo rilegge la mappa gruppo -> shard
+    'MAP_TTL_SECONDS': 30,
+    'ID_STRIDE': 16,
+    'ID_BLOCK': 10 ** 12,
+}
+
+# Modelli con i dati dei gruppi, nell'ordine di copia (prima i genitori), e campo del gruppo
+SHARDED_MODELS = {
+    Post: 'group_id',
+    Comment: 'post__group_id',
+    PostLike: 'post__group_id',
+    PostReaction: 'post__group_id',
+    DetectedObject: 'post__group_id',
+    SearchToken: 'group_id',
+}
+# Righe che possono cambiare dopo l'inserimento: durante lo spostamento vengono ricopiate
+MUTABLE_MODELS = {Post, Comment, PostReaction, DetectedObject}
+# Copiati su ogni shard
+REFERENCE_MODELS = (User, Group, RecyclingTip)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'HAPPYGREEN_SHARDS', {})}
+
+
+def shard_aliases():
+    return list(get_config()['ALIASES'])
+
+
+def enabled():
+    return len(shard_aliases()) > 1
+
+
+def data_aliases():
+    """Alias da leggere per i ricalcoli completi: tutti gli shard, [None] (router) senza sharding"""
+    return shard_aliases() if enabled() else [None]
+
+
+def is_sharded(model):
+    return model in SHARDED_MODELS
+
+
+class ShardingError(Exception):
+    pass
+
+
+class GroupMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Il gruppo è in fase di spostamento, riprova tra qualche secondo'
+    default_code = 'group_moving'
+
+
+_active = contextvars.ContextVar('happygreen_shard', default=None)
+_moving = contextvars.ContextVar('happygreen_shard_moving', default=False)
+
+
+@contextlib.contextmanager
+def activate(alias):
+    """Manda su `alias` le query dei modelli shardati del blocco (None = nessuno shard attivo)"""
+    token = _active.set(alias)
+    try:
+        yield
+    finally:
+        _active.reset(token)
+
+
+def activate_for(instance):
+    """activate() sullo shard da cui è stata letta `instance`; nessun effetto senza sharding"""
+    return activate(instance._state.db if enabled() else None)
+
+
+def scattered():
+    """True se la richiesta corrente riguarda più shard (sharding attivo e nessuno shard scelto)"""
+    return enabled() and _active.get() is None
+
+
+class ShardMap:
+    """Mappa gruppo -> (alias, sospeso) da GroupShard, riletta al massimo ogni MAP_TTL_SECONDS"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._groups = {}
+
+    def _ensure_loaded(self):
+        with self._lock:
+            ttl = get_config()['MAP_TTL_SECONDS']
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < ttl:
+                return
+            # Sempre dal primario: una replica in ritardo vedrebbe tardi le sospensioni
+            rows = GroupShard.objects.using(DEFAULT_DB_ALIAS).values_list('group_id', 'alias', 'frozen')
+            self._groups = {group_id: (alias, frozen) for group_id, alias, frozen in rows}
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self, **kwargs):
+        with self._lock:
+            self._loaded_at = None
+
+    def _entry(self, group_id):
+        self._ensure_loaded()
+        entry = self._groups.get(group_id)
+        if entry is None:
+            # Gruppo creato da un altro processo dopo l'ultima lettura, o mai assegnato (default)
+            row = GroupShard.objects.using(DEFAULT_DB_ALIAS).filter(group_id=group_id).values_list(
+                'alias', 'frozen'
+            ).first()
+            entry = tuple(row) if row else (DEFAULT_DB_ALIAS, False)
+            with self._lock:
+                self._groups[group_id] = entry
+        return entry
+
+    def alias_for(self, group_id):
+        return self._entry(group_id)[0]
+
+    def is_frozen(self, group_id):
+        return self._entry(group_id)[1]
+
+    def groups_on(self, alias):
+        """Gruppi assegnati esplicitamente ad `alias`"""
+        self._ensure_loaded()
+        return [group_id for group_id, (other, _) in self._groups.items() if other == alias]
+
+    def groups_off_default(self):
+        self._ensure_loaded()
+        return [group_id for group_id, (alias, _) in self._groups.items() if alias != DEFAULT_DB_ALIAS]
+
+    def frozen_groups(self):
+        self._ensure_loaded()
+        return [group_id for group_id, (_, frozen) in self._groups.items() if frozen]
+
+    def place(self, group_id):
+        """Assegna un gruppo nuovo allo shard con meno gruppi. Restituisce l'alias"""
+        counts = Counter(dict(
+            GroupShard.objects.using(DEFAULT_DB_ALIAS).values_list('alias').annotate(total=Count('pk')).order_by()
+        ))
+        # I gruppi senza riga stanno su default
+        counts[DEFAULT_DB_ALIAS] += Group.objects.using(DEFAULT_DB_ALIAS).filter(shard__isnull=True).exclude(
+            pk=group_id
+        ).count()
+        alias = min(shard_aliases(), key=lambda candidate: counts[candidate])
+        GroupShard.objects.using(DEFAULT_DB_ALIAS).create(group_id=group_id, alias=alias)
+        return alias
+
+
+shard_map = ShardMap()
+
+post_save.connect(shard_map.invalidate, sender=GroupShard, dispatch_uid='shard_map_save')
+post_delete.connect(shard_map.invalidate, sender=GroupShard, dispatch_uid='shard_map_delete')
+
+
+def shard_for_group(group_id):
+    """Alias del gruppo, None senza sharding (decide il router: `default` o una replica)"""
+    if not enabled():
+        return None
+    return shard_map.alias_for(int(group_id))
+
+
+def for_group(group_id):
+    """(alias, group_id) per un id di gruppo preso dalla richiesta, (None, None) se non valido"""
+    try:
+        group_id = int(group_id)
+    except (TypeError, ValueError):
+        return None, None
+    return shard_map.alias_for(group_id), group_id
+
+
+def locate(model, pk):
+    """
+    (alias, group_id) della riga `pk` di un modello shardato, cercandola sugli shard;
+    (None, None) se non esiste. L'alias è quello della mappa: durante uno spostamento
+    la riga può trovarsi su entrambi i database
+    """
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return None, None
+    for alias in shard_aliases():
+        group_id = model.objects.using(alias).filter(pk=pk).values_list(SHARDED_MODELS[model], flat=True).first()
+        if group_id is not None:
+            return shard_map.alias_for(group_id), group_id
+    return None, None
+
+
+def check_writable(group_id):
+    """Solleva GroupMoving se le scritture del gruppo sono sospese per uno spostamento"""
+    if enabled() and shard_map.is_frozen(group_id):
+        raise GroupMoving()
+
+
+def scatter(queryset, field='group_id', limit=None):
+    """
+    Esegue `queryset` su ogni shard, ristretto ai gruppi che vi risiedono (le copie di un
+    gruppo in spostamento non vengono lette due volte), e restituisce i risultati in una lista.
+    Al massimo `limit` righe per shard: l'ordinamento finale e il taglio spettano al chiamante
+    """
+    if not enabled():
+        return list(queryset if limit is None else queryset[:limit])
+
+    results = []
+    for alias in shard_aliases():
+        local = resident(queryset, alias, field)
+        if local is not None:
+            results.extend(local if limit is None else local[:limit])
+    return results
+
+
+def resident(queryset, alias, field='group_id'):
+    """`queryset` su `alias` ristretto ai gruppi che vi risiedono, None se lo shard non ne ha"""
+    local = queryset.using(alias)
+    if alias == DEFAULT_DB_ALIAS:
+        elsewhere = shard_map.groups_off_default()
+        return local.exclude(**{f'{field}__in': elsewhere}) if elsewhere else local
+    groups = shard_map.groups_on(alias)
+    return local.filter(**{f'{field}__in': groups}) if groups else None
+
+
+@contextlib.contextmanager
+def atomic(*aliases):
+    """
+    transaction.atomic() su `default` e sugli shard indicati (di default quello attivo).
+    Non è un commit a due fasi: ogni database conferma la sua parte. `default` conferma per
+    primo, così le righe condivise copiate dopo il suo commit (es. un nuovo RecyclingTip)
+    entrano nella transazione ancora aperta dello shard che le usa
+    """
+    with contextlib.ExitStack() as stack:
+        if enabled():
+            for alias in dict.fromkeys(aliases or [_active.get()]):
+                if alias not in (None, DEFAULT_DB_ALIAS):
+                    stack.enter_context(transaction.atomic(using=alias))
+        stack.enter_context(transaction.atomic())
+        yield
+
+
+class ShardRouter:
+    """
+    Primo router: decide il database dei modelli shardati; per gli altri modelli (e senza
+    sharding) restituisce None e decidono i router successivi (ReplicaRouter)
+    """
+
+    def _alias(self, model, hints):
+        if not is_sharded(model) or not enabled():
+            return None
+        instance = hints.get('instance')
+        if instance is not None and is_sharded(type(instance)) and instance._state.db is not None:
+            return instance._state.db
+        alias = _active.get()
+        if alias is not None:
+            return alias
+        if isinstance(instance, Post) and instance.group_id is not None:
+            return shard_map.alias_for(instance.group_id)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._alias(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._alias(model, hints)
+
+
+class ShardedViewMixin:
+    """
+    Per i ViewSet dei dati dei gruppi: shard_for_request() sceglie lo shard della richiesta,
+    attivo da initial() a finalize_response(). Rifiuta con 503 le scritture dei gruppi sospesi
+    """
+
+    def shard_for_request(self, request):
+        """(alias, group_id) della richiesta; (None, None) se riguarda più gruppi"""
+        return None, None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not enabled():
+            return
+        alias, group_id = self.shard_for_request(request)
+        if group_id is not None and request.method not in SAFE_METHODS:
+            check_writable(group_id)
+        self._shard_token = _active.set(alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_shard_token', None)
+        if token is not None:
+            self._shard_token = None
+            _active.reset(token)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+# --- Tabelle condivise copiate sugli shard ---
+
+def _other_shards():
+    return [alias for alias in shard_aliases() if alias != DEFAULT_DB_ALIAS]
+
+
+def _replicate_saved(sender, instance, created, raw, using, **kwargs):
+    if raw or using != DEFAULT_DB_ALIAS or not enabled():
+        return
+    if created and sender is Group:
+        shard_map.place(instance.pk)
+    row = copy.copy(instance)
+
+    def replicate():
+        for alias in _other_shards():
+            # raw: stessi valori (anche le date automatiche), UPDATE e se manca INSERT
+            row.save_base(using=alias, raw=True)
+
+    transaction.on_commit(replicate, using=using)
+
+
+def _replicate_deleted(sender, instance, using, **kwargs):
+    if using != DEFAULT_DB_ALIAS or not enabled():
+        return
+    pk = instance.pk
+
+    def replicate():
+        for alias in _other_shards():
+            # Sullo shard la cascata cancella anche post, commenti, like e reaction collegati
+            sender._base_manager.using(alias).filter(pk=pk).delete()
+
+    transaction.on_commit(replicate, using=using)
+
+
+def replicate_rows(model, queryset):
+    """Copia subito sugli shard le righe condivise inserite senza segnali (bulk_create)"""
+    if not enabled():
+        return
+    for alias in _other_shards():
+        _copy_rows(model, list(queryset.using(DEFAULT_DB_ALIAS)), alias)
+
+
+for _model in REFERENCE_MODELS:
+    post_save.connect(_replicate_saved, sender=_model, dispatch_uid=f'shard_replicate_save_{_model.__name__}')
+    post_delete.connect(_replicate_deleted, sender=_model, dispatch_uid=f'shard_replicate_delete_{_model.__name__}')
+
+
+def _drop_notifications(sender, instance, using, **kwargs):
+    """Le notifiche stanno su default: la cascata di un post cancellato su uno shard non le raggiunge"""
+    if using == DEFAULT_DB_ALIAS or not enabled() or _moving.get():
+        return
+    Notification.objects.using(DEFAULT_DB_ALIAS).filter(post_id=instance.pk).delete()
+
+
+post_delete.connect(_drop_notifications, sender=Post, dispatch_uid='shard_drop_notifications')
+
+
+def _configure_connection(sender, connection, **kwargs):
+    """MySQL/MariaDB: id di ogni shard nella sua classe di resto (impostazione di sessione)"""
+    if connection.vendor != 'mysql' or not enabled() or connection.alias not in shard_aliases():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SET SESSION auto_increment_increment = %s, auto_increment_offset = %s',
+            [get_config()['ID_STRIDE'], shard_aliases().index(connection.alias) + 1]
+        )
+
+
+connection_created.connect(_configure_connection, dispatch_uid='shard_configure_connection')
+
+
+# --- Preparazione degli shard e spostamento dei gruppi ---
+
+def _copy_rows(model, rows, alias):
+    """Inserisce o aggiorna su `alias` le righe `rows` con le stesse pk e le stesse date"""
+    if not rows:
+        return
+    stamped = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    # bulk_create riscrive le date automatiche: vengono ripristinate dopo, come in core/seeding.py
+    stamps = [[getattr(row, field.attname) for field in stamped] for row in rows]
+    options = {
+        'update_conflicts': True,
+        'update_fields': [field.name for field in model._meta.concrete_fields if not field.primary_key],
+    }
+    if connections[alias].features.supports_update_conflicts_with_target:
+        options['unique_fields'] = [model._meta.pk.name]
+    model._base_manager.using(alias).bulk_create(rows, **options)
+    if stamped:
+        for row, values in zip(rows, stamps):
+            for field, value in zip(stamped, values):
+                setattr(row, field.attname, value)
+        model._base_manager.using(alias).bulk_update(rows, [field.name for field in stamped])
+
+
+def sync_reference_tables(alias, batch_size=1000):
+    """Copia su `alias` utenti, gruppi e catalogo dei consigli di default. Restituisce le righe copiate"""
+    copied = 0
+    for model in REFERENCE_MODELS:
+        last_pk = 0
+        while True:
+            rows = list(model._base_manager.using(DEFAULT_DB_ALIAS).filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not rows:
+                break
+            _copy_rows(model, rows, alias)
+            copied += len(rows)
+            last_pk = rows[-1].pk
+    return copied
+
+
+def prepare_ids(alias):
+    """Fa ripartire gli id dei modelli shardati di `alias` dalla sua classe di resto (o blocco)"""
+    config = get_config()
+    aliases = shard_aliases()
+    if len(aliases) > config['ID_STRIDE']:
+        raise ShardingError(f"Al massimo {config['ID_STRIDE']} shard (ID_STRIDE)")
+    index = aliases.index(alias)
+    connection = connections[alias]
+
+    with connection.cursor() as cursor:
+        for model in SHARDED_MODELS:
+            table = model._meta.db_table
+            if connection.vendor == 'sqlite':
+                top = model._base_manager.using(alias).aggregate(top=Max('pk'))['top'] or 0
+                start = max(top, index * config['ID_BLOCK'])
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [start, table])
+                if cursor.rowcount == 0:
+                    cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, start])
+                continue
+
+            # Sopra tutti gli id già usati su qualsiasi shard, nella classe di resto dello shard
+            top = max(model._base_manager.using(other).aggregate(top=Max('pk'))['top'] or 0 for other in aliases)
+            stride = config['ID_STRIDE']
+            start = top + 1 + (index + 1 - (top + 1)) % stride
+            if connection.vendor == 'mysql':
+                cursor.execute(f'ALTER TABLE {connection.ops.quote_name(table)} AUTO_INCREMENT = {start}')
+            elif connection.vendor == 'postgresql':
+                cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+                sequence = cursor.fetchone()[0]
+                cursor.execute(f'ALTER SEQUENCE {sequence} INCREMENT BY {stride} RESTART WITH {start}')
+            else:
+                raise ShardingError(f'Database {connection.vendor} non supportato per lo sharding')
+
+
+def prepare(alias):
+    """Prepara uno shard (dopo `migrate --database alias`). Restituisce le righe condivise copiate"""
+    prepare_ids(alias)
+    if alias == DEFAULT_DB_ALIAS:
+        return 0
+    return sync_reference_tables(alias)
+
+
+def _group_rows(model, alias, group_id):
+    return model._base_manager.using(alias).filter(**{SHARDED_MODELS[model]: group_id})
+
+
+def _copy_group(model, group_id, source, target, pks, batch_size):
+    for start in range(0, len(pks), batch_size):
+        batch = pks[start:start + batch_size]
+        clash = model._base_manager.using(target).filter(pk__in=batch).exclude(**{SHARDED_MODELS[model]: group_id})
+        if clash.exists():
+            raise ShardingError(
+                f'{model.__name__}: id già usati su {target} da un altro gruppo, eseguire prima --prepare'
+            )
+        _copy_rows(model, list(model._base_manager.using(source).filter(pk__in=batch).order_by('pk')), target)
+
+
+def move_group(group_id, target, batch_size=500, wait=None, log=print):
+    """
+    Sposta le righe del gruppo sullo shard `target` mantenendo le pk:
+    1. copia tutto mentre il gruppo resta scrivibile;
+    2. sospende le scritture del gruppo e aspetta `wait` secondi (MAP_TTL_SECONDS), così tutti
+       i processi vedono la sospensione;
+    3. copia le differenze (righe nuove e modificabili, cancella quelle sparite);
+    4. cambia lo shard nella mappa e riapre le scritture; dopo altri `wait` secondi
+    5. cancella le righe dal vecchio shard.
+    Le letture continuano per tutto il tempo. Restituisce le righe copiate per modello
+    """
+    if target not in shard_aliases():
+        raise ShardingError(f'{target} non è uno shard configurato')
+    if not Group.objects.using(DEFAULT_DB_ALIAS).filter(pk=group_id).exists():
+        raise ShardingError(f'Gruppo {group_id} inesistente')
+    shard_map.invalidate()
+    source = shard_map.alias_for(group_id)
+    if source == target:
+        raise ShardingError(f'Il gruppo {group_id} è già su {target}')
+    if wait is None:
+        wait = get_config()['MAP_TTL_SECONDS']
+
+    # Gli utenti del gruppo devono esistere sullo shard di destinazione
+    sync_reference_tables(target)
+
+    copied = {}
+    for model in SHARDED_MODELS:
+        pks = list(_group_rows(model, source, group_id).order_by('pk').values_list('pk', flat=True))
+        _copy_group(model, group_id, source, target, pks, batch_size)
+        copied[model.__name__] = len(pks)
+        log(f'{model.__name__}: {len(pks)} righe copiate')
+
+    GroupShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        group_id=group_id, defaults={'alias': source, 'frozen': True}
+    )
+    log(f'Scritture del gruppo sospese, attesa di {wait} secondi')
+    time.sleep(wait)
+
+    try:
+        for model in reversed(list(SHARDED_MODELS)):
+            source_pks = set(_group_rows(model, source, group_id).values_list('pk', flat=True))
+            gone = list(set(_group_rows(model, target, group_id).values_list('pk', flat=True)) - source_pks)
+            for start in range(0, len(gone), batch_size):
+                model._base_manager.using(target).filter(pk__in=gone[start:start + batch_size]).delete()
+        for model in SHARDED_MODELS:
+            pks = sorted(_group_rows(model, source, group_id).values_list('pk', flat=True))
+            if model not in MUTABLE_MODELS:
+                present = set(_group_rows(model, target, group_id).values_list('pk', flat=True))
+                pks = [pk for pk in pks if pk not in present]
+            _copy_group(model, group_id, source, target, pks, batch_size)
+        log('Differenze copiate')
+    except Exception:
+        GroupShard.objects.using(DEFAULT_DB_ALIAS).filter(group_id=group_id).update(frozen=False)
+        shard_map.invalidate()
+        raise
+
+    GroupShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        group_id=group_id, defaults={'alias': target, 'frozen': False}
+    )
+    log(f'Gruppo {group_id} ora su {target}, attesa di {wait} secondi prima di pulire {source}')
+    time.sleep(wait)
+
+    token = _moving.set(True)
+    try:
+        pks = list(_group_rows(Post, source, group_id).values_list('pk', flat=True))
+        for start in range(0, len(pks), batch_size):
+            # La cascata cancella commenti, like, reaction, oggetti rilevati e token
+            Post._base_manager.using(source).filter(pk__in=pks[start:start + batch_size]).delete()
+        SearchToken._base_manager.using(source).filter(group_id=group_id).delete()
+    finally:
+        _moving.reset(token)
+    log(f'Righe rimosse da {source}')
+    return copied
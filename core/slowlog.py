@@ -0,0 +1,119 @@
+# core/slowlog.py - Log delle query lente aggregato per impronta, con piano EXPLAIN
+#
+# SlowQueryMiddleware installa un execute wrapper che tiene da parte le query più lente di
+# THRESHOLD_MS. A risposta pronta le query vengono salvate in SlowQuery, una riga per
+# impronta (vedi core.querylog.normalize_sql), con la rotta che le ha eseguite e il piano
+# EXPLAIN catturato la prima volta e a ogni nuovo massimo di durata.
+
+import hashlib
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.utils import timezone
+
+from .querylog import normalize_sql, project_origin
+
+logger = logging.getLogger(__name__)
+
+# Frame da ignorare nel cercare l'origine: il wrapper stesso e i middleware di strumentazione
+_CORE_DIR = os.path.dirname(os.path.abspath(__file__))
+_SKIP_FILES = tuple(os.path.join(_CORE_DIR, name) for name in ('slowlog.py', 'middleware.py', 'profiling.py'))
+
+DEFAULTS = {
+    'ENABLED': True,
+    'THRESHOLD_MS': 200,
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'HAPPYGREEN_SLOW_QUERIES', {}))
+    return config
+
+
+def fingerprint_hash(fingerprint):
+    return hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+
+
+class SlowQueryCollector:
+    """Execute wrapper che tiene da parte le query più lente della soglia"""
+
+    def __init__(self, threshold_ms):
+        self.threshold = threshold_ms / 1000
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            if duration >= self.threshold and not many:
+                self.queries.append({
+                    'sql': sql,
+                    'params': params,
+                    'duration_ms': duration * 1000,
+                    'origin': project_origin(_SKIP_FILES),
+                    # Replica o shard su cui è girata: l'EXPLAIN va fatto lì
+                    'alias': context['connection'].alias,
+                })
+
+
+def explain_rows(sql, params, using=DEFAULT_DB_ALIAS):
+    """
+    Piano di esecuzione di una SELECT sul database `using` come (colonne, righe).
+    None per le altre query o se fallisce
+    """
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    connection = connections[using]
+    try:
+        # Savepoint: su PostgreSQL un errore interromperebbe la transazione della richiesta
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            return [column[0] for column in cursor.description], cursor.fetchall()
+    except DatabaseError as e:
+        logger.warning(f'EXPLAIN fallito: {e}')
+        return None
+
+
+def explain(sql, params, using=DEFAULT_DB_ALIAS):
+    """Piano di esecuzione di una SELECT come testo, stringa vuota se non disponibile"""
+    plan = explain_rows(sql, params, using)
+    if plan is None:
+        return ''
+    columns, rows = plan
+    lines = ['\t'.join(columns)]
+    lines.extend('\t'.join('' if value is None else str(value) for value in row) for row in rows)
+    return '\n'.join(lines)
+
+
+def record_slow_queries(queries, route):
+    """Aggrega le query lente di una richiesta nelle righe SlowQuery"""
+    from .models import SlowQuery
+
+    by_fingerprint = {}
+    for query in queries:
+        by_fingerprint.setdefault(normalize_sql(query['sql']), []).append(query)
+
+    now = timezone.now()
+    for fingerprint, samples in by_fingerprint.items():
+        slowest = max(samples, key=lambda query: query['duration_ms'])
+        with transaction.atomic():
+            entry, created = SlowQuery.objects.select_for_update().get_or_create(
+                fingerprint_hash=fingerprint_hash(fingerprint),
+                defaults={'fingerprint': fingerprint, 'last_seen': now},
+            )
+            if created or slowest['duration_ms'] > entry.max_ms:
+                entry.max_ms = slowest['duration_ms']
+                entry.sample_sql = slowest['sql']
+                entry.origin = (slowest['origin'] or '')[:255]
+                entry.explain = explain(slowest['sql'], slowest['params'], slowest['alias'])
+            entry.count += len(samples)
+            entry.total_ms += sum(query['duration_ms'] for query in samples)
+            entry.routes[route] = entry.routes.get(route, 0) + len(samples)
+            entry.last_seen = now
+            entry.save()
@@ -0,0 +1,134 @@
+# core/streams.py - Stream Server-Sent Events dell'attività di un gruppo (servito da asgi.py)
+
+import asyncio
+import json
+import re
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+
+from .events import get_backend, group_channel
+
+# /events/groups/<id>/ (anche sotto /api/, come le altre rotte)
+GROUP_EVENTS_PATH = re.compile(r'^/(?:api/)?events/groups/(?P<group_id>\d+)/?$')
+
+HEARTBEAT_SECONDS = 15
+
+
+def _authorized_user_id(token_key, group_id):
+    """Restituisce l'id dell'utente se il token è valido e l'utente appartiene al gruppo"""
+    from rest_framework.authtoken.models import Token
+    from .models import Group, GroupMembership
+
+    try:
+        token = Token.objects.select_related('user').get(key=token_key)
+    except Token.DoesNotExist:
+        return None
+
+    user = token.user
+    if not user.is_active:
+        return None
+
+    is_member = GroupMembership.objects.filter(user=user, group_id=group_id).exists()
+    is_owner = Group.objects.filter(id=group_id, owner=user).exists()
+    return user.id if (is_member or is_owner) else None
+
+
+def _token_from_scope(scope):
+    """Token dall'header Authorization oppure da ?token= (EventSource non può impostare header)"""
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            parts = value.decode('latin-1').split()
+            if len(parts) == 2 and parts[0].lower() == 'token':
+                return parts[1]
+
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    tokens = query.get('token')
+    return tokens[0] if tokens else None
+
+
+async def _send_error(send, status, message):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')],
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': json.dumps({'error': message}).encode('utf-8'),
+    })
+
+
+async def group_events_app(scope, receive, send, group_id):
+    """
+    Mantiene aperta una risposta text/event-stream e inoltra gli eventi del gruppo
+    finché il client non si disconnette
+    """
+    token_key = _token_from_scope(scope)
+    if not token_key:
+        await _send_error(send, 401, 'Token richiesto')
+        return
+
+    user_id = await sync_to_async(_authorized_user_id)(token_key, group_id)
+    if user_id is None:
+        await _send_error(send, 403, 'Non hai accesso a questo gruppo')
+        return
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': b': connected\n\n', 'more_body': True})
+
+    subscription = get_backend().subscribe(group_channel(group_id))
+
+    async def forward_events():
+        async for message in subscription:
+            await send({
+                'type': 'http.response.body',
+                'body': f'data: {message}\n\n'.encode('utf-8'),
+                'more_body': True,
+            })
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            await send({'type': 'http.response.body', 'body': b': ping\n\n', 'more_body': True})
+
+    async def wait_disconnect():
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    tasks = [
+        asyncio.ensure_future(forward_events()),
+        asyncio.ensure_future(heartbeat()),
+        asyncio.ensure_future(wait_disconnect()),
+    ]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await subscription.aclose()
+
+
+def route_streams(django_app):
+    """Applicazione ASGI che serve gli stream SSE e delega tutto il resto a Django"""
+
+    async def application(scope, receive, send):
+        if scope['type'] == 'http':
+            match = GROUP_EVENTS_PATH.match(scope['path'])
+            if match and scope['method'] == 'GET':
+                await group_events_app(scope, receive, send, int(match.group('group_id')))
+                return
+        await django_app(scope, receive, send)
+
+    return application
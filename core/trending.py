@@ -0,0 +1,131 @@
+# core/trending.py - Punteggio di popolarità dei post con decadimento nel tempo
+#
+# Ogni like, reaction o commento aggiunge il proprio peso a Post.trending_score con un UPDATE
+# atomico. `manage.py decay_trending_scores`, eseguito periodicamente, moltiplica tutti i
+# punteggi per 0.5 ** (ore trascorse / HALF_LIFE_HOURS): un evento vale la metà dopo
+# HALF_LIFE_HOURS. Le ore trascorse si contano dall'ultimo decadimento registrato in
+# TrendingDecay, così un'esecuzione saltata o doppia non falsa i punteggi. Quando un evento
+# viene rimosso si toglie solo quanto vale ancora nel punteggio: il suo peso decaduto
+# dall'istante in cui è stato creato fino all'ultimo decadimento.
+# La classifica è quindi una colonna indicizzata (gruppo, -trending_score) e la vista
+# "di tendenza" costa quanto il feed cronologico.
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, router
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import sharding
+from .models import Comment, Post, PostLike, PostReaction, TrendingDecay
+
+DEFAULTS = {
+    'WEIGHTS': {'like': 1.0, 'reaction': 1.0, 'comment': 2.0},
+    'HALF_LIFE_HOURS': 24,
+    'MIN_SCORE': 0.01,
+}
+
+
+def config():
+    return {**DEFAULTS, **getattr(settings, 'HAPPYGREEN_TRENDING', {})}
+
+
+def _decay_key(alias):
+    """Chiave di TrendingDecay per il database dei post (alias None: quello scelto dai router)"""
+    return alias or router.db_for_write(Post) or DEFAULT_DB_ALIAS
+
+
+def _last_decay(alias):
+    return TrendingDecay.objects.using(DEFAULT_DB_ALIAS).filter(alias=_decay_key(alias)).values_list(
+        'decayed_at', flat=True
+    ).first()
+
+
+def bump(post_id, kind, sign=1, created_at=None):
+    """
+    Aggiunge (sign=1) o toglie (sign=-1) il peso dell'evento `kind` al punteggio del post.
+    Per le rimozioni `created_at` è la data dell'evento: si toglie il peso già decaduto
+    """
+    cfg = config()
+    weight = cfg['WEIGHTS'].get(kind, 0)
+    if not weight:
+        return
+    if sign < 0 and created_at is not None:
+        decayed_at = _last_decay(None)
+        if decayed_at is not None and created_at < decayed_at:
+            hours = (decayed_at - created_at).total_seconds() / 3600
+            weight *= 0.5 ** (hours / cfg['HALF_LIFE_HOURS'])
+    Post.objects.filter(id=post_id).update(
+        trending_score=Greatest(F('trending_score') + sign * weight, Value(0.0))
+    )
+
+
+def decay(hours=None):
+    """
+    Applica a tutti i punteggi il decadimento per il tempo trascorso dal precedente (`hours`
+    ore solo la prima volta, quando non ne è registrato nessuno). Restituisce (aggiornati, azzerati)
+    """
+    cfg = config()
+    now = timezone.now()
+    updated = zeroed = 0
+    # Con lo sharding, su ogni shard
+    for alias in sharding.data_aliases():
+        with sharding.atomic(alias):
+            # La riga bloccata serializza le esecuzioni concorrenti
+            last, _ = TrendingDecay.objects.using(DEFAULT_DB_ALIAS).select_for_update().get_or_create(
+                alias=_decay_key(alias), defaults={'decayed_at': now - timedelta(hours=hours or 0)},
+            )
+            elapsed = (now - last.decayed_at).total_seconds() / 3600
+            last.decayed_at = now
+            last.save(update_fields=['decayed_at'])
+            if elapsed <= 0:
+                continue
+            factor = 0.5 ** (elapsed / cfg['HALF_LIFE_HOURS'])
+            # Prima si azzerano quelli che scenderebbero sotto la soglia, poi si scalano gli altri
+            threshold = cfg['MIN_SCORE'] / factor
+            posts = Post.objects.using(alias)
+            zeroed += posts.filter(trending_score__gt=0, trending_score__lt=threshold).update(trending_score=0)
+            updated += posts.filter(trending_score__gte=threshold).update(trending_score=F('trending_score') * factor)
+    return updated, zeroed
+
+
+def rebuild(batch_size=500):
+    """
+    Ricalcola i punteggi dagli eventi degli ultimi 10 dimezzamenti (più vecchi valgono meno
+    di 1/1000), ognuno pesato per la sua età. Per il primo avvio o dopo aver cambiato i pesi
+    """
+    cfg = config()
+    now = timezone.now()
+    since = now - timedelta(hours=10 * cfg['HALF_LIFE_HOURS'])
+    total = 0
+    for alias in sharding.data_aliases():
+        with sharding.atomic(alias):
+            scores = defaultdict(float)
+            for kind, model in (('like', PostLike), ('reaction', PostReaction), ('comment', Comment)):
+                weight = cfg['WEIGHTS'].get(kind, 0)
+                events = model.objects.using(alias).filter(created_at__gte=since).values_list(
+                    'post_id', 'created_at'
+                ).order_by()
+                for post_id, created_at in events.iterator():
+                    age_hours = (now - created_at).total_seconds() / 3600
+                    scores[post_id] += weight * 0.5 ** (age_hours / cfg['HALF_LIFE_HOURS'])
+
+            posts = Post.objects.using(alias)
+            posts.filter(trending_score__gt=0).update(trending_score=0)
+            items = [(post_id, score) for post_id, score in scores.items() if score >= cfg['MIN_SCORE']]
+            for start in range(0, len(items), batch_size):
+                batch = items[start:start + batch_size]
+                posts.filter(id__in=[post_id for post_id, _ in batch]).update(trending_score=Case(
+                    *[When(id=post_id, then=Value(score)) for post_id, score in batch],
+                    output_field=FloatField(),
+                ))
+            total += len(items)
+            # Punteggi calcolati a `now`: da qui riparte il decadimento
+            TrendingDecay.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+                alias=_decay_key(alias), defaults={'decayed_at': now},
+            )
+    return total
+
@@ -2,7 +2,7 @@
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from core import views
+from core import views, async_views
 
 router = DefaultRouter()
 router.register(r'users', views.UserViewSet)
@@ -14,6 +14,7 @@ router.register(r'quizzes', views.QuizViewSet)
 router.register(r'badges', views.BadgeViewSet)
 router.register(r'user-badges', views.UserBadgeViewSet)
 router.register(r'groups', views.GroupViewSet)
+router.register(r'notifications', views.NotificationViewSet, basename='notification')
 
 urlpatterns = [
     # Endpoints esistenti
@@ -25,6 +26,14 @@ urlpatterns = [
     path('users/update-avatar/', views.update_user_avatar, name='update-user-avatar'),
     path('users/update-profile/', views.update_user_profile, name='update-user-profile'),
 
+    # Varianti async (ASGI) degli endpoint di lettura più chiamati
+    path('async/users/me/', async_views.current_user, name='async-current-user'),
+    path('async/leaderboard/', async_views.get_leaderboard, name='async-get-leaderboard'),
+    path('async/posts/', async_views.post_feed, name='async-post-feed'),
+
+    # Query lente registrate da SlowQueryMiddleware (solo staff)
+    path('staff/slow-queries/', views.slow_queries, name='slow-queries'),
+
     # Include router URLs
     path('', include(router.urls)),
     path('auth/', include('core.auth_urls')),  # Auth routes
@@ -2,27 +2,168 @@
 
 from rest_framework import viewsets, status
 from .models import User, Group, GroupMembership, Post, Comment, DetectedObject, Quiz, Badge, UserBadge, GameScore, \
-    PostLike, PostReaction
+    PostLike, PostReaction, SearchToken, SlowQuery, GroupDetectionStat, Notification, ArchivedPost
 from .serializers import (
     UserSerializer, GroupSerializer, GroupMembershipSerializer, PostSerializer, CommentSerializer,
     DetectedObjectSerializer, QuizSerializer, BadgeSerializer, UserBadgeSerializer, GroupDetailSerializer,
-    GroupMembershipDetailSerializer, PostLikeSerializer, PostReactionSerializer
+    GroupMembershipDetailSerializer, PostLikeSerializer, PostReactionSerializer, SlowQuerySerializer,
+    UserDirectorySerializer, DetectionItemSerializer, GroupDetectionStatSerializer, NotificationSerializer,
+    LATEST_COMMENTS,
 )
 from rest_framework.decorators import api_view, permission_classes, authentication_classes, action
 from rest_framework.authentication import TokenAuthentication
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from django.db.models import Max, Sum
+from django.db.models import Max, Sum, Min, Avg, Count, Q, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Substr
 import base64
 import uuid
 import os
 from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.crypto import constant_time_compare
 import logging
 
+from . import archive
+from . import badges
+from .detections import MAX_DETECTIONS, catalog as tip_catalog, create_detections, update_group_stats
+from .events import publish_group_event
+from . import notifications
+from . import sharding
+from .trending import bump as bump_trending
+from .metrics import registry as metrics_registry
+from .exports import FORMATS as EXPORT_FORMATS, group_rows
+from .fieldsets import Fieldset, SparseFieldsetsViewMixin, apply as apply_fieldset
+from .idempotency import idempotent
+from .geo import cover_bbox, radius_bbox, haversine_km, precision_for_zoom
+from .pagination import DirectoryPagination, KeysetPagination, NotificationPagination, SearchPagination
+from .quiz_pool import pool as quiz_pool
+from .search import index_post, index_comment, query_terms
+
 logger = logging.getLogger(__name__)
 
+MAX_NEARBY_RADIUS_KM = 50
+MAX_MAP_MARKERS = 500
+MAX_BATCH_SIZE = 100
+MAX_QUIZ_SESSION = 50
+MAX_TOP_DETECTIONS = 50
+MAX_TRENDING_POSTS = 50
+BATCH_ACTIONS = ('like', 'unlike', 'toggle_like', 'reaction')
+VALID_REACTIONS = [choice[0] for choice in PostReaction.REACTION_CHOICES]
+
+
+def user_group_ids(user):
+    """Id dei gruppi di cui l'utente è membro o proprietario"""
+    user_groups = GroupMembership.objects.filter(user=user).values_list('group_id', flat=True)
+    owned_groups = Group.objects.filter(owner=user).values_list('id', flat=True)
+    return list(set(user_groups) | set(owned_groups))
+
+
+def set_post_like(post, user, liked=None):
+    """
+    Mette (liked=True) o toglie (liked=False) il like di `user` a `post`; con liked=None
+    inverte lo stato attuale. Restituisce (liked, like_count)
+    """
+    like = PostLike.objects.filter(post=post, user=user).first()
+    if liked is None:
+        liked = like is None
+
+    changed = False
+    if liked and like is None:
+        PostLike.objects.create(post=post, user=user)
+        changed = True
+    elif not liked and like is not None:
+        like.delete()
+        changed = True
+
+    # Conteggio dal DB: post.likes può essere già prefetchato e sarebbe obsoleto
+    like_count = PostLike.objects.filter(post=post).count()
+
+    if changed:
+        delta = 1 if liked else -1
+        bump_trending(post.id, 'like', delta, created_at=None if liked else like.created_at)
+        badges.record(user.id, 'likes_given', delta)
+        if post.user_id != user.id:
+            badges.record(post.user_id, 'likes_received', delta)
+        if liked:
+            notifications.notify(post.user_id, post.id, 'like', user)
+        publish_group_event(post.group_id, 'post_liked' if liked else 'post_unliked', {
+            'post_id': post.id,
+            'user_id': user.id,
+            'username': user.username,
+            'like_count': like_count,
+        })
+    return liked, like_count
+
+
+def set_post_reaction(post, user, reaction_emoji):
+    """
+    Aggiunge la reaction, la cambia se l'utente ne aveva un'altra o la rimuove se è la stessa.
+    Restituisce (removed, user_reaction, reactions_count)
+    """
+    try:
+        # Cerca se l'utente ha già una reaction
+        reaction = PostReaction.objects.get(post=post, user=user)
+        if reaction.reaction == reaction_emoji:
+            # Se è la stessa reaction, rimuovila
+            reaction.delete()
+            removed = True
+            user_reaction = None
+            bump_trending(post.id, 'reaction', -1, created_at=reaction.created_at)
+            if post.user_id != user.id:
+                badges.record(post.user_id, 'reactions_received', -1)
+        else:
+            # Se è diversa, aggiornala
+            reaction.reaction = reaction_emoji
+            reaction.save()
+            removed = False
+            user_reaction = reaction_emoji
+    except PostReaction.DoesNotExist:
+        # Se non esiste, crea la reaction
+        PostReaction.objects.create(post=post, user=user, reaction=reaction_emoji)
+        removed = False
+        user_reaction = reaction_emoji
+        bump_trending(post.id, 'reaction')
+        if post.user_id != user.id:
+            badges.record(post.user_id, 'reactions_received', 1)
+        notifications.notify(post.user_id, post.id, 'reaction', user)
+
+    # Conta tutte le reactions per questo post raggruppate per emoji
+    reactions_count = {}
+    reactions_data = PostReaction.objects.filter(post=post).values('reaction').annotate(count=Count('reaction'))
+
+    for reaction_data in reactions_data:
+        reactions_count[reaction_data['reaction']] = reaction_data['count']
+
+    publish_group_event(post.group_id, 'reaction_changed', {
+        'post_id': post.id,
+        'user_id': user.id,
+        'username': user.username,
+        'reaction': user_reaction,
+        'reactions_count': reactions_count,
+    })
+    return removed, user_reaction, reactions_count
+
+
+def annotate_group_counts(queryset, members=True, posts=True):
+    """Aggiunge member_count e post_count con subquery, invece di due query per gruppo nel serializer"""
+    if members:
+        member_count = GroupMembership.objects.filter(group=OuterRef('pk')).order_by().values('group').annotate(
+            total=Count('id')
+        ).values('total')
+        queryset = queryset.annotate(member_count=Coalesce(Subquery(member_count), 0))
+    if not posts or sharding.enabled():
+        # Con lo sharding i post possono stare su un altro database: li conta il serializer, gruppo per gruppo
+        return queryset
+    post_count = Post.objects.filter(group=OuterRef('pk')).order_by().values('group').annotate(
+        total=Count('id')
+    ).values('total')
+    return queryset.annotate(post_count=Coalesce(Subquery(post_count), 0))
+
 
 @api_view(['GET'])
 @authentication_classes([TokenAuthentication])
@@ -31,7 +172,7 @@ def current_user(request):
     """
     Restituisce i dati dell'utente corrente
     """
-    serializer = UserSerializer(request.user)
+    serializer = apply_fieldset(UserSerializer(request.user), Fieldset.from_request(request))
     return Response(serializer.data)
 
 
@@ -116,19 +257,59 @@ def update_user_profile(request):
         )
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(SparseFieldsetsViewMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    # Anche l'elenco completo a pagine per username, come la rubrica: mai tutta la tabella
+    pagination_class = DirectoryPagination
+    # Chiave del cursore
+    sparse_always = ('username',)
+
+    @action(detail=False, methods=['get'])
+    def directory(self, request):
+        """
+        Rubrica utenti paginata per username, senza avatar.
+        ?q= cerca per prefisso su username, nome e cognome; ?exclude_group= esclude i membri
+        di un gruppo (flusso "aggiungi membro")
+        """
+        users = User.objects.filter(is_active=True).only('id', 'username', 'first_name', 'last_name')
+
+        query = request.query_params.get('q', '').strip()
+        if query:
+            users = users.filter(
+                Q(username__istartswith=query) | Q(first_name__istartswith=query) | Q(last_name__istartswith=query)
+            )
+
+        exclude_group = request.query_params.get('exclude_group')
+        if exclude_group is not None:
+            try:
+                exclude_group = int(exclude_group)
+            except (ValueError, TypeError):
+                return Response({'error': 'Gruppo non valido'}, status=status.HTTP_400_BAD_REQUEST)
+            users = users.exclude(
+                id__in=GroupMembership.objects.filter(group_id=exclude_group).values('user_id')
+            )
+
+        paginator = DirectoryPagination()
+        page = paginator.paginate_queryset(users, request, view=self)
+        return paginator.get_paginated_response(UserDirectorySerializer(page, many=True).data)
 
 
 # Le altre classi viewset rimangono invariate...
-class GroupViewSet(viewsets.ModelViewSet):
+class GroupViewSet(SparseFieldsetsViewMixin, viewsets.ModelViewSet):
     queryset = Group.objects.all()
     serializer_class = GroupSerializer
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        # Con ?fields=/?omit= i conteggi non richiesti non vengono calcolati
+        return annotate_group_counts(
+            Group.objects.all(), members=self.wants('member_count'), posts=self.wants('post_count')
+        ).select_related('owner')
+
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return GroupDetailSerializer
@@ -142,6 +323,54 @@ class GroupViewSet(viewsets.ModelViewSet):
             role='admin'
         )
 
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """
+        Esporta membri con punteggio, post, commenti e oggetti rilevati del gruppo,
+        in streaming come NDJSON (default) o CSV (?output=csv). Solo proprietario, admin e insegnanti
+        """
+        group = self.get_object()
+
+        output = request.query_params.get('output', 'ndjson')
+        if output not in EXPORT_FORMATS:
+            return Response(
+                {'error': f"output deve essere uno tra {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        is_authorized = group.owner_id == request.user.id or GroupMembership.objects.filter(
+            user=request.user,
+            group=group,
+            role__in=['admin', 'teacher']
+        ).exists()
+        if not is_authorized:
+            return Response(
+                {'error': "Solo amministratori e insegnanti possono esportare il gruppo"},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        content_type, stream = EXPORT_FORMATS[output]
+        response = StreamingHttpResponse(stream(group_rows(group)), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="gruppo-{group.id}.{output}"'
+        # Niente buffering nei proxy (nginx): i dati devono arrivare man mano
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @action(detail=True, methods=['get'], url_path='top-detections', url_name='top-detections')
+    def top_detections(self, request, pk=None):
+        """
+        Oggetti più rilevati nei post del gruppo (?limit=, massimo MAX_TOP_DETECTIONS),
+        dai contatori aggiornati a ogni inserimento. Solo per membri e proprietario
+        """
+        group = get_object_or_404(Group, pk=pk, id__in=user_group_ids(request.user))
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), MAX_TOP_DETECTIONS)
+        except ValueError:
+            return Response({'error': 'limit deve essere un intero'}, status=status.HTTP_400_BAD_REQUEST)
+
+        stats = GroupDetectionStat.objects.filter(group=group, count__gt=0).order_by('-count', 'label')[:max(limit, 1)]
+        return Response(GroupDetectionStatSerializer(stats, many=True).data)
+
     @action(detail=True, methods=['post'])
     def join(self, request, pk=None):
         """
@@ -299,16 +528,19 @@ class GroupViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def my_groups(self, request):
         # Ottieni tutti i gruppi di cui l'utente è membro
-        memberships = GroupMembership.objects.filter(user=request.user)
-        groups = [membership.group for membership in memberships]
+        group_ids = list(
+            GroupMembership.objects.filter(user=request.user).order_by('id').values_list('group_id', flat=True)
+        )
 
         # Includi anche i gruppi di cui è proprietario ma non membro
-        owned_groups = Group.objects.filter(owner=request.user)
-        for group in owned_groups:
-            if group not in groups:
-                groups.append(group)
+        for group_id in Group.objects.filter(owner=request.user).order_by('id').values_list('id', flat=True):
+            if group_id not in group_ids:
+                group_ids.append(group_id)
+
+        groups = annotate_group_counts(Group.objects.filter(id__in=group_ids)).select_related('owner').in_bulk()
+        ordered = [groups[group_id] for group_id in group_ids if group_id in groups]
 
-        return Response(GroupSerializer(groups, many=True).data)
+        return Response(apply_fieldset(GroupSerializer(ordered, many=True), Fieldset.from_request(request)).data)
 
 
 class GroupMembershipViewSet(viewsets.ModelViewSet):
@@ -317,17 +549,59 @@ class GroupMembershipViewSet(viewsets.ModelViewSet):
 
 
 # Il resto delle classi viewset aggiornato per gestire gli avatar...
-class PostViewSet(viewsets.ModelViewSet):
+class PostViewSet(sharding.ShardedViewMixin, SparseFieldsetsViewMixin, viewsets.ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    # Ordinamento dopo lo scatter e scelta dello shard (vedi core/fieldsets.py)
+    sparse_always = ('created_at', 'group')
+
+    def shard_for_request(self, request):
+        """Shard del post dell'URL, del gruppo del nuovo post o di ?group="""
+        if 'pk' in self.kwargs:
+            return sharding.locate(Post, self.kwargs['pk'])
+        if self.action == 'create':
+            return sharding.for_group(request.data.get('group') if isinstance(request.data, dict) else None)
+        return sharding.for_group(request.query_params.get('group'))
+
+    def list(self, request, *args, **kwargs):
+        if not sharding.scattered():
+            return super().list(request, *args, **kwargs)
+        posts = sorted(
+            sharding.scatter(self.filter_queryset(self.get_queryset())), key=lambda post: post.created_at, reverse=True
+        )
+        return Response(self.get_serializer(posts, many=True).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            # Post archiviato (manage.py archive_posts): stessa rappresentazione, in sola lettura
+            archived = None
+            if str(kwargs.get('pk', '')).isdigit():
+                archived = self._filter_posts_for_user(ArchivedPost.objects.all()).filter(pk=kwargs['pk']).first()
+            if archived is None:
+                raise
+            return Response(self.get_serializer(archive.restore(archived, LATEST_COMMENTS)).data)
 
     def get_queryset(self):
         """
         IMPORTANTE: Filtra i post in base al gruppo specificato nel query parameter
         """
-        queryset = Post.objects.all()
+        queryset = self._filter_posts_for_user(Post.objects.all())
+
+        # FIX: Ordina i post dal più recente al più vecchio e prefetch le relazioni
+        # I commenti non sono prefetchati: il serializer carica solo gli ultimi di ogni post
+        return queryset.select_related('user', 'group').prefetch_related(
+            'likes__user', 'reactions__user'
+        ).order_by('-created_at')
+
+    def _filter_posts_for_user(self, queryset):
+        """
+        Restringe il queryset ai post visibili all'utente corrente:
+        il gruppo indicato in ?group= oppure tutti i gruppi dell'utente
+        """
         group_id = self.request.query_params.get('group', None)
 
         if group_id is not None:
@@ -347,24 +621,15 @@ class PostViewSet(viewsets.ModelViewSet):
 
                 if is_member or is_owner:
                     # Filtra solo i post di questo gruppo
-                    queryset = queryset.filter(group_id=group_id)
-                else:
-                    # Se non è membro né proprietario, restituisci queryset vuoto
-                    queryset = Post.objects.none()
+                    return queryset.filter(group_id=group_id)
+                # Se non è membro né proprietario, restituisci queryset vuoto
+                return queryset.none()
             except (ValueError, TypeError):
                 # Se group_id non è un intero valido, restituisci queryset vuoto
-                queryset = Post.objects.none()
-        else:
-            # Se non è specificato un gruppo, restituisci solo i post dei gruppi dell'utente
-            user_groups = GroupMembership.objects.filter(user=self.request.user).values_list('group_id', flat=True)
-            owned_groups = Group.objects.filter(owner=self.request.user).values_list('id', flat=True)
-            all_user_groups = list(user_groups) + list(owned_groups)
-            queryset = queryset.filter(group_id__in=all_user_groups)
+                return queryset.none()
 
-        # FIX: Ordina i post dal più recente al più vecchio e prefetch le relazioni
-        return queryset.select_related('user', 'group').prefetch_related(
-            'comments__user', 'likes__user', 'reactions__user'
-        ).order_by('-created_at')
+        # Se non è specificato un gruppo, restituisci solo i post dei gruppi dell'utente
+        return queryset.filter(group_id__in=user_group_ids(self.request.user))
 
     def get_serializer_context(self):
         """Passa il context al serializer per calcolare i campi user-specific"""
@@ -372,6 +637,10 @@ class PostViewSet(viewsets.ModelViewSet):
         context['request'] = self.request
         return context
 
+    @idempotent('posts.create')
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         """
         Verifica che l'utente possa creare post nel gruppo specificato
@@ -402,27 +671,41 @@ class PostViewSet(viewsets.ModelViewSet):
             logger.info(f"Received image URL: {image_url[:50]}...")
 
         # Salva il post con l'utente corrente
-        serializer.save(user=self.request.user)
+        post = serializer.save(user=self.request.user)
+        index_post(post)
+        badges.record(self.request.user.id, 'posts')
+
+        publish_group_event(post.group_id, 'post_created', {
+            'post_id': post.id,
+            'user_id': self.request.user.id,
+            'username': self.request.user.username,
+            'caption': post.caption,
+        })
+
+    def perform_update(self, serializer):
+        group = serializer.validated_data.get('group')
+        if group is not None and sharding.enabled() and \
+                sharding.shard_for_group(group.id) != serializer.instance._state.db:
+            raise ValidationError({'group': 'Il post non può essere spostato in un gruppo su un altro database'})
+        post = serializer.save()
+        index_post(post)
+
+    def perform_destroy(self, instance):
+        labels = list(DetectedObject.objects.filter(post=instance).values_list('label', flat=True))
+        with sharding.atomic():
+            update_group_stats(instance.group_id, labels, sign=-1)
+            badges.forget_post(instance)
+            instance.delete()
 
     @action(detail=True, methods=['post'])
     def toggle_like(self, request, pk=None):
         post = self.get_object()
-
-        try:
-            # Cerca se l'utente ha già messo like
-            like = PostLike.objects.get(post=post, user=request.user)
-            # Se esiste, rimuovi il like
-            like.delete()
-            liked = False
-        except PostLike.DoesNotExist:
-            # Se non esiste, crea il like
-            PostLike.objects.create(post=post, user=request.user)
-            liked = True
+        liked, like_count = set_post_like(post, request.user)
 
         # Restituisci lo stato aggiornato
         return Response({
             'liked': liked,
-            'like_count': post.likes.count()
+            'like_count': like_count
         })
 
     @action(detail=True, methods=['post'])
@@ -440,40 +723,13 @@ class PostViewSet(viewsets.ModelViewSet):
             )
 
         # Valida che la reaction sia tra quelle supportate
-        valid_reactions = [choice[0] for choice in PostReaction.REACTION_CHOICES]
-        if reaction_emoji not in valid_reactions:
+        if reaction_emoji not in VALID_REACTIONS:
             return Response(
                 {'error': 'Reaction non valida'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
-            # Cerca se l'utente ha già una reaction
-            reaction = PostReaction.objects.get(post=post, user=request.user)
-            if reaction.reaction == reaction_emoji:
-                # Se è la stessa reaction, rimuovila
-                reaction.delete()
-                removed = True
-                user_reaction = None
-            else:
-                # Se è diversa, aggiornala
-                reaction.reaction = reaction_emoji
-                reaction.save()
-                removed = False
-                user_reaction = reaction_emoji
-        except PostReaction.DoesNotExist:
-            # Se non esiste, crea la reaction
-            PostReaction.objects.create(post=post, user=request.user, reaction=reaction_emoji)
-            removed = False
-            user_reaction = reaction_emoji
-
-        # Conta tutte le reactions per questo post raggruppate per emoji
-        from django.db.models import Count
-        reactions_count = {}
-        reactions_data = post.reactions.values('reaction').annotate(count=Count('reaction'))
-
-        for reaction_data in reactions_data:
-            reactions_count[reaction_data['reaction']] = reaction_data['count']
+        removed, user_reaction, reactions_count = set_post_reaction(post, request.user, reaction_emoji)
 
         return Response({
             'removed': removed,
@@ -481,6 +737,176 @@ class PostViewSet(viewsets.ModelViewSet):
             'reactions_count': reactions_count
         })
 
+    @action(detail=False, methods=['post'])
+    def batch_get(self, request):
+        """
+        Restituisce più post in una richiesta: {"ids": [1, 2, 3]} (massimo MAX_BATCH_SIZE).
+        I post non visibili all'utente o inesistenti finiscono in "missing"
+        """
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not ids:
+            return Response({'error': 'ids deve essere una lista non vuota'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > MAX_BATCH_SIZE:
+            return Response(
+                {'error': f'Massimo {MAX_BATCH_SIZE} post per richiesta'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            ids = list(dict.fromkeys(int(post_id) for post_id in ids))
+        except (ValueError, TypeError):
+            return Response({'error': 'ids deve contenere solo interi'}, status=status.HTTP_400_BAD_REQUEST)
+
+        posts = {post.id: post for post in sharding.scatter(self.get_queryset().filter(id__in=ids))}
+        found = [posts[post_id] for post_id in ids if post_id in posts]
+
+        return Response({
+            'results': self.get_serializer(found, many=True).data,
+            'missing': [post_id for post_id in ids if post_id not in posts],
+        })
+
+    @action(detail=False, methods=['post'])
+    def batch_actions(self, request):
+        """
+        Applica più like/reaction in una sola transazione, nell'ordine ricevuto:
+        {"actions": [{"post": 1, "action": "like"}, {"post": 2, "action": "reaction", "reaction": "🔥"}]}
+        action: like, unlike, toggle_like o reaction (stesso comportamento di add_reaction).
+        Se un'azione non è valida o un post non è visibile non viene applicato nulla
+        """
+        actions = request.data.get('actions')
+        if not isinstance(actions, list) or not actions:
+            return Response({'error': 'actions deve essere una lista non vuota'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(actions) > MAX_BATCH_SIZE:
+            return Response(
+                {'error': f'Massimo {MAX_BATCH_SIZE} azioni per richiesta'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        for index, entry in enumerate(actions):
+            error = self._batch_action_error(entry)
+            if error:
+                return Response({'error': error, 'index': index}, status=status.HTTP_400_BAD_REQUEST)
+
+        post_ids = {int(entry['post']) for entry in actions}
+        if sharding.scattered():
+            visible = self._filter_posts_for_user(Post.objects.filter(id__in=post_ids))
+            posts = {post.id: post for post in sharding.scatter(visible)}
+        else:
+            posts = self._filter_posts_for_user(Post.objects.all()).in_bulk(post_ids)
+        missing = sorted(post_ids - set(posts))
+        if missing:
+            return Response(
+                {'error': 'Post non trovati', 'missing': missing},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        for post in posts.values():
+            sharding.check_writable(post.group_id)
+
+        results = []
+        # Con lo sharding la transazione è una per database
+        with sharding.atomic(*{post._state.db for post in posts.values()}):
+            for entry in actions:
+                post = posts[int(entry['post'])]
+                result = {'post': post.id, 'action': entry['action']}
+                with sharding.activate_for(post):
+                    if entry['action'] == 'reaction':
+                        removed, user_reaction, reactions_count = set_post_reaction(
+                            post, request.user, entry['reaction']
+                        )
+                        result.update({
+                            'removed': removed,
+                            'user_reaction': user_reaction,
+                            'reactions_count': reactions_count,
+                        })
+                    else:
+                        liked = {'like': True, 'unlike': False, 'toggle_like': None}[entry['action']]
+                        liked, like_count = set_post_like(post, request.user, liked)
+                        result.update({'liked': liked, 'like_count': like_count})
+                results.append(result)
+
+        return Response({'results': results})
+
+    @staticmethod
+    def _batch_action_error(entry):
+        if not isinstance(entry, dict):
+            return 'Ogni azione deve essere un oggetto'
+        if entry.get('action') not in BATCH_ACTIONS:
+            return f"action deve essere uno tra {', '.join(BATCH_ACTIONS)}"
+        try:
+            int(entry.get('post'))
+        except (ValueError, TypeError):
+            return 'post deve essere un intero'
+        if entry['action'] == 'reaction' and entry.get('reaction') not in VALID_REACTIONS:
+            return 'Reaction non valida'
+        return None
+
+    @action(detail=False, methods=['get'])
+    def trending(self, request):
+        """
+        Post più popolari dei gruppi dell'utente (o del gruppo in ?group=) per punteggio con
+        decadimento nel tempo, al massimo ?limit= (MAX_TRENDING_POSTS). Stesso costo del feed
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), MAX_TRENDING_POSTS)
+        except ValueError:
+            return Response({'error': 'limit deve essere un intero'}, status=status.HTTP_400_BAD_REQUEST)
+
+        posts = self.get_queryset().filter(trending_score__gt=0).order_by('-trending_score', '-created_at')
+        if sharding.scattered():
+            posts = sorted(
+                sharding.scatter(posts, limit=limit),
+                key=lambda post: (post.trending_score, post.created_at), reverse=True
+            )
+        return Response(self.get_serializer(posts[:limit], many=True).data)
+
+    @action(detail=True, methods=['get'], url_path='comments', url_name='comments')
+    def comment_thread(self, request, pk=None):
+        """
+        Tutti i commenti di un post dal più vecchio, paginati a chiave (?cursor=, ?page_size=)
+        """
+        post = get_object_or_404(self._filter_posts_for_user(Post.objects.all()), pk=pk)
+
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(Comment.objects.filter(post=post).select_related('user'), request, view=self)
+        return paginator.get_paginated_response(CommentSerializer(page, many=True).data)
+
+    @action(detail=True, methods=['post'])
+    def detections(self, request, pk=None):
+        """
+        Salva tutti gli oggetti rilevati in una foto con un solo inserimento:
+        {"objects": [{"label": "bottiglia", "description": "...", "recycle_tips": "..."}]}
+        (massimo MAX_DETECTIONS). I testi si possono omettere per le etichette già nel catalogo.
+        Solo l'autore del post, il proprietario del gruppo, admin e insegnanti
+        """
+        post = get_object_or_404(self._filter_posts_for_user(Post.objects.select_related('group')), pk=pk)
+        is_authorized = post.user_id == request.user.id or post.group.owner_id == request.user.id or \
+            GroupMembership.objects.filter(
+                user=request.user,
+                group_id=post.group_id,
+                role__in=['admin', 'teacher']
+            ).exists()
+        if not is_authorized:
+            return Response(
+                {'error': 'Non hai il permesso di aggiungere oggetti rilevati a questo post'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        objects = request.data.get('objects')
+        if not isinstance(objects, list) or not objects:
+            return Response({'error': 'objects deve essere una lista non vuota'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(objects) > MAX_DETECTIONS:
+            return Response(
+                {'error': f'Massimo {MAX_DETECTIONS} oggetti per richiesta'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        items = DetectionItemSerializer(data=objects, many=True)
+        items.is_valid(raise_exception=True)
+
+        with sharding.atomic():
+            created = create_detections(post, items.validated_data)
+
+        return Response(DetectedObjectSerializer(created, many=True).data, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['get'])
     def reactions(self, request, pk=None):
         """
@@ -503,12 +929,233 @@ class PostViewSet(viewsets.ModelViewSet):
 
         return Response(reactions_by_emoji)
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Ricerca full-text su didascalie e commenti dei post nei gruppi dell'utente (?q=),
+        ordinata per numero di termini trovati e poi per peso
+        """
+        terms = query_terms(request.query_params.get('q', ''))
+        if not terms:
+            return Response(
+                {'error': 'Parametro q richiesto'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-class CommentViewSet(viewsets.ModelViewSet):
-    queryset = Comment.objects.all()
+        group_ids = user_group_ids(request.user)
+        group_id = request.query_params.get('group')
+        if group_id is not None:
+            try:
+                group_id = int(group_id)
+            except (ValueError, TypeError):
+                return Response(
+                    {'error': 'Gruppo non valido'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            group_ids = [group_id] if group_id in group_ids else []
+
+        ranked = SearchToken.objects.filter(token__in=terms, group_id__in=group_ids).values('post_id').annotate(
+            matched=Count('token', distinct=True),
+            score=Sum('weight'),
+        ).order_by('-matched', '-score', '-post_id')
+        if sharding.scattered():
+            ranked = sorted(
+                sharding.scatter(ranked),
+                key=lambda entry: (entry['matched'], entry['score'], entry['post_id']), reverse=True
+            )
+
+        paginator = SearchPagination()
+        page = paginator.paginate_queryset(ranked, request, view=self)
+        post_ids = [entry['post_id'] for entry in page]
+
+        posts = Post.objects.filter(id__in=post_ids).select_related('user', 'group').prefetch_related(
+            'likes__user', 'reactions__user'
+        )
+        posts = {post.id: post for post in sharding.scatter(posts)} if sharding.scattered() else posts.in_bulk()
+        ordered = [posts[post_id] for post_id in post_ids if post_id in posts]
+
+        serializer = self.get_serializer(ordered, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    def _geo_posts(self):
+        """Post geotaggati visibili all'utente, senza prefetch (per le query sulla mappa)"""
+        return self._filter_posts_for_user(
+            Post.objects.filter(geohash__isnull=False)
+        ).order_by()
+
+    @staticmethod
+    def _bbox_filter(queryset, south, west, north, east):
+        """Filtra per bounding box usando i prefissi geohash (indice) e poi le coordinate esatte"""
+        prefix_filter = Q()
+        for prefix in cover_bbox(south, west, north, east):
+            prefix_filter |= Q(geohash__startswith=prefix)
+
+        return queryset.filter(prefix_filter).filter(
+            latitude__gte=south, latitude__lte=north,
+            longitude__gte=west, longitude__lte=east
+        )
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """
+        Post entro ?radius= km (default 5) dal punto ?lat=&lng=, ordinati per distanza
+        """
+        try:
+            lat = float(request.query_params['lat'])
+            lng = float(request.query_params['lng'])
+            radius = float(request.query_params.get('radius', 5))
+            limit = int(request.query_params.get('limit', 100))
+        except (KeyError, ValueError, TypeError):
+            return Response(
+                {'error': 'Parametri lat, lng (e opzionalmente radius, limit) richiesti'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180) or radius <= 0 or radius > MAX_NEARBY_RADIUS_KM:
+            return Response(
+                {'error': 'Coordinate o raggio non validi'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limit = max(1, min(limit, MAX_MAP_MARKERS))
+
+        south, west, north, east = radius_bbox(lat, lng, radius)
+        candidates = self._bbox_filter(self._geo_posts(), south, west, north, east).values(
+            'id', 'group_id', 'user__username', 'caption', 'latitude', 'longitude', 'created_at'
+        )
+        if sharding.scattered():
+            candidates = sharding.scatter(candidates)
+
+        results = []
+        for post in candidates:
+            distance = haversine_km(lat, lng, post['latitude'], post['longitude'])
+            if distance <= radius:
+                results.append({
+                    'id': post['id'],
+                    'group': post['group_id'],
+                    'username': post['user__username'],
+                    'caption': post['caption'],
+                    'latitude': post['latitude'],
+                    'longitude': post['longitude'],
+                    'created_at': post['created_at'],
+                    'distance_km': round(distance, 3),
+                })
+
+        results.sort(key=lambda item: item['distance_km'])
+        return Response(results[:limit])
+
+    @action(detail=False, methods=['get'])
+    def map(self, request):
+        """
+        Marker della mappa nel bounding box ?south=&west=&north=&east=.
+        Con ?zoom= restituisce cluster aggregati per cella geohash invece dei singoli post.
+        """
+        try:
+            south = float(request.query_params['south'])
+            west = float(request.query_params['west'])
+            north = float(request.query_params['north'])
+            east = float(request.query_params['east'])
+            zoom = request.query_params.get('zoom')
+            zoom = int(zoom) if zoom is not None else None
+        except (KeyError, ValueError, TypeError):
+            return Response(
+                {'error': 'Parametri south, west, north, east richiesti'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if not (-90 <= south <= north <= 90 and -180 <= west <= east <= 180):
+            return Response(
+                {'error': 'Bounding box non valido'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        posts = self._bbox_filter(self._geo_posts(), south, west, north, east)
+
+        if zoom is None:
+            markers = posts.values('id', 'group_id', 'latitude', 'longitude')
+            markers = sharding.scatter(markers, limit=MAX_MAP_MARKERS)[:MAX_MAP_MARKERS] if sharding.scattered() \
+                else markers[:MAX_MAP_MARKERS]
+            return Response({
+                'clustered': False,
+                'markers': [
+                    {
+                        'id': post['id'],
+                        'group': post['group_id'],
+                        'latitude': post['latitude'],
+                        'longitude': post['longitude'],
+                    }
+                    for post in markers
+                ]
+            })
+
+        precision = precision_for_zoom(zoom)
+        cells = posts.annotate(cell=Substr('geohash', 1, precision)).values('cell').annotate(
+            count=Count('id'),
+            latitude=Avg('latitude'),
+            longitude=Avg('longitude'),
+            post_id=Min('id'),
+        ).order_by('-count')
+        cells = self._merge_cells(sharding.scatter(cells)) if sharding.scattered() else cells[:MAX_MAP_MARKERS]
+
+        return Response({
+            'clustered': True,
+            'precision': precision,
+            'clusters': [
+                {
+                    'cell': cell['cell'],
+                    'count': cell['count'],
+                    'latitude': cell['latitude'],
+                    'longitude': cell['longitude'],
+                    # Con un solo post nella cella il client può aprirlo direttamente
+                    'post_id': cell['post_id'] if cell['count'] == 1 else None,
+                }
+                for cell in cells
+            ]
+        })
+
+    @staticmethod
+    def _merge_cells(cells):
+        """Unisce i cluster della stessa cella calcolati su shard diversi (media pesata delle coordinate)"""
+        merged = {}
+        for cell in cells:
+            total = merged.get(cell['cell'])
+            if total is None:
+                merged[cell['cell']] = dict(cell)
+                continue
+            count = total['count'] + cell['count']
+            total['latitude'] = (total['latitude'] * total['count'] + cell['latitude'] * cell['count']) / count
+            total['longitude'] = (total['longitude'] * total['count'] + cell['longitude'] * cell['count']) / count
+            total['post_id'] = min(total['post_id'], cell['post_id'])
+            total['count'] = count
+        return sorted(merged.values(), key=lambda cell: cell['count'], reverse=True)[:MAX_MAP_MARKERS]
+
+
+class CommentViewSet(sharding.ShardedViewMixin, SparseFieldsetsViewMixin, viewsets.ModelViewSet):
+    queryset = Comment.objects.select_related('user')
     serializer_class = CommentSerializer
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    sparse_always = ('created_at',)
+
+    def shard_for_request(self, request):
+        """Shard del commento dell'URL o del post da commentare"""
+        if 'pk' in self.kwargs:
+            return sharding.locate(Comment, self.kwargs['pk'])
+        if self.action == 'create' and isinstance(request.data, dict):
+            return sharding.locate(Post, request.data.get('post'))
+        return None, None
+
+    def list(self, request, *args, **kwargs):
+        if not sharding.scattered():
+            return super().list(request, *args, **kwargs)
+        comments = sorted(
+            sharding.scatter(self.filter_queryset(self.get_queryset()), field='post__group_id'),
+            key=lambda comment: (comment.created_at, comment.id)
+        )
+        return Response(self.get_serializer(comments, many=True).data)
+
+    @idempotent('comments.create')
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         """
@@ -532,18 +1179,176 @@ class CommentViewSet(viewsets.ModelViewSet):
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied("Non hai il permesso di commentare in questo gruppo")
 
-        serializer.save(user=self.request.user)
+        comment = serializer.save(user=self.request.user)
+        index_comment(comment, group_id=group_id)
+        badges.record(self.request.user.id, 'comments')
+        bump_trending(post.id, 'comment')
+        notifications.notify(post.user_id, post.id, 'comment', self.request.user)
+
+        publish_group_event(group_id, 'comment_created', {
+            'post_id': post.id,
+            'comment_id': comment.id,
+            'user_id': self.request.user.id,
+            'username': self.request.user.username,
+            'content': comment.content,
+        })
+
+    def perform_update(self, serializer):
+        comment = serializer.save()
+        index_comment(comment)
+
+    def perform_destroy(self, instance):
+        bump_trending(instance.post_id, 'comment', -1, created_at=instance.created_at)
+        badges.record(instance.user_id, 'comments', -1)
+        instance.delete()
 
 
-class DetectedObjectViewSet(viewsets.ModelViewSet):
+class DetectedObjectViewSet(sharding.ShardedViewMixin, SparseFieldsetsViewMixin, viewsets.ModelViewSet):
     queryset = DetectedObject.objects.all()
     serializer_class = DetectedObjectSerializer
 
+    def shard_for_request(self, request):
+        if 'pk' in self.kwargs:
+            return sharding.locate(DetectedObject, self.kwargs['pk'])
+        if self.action == 'create' and isinstance(request.data, dict):
+            return sharding.locate(Post, request.data.get('post'))
+        return None, None
+
+    def list(self, request, *args, **kwargs):
+        if not sharding.scattered():
+            return super().list(request, *args, **kwargs)
+        objects = sorted(
+            sharding.scatter(self.filter_queryset(self.get_queryset()), field='post__group_id'), key=lambda obj: obj.id
+        )
+        return Response(self.get_serializer(objects, many=True).data)
+
+    def perform_create(self, serializer):
+        # Oggetto sullo shard, catalogo e conteggi su `default`: una transazione per database
+        with sharding.atomic():
+            serializer.instance = create_detections(serializer.validated_data['post'], [serializer.validated_data])[0]
+
+    def perform_update(self, serializer):
+        post = serializer.validated_data.get('post')
+        if post is not None and sharding.enabled() and \
+                sharding.shard_for_group(post.group_id) != serializer.instance._state.db:
+            raise ValidationError({'post': "L'oggetto non può essere spostato su un post di un altro database"})
+
+        with sharding.atomic():
+            old_group_id, old_label = serializer.instance.post.group_id, serializer.instance.label
+            obj = serializer.save()
+            tip = tip_catalog.resolve([{
+                'label': obj.label,
+                'description': obj.description,
+                'recycle_tips': obj.recycle_tips,
+            }]).popitem()[1]
+            obj.tip_id = tip['id']
+            # Come per l'inserimento, i testi uguali al catalogo non vengono duplicati
+            if obj.description == tip['description']:
+                obj.description = ''
+            if obj.recycle_tips == tip['recycle_tips']:
+                obj.recycle_tips = ''
+            obj.save(update_fields=['tip', 'description', 'recycle_tips'])
+
+            if (old_group_id, old_label) != (obj.post.group_id, obj.label):
+                update_group_stats(old_group_id, [old_label], sign=-1)
+                update_group_stats(obj.post.group_id, [obj.label])
+
+    def perform_destroy(self, instance):
+        with sharding.atomic():
+            update_group_stats(instance.post.group_id, [instance.label], sign=-1)
+            instance.delete()
+
 
 class QuizViewSet(viewsets.ModelViewSet):
     queryset = Quiz.objects.all()
     serializer_class = QuizSerializer
 
+    @action(detail=False, methods=['get'])
+    def session(self, request):
+        """
+        ?count= domande casuali (default 10, massimo MAX_QUIZ_SESSION) senza risposta corretta,
+        estratte dalle domande in memoria invece che con ORDER BY RAND()
+        """
+        try:
+            count = int(request.query_params.get('count', 10))
+        except (ValueError, TypeError):
+            return Response({'error': 'count non valido'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= count <= MAX_QUIZ_SESSION:
+            return Response(
+                {'error': f'count deve essere tra 1 e {MAX_QUIZ_SESSION}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response({'questions': quiz_pool.sample(count)})
+
+    @action(detail=False, methods=['post'])
+    def grade(self, request):
+        """
+        Corregge un intero foglio di risposte: {"answers": {"<quiz_id>": "<risposta>", ...}}
+        """
+        answers = request.data.get('answers')
+        if not isinstance(answers, dict) or not answers:
+            return Response({'error': 'answers deve essere un oggetto non vuoto'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(answers) > MAX_QUIZ_SESSION:
+            return Response(
+                {'error': f'Massimo {MAX_QUIZ_SESSION} risposte per foglio'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            answers = {int(quiz_id): answer for quiz_id, answer in answers.items()}
+        except (ValueError, TypeError):
+            return Response({'error': 'Gli id dei quiz devono essere interi'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results, correct = quiz_pool.grade(answers)
+        return Response({
+            'correct': correct,
+            'total': len(results),
+            'results': results,
+        })
+
+
+class NotificationViewSet(viewsets.GenericViewSet):
+    serializer_class = NotificationSerializer
+    authentication_classes = [TokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    pagination_class = NotificationPagination
+
+    def get_queryset(self):
+        return Notification.objects.filter(recipient=self.request.user).select_related('last_actor')
+
+    def list(self, request):
+        """
+        Notifiche dell'utente dalla più recente, paginate a cursore. Di default solo le non
+        lette; con ?include_read=true anche quelle già lette
+        """
+        queryset = self.get_queryset()
+        if request.query_params.get('include_read', '').lower() not in ('1', 'true'):
+            queryset = queryset.filter(is_read=False)
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @action(detail=False, methods=['get'], url_path='unread-count', url_name='unread-count')
+    def unread_count(self, request):
+        """Numero di notifiche non lette, dal contatore (senza contare le righe)"""
+        return Response({'unread': notifications.unread_count(request.user)})
+
+    @action(detail=False, methods=['post'], url_path='mark-read', url_name='mark-read')
+    def mark_read(self, request):
+        """
+        Segna come lette le notifiche {"ids": [1, 2]}; senza ids le segna tutte
+        """
+        ids = request.data.get('ids')
+        if ids is not None:
+            if not isinstance(ids, list):
+                return Response({'error': 'ids deve essere una lista'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                ids = [int(notification_id) for notification_id in ids]
+            except (ValueError, TypeError):
+                return Response({'error': 'ids deve contenere solo interi'}, status=status.HTTP_400_BAD_REQUEST)
+
+        marked = notifications.mark_read(request.user, ids)
+        return Response({'marked': marked, 'unread': notifications.unread_count(request.user)})
+
 
 class BadgeViewSet(viewsets.ModelViewSet):
     queryset = Badge.objects.all()
@@ -559,6 +1364,7 @@ class UserBadgeViewSet(viewsets.ModelViewSet):
 @api_view(['POST'])
 @authentication_classes([TokenAuthentication])
 @permission_classes([IsAuthenticated])
+@idempotent('user.update_points')
 def update_user_points(request):
     """
     Aggiorna i punti eco dell'utente quando guadagna punti in un gioco
@@ -570,6 +1376,7 @@ def update_user_points(request):
         return Response({'error': 'Punti non validi'}, status=status.HTTP_400_BAD_REQUEST)
 
     user = request.user
+    previous_points = user.eco_points
 
     if game_id:
         best_score = GameScore.objects.filter(user=user, game_id=game_id).order_by('-score').first()
@@ -589,6 +1396,9 @@ def update_user_points(request):
             user.eco_points += diff
             user.save()
 
+    if user.eco_points != previous_points:
+        badges.set_progress(user.id, 'eco_points', previous_points, user.eco_points)
+
     return Response({
         'success': True,
         'message': f'Punteggio aggiornato con successo',
@@ -611,9 +1421,11 @@ def get_leaderboard(request):
             best_score=Max('score')
         ).order_by('-best_score')[:50]
 
+        users = User.objects.in_bulk([entry['user'] for entry in user_best_scores])
+
         leaderboard_data = []
         for entry in user_best_scores:
-            user = User.objects.get(id=entry['user'])
+            user = users[entry['user']]
             leaderboard_data.append({
                 'userId': user.id,
                 'username': user.username,
@@ -623,9 +1435,9 @@ def get_leaderboard(request):
 
         return Response(leaderboard_data)
     else:
-        from django.db import connection
+        from django.db import connections, router
 
-        with connection.cursor() as cursor:
+        with connections[router.db_for_read(GameScore)].cursor() as cursor:
             cursor.execute("""
                 SELECT 
                     user_id, 
@@ -649,18 +1461,60 @@ def get_leaderboard(request):
 
             rows = cursor.fetchall()
 
+        # Un'unica query per tutti gli utenti in classifica
+        users = User.objects.in_bulk([row[0] for row in rows])
+
         leaderboard_data = []
         for row in rows:
             user_id, total_score = row
-            try:
-                user = User.objects.get(id=user_id)
-                leaderboard_data.append({
-                    'userId': user.id,
-                    'username': user.username,
-                    'ecoPoints': int(total_score),
-                    'avatar': user.avatar  # Include avatar nella classifica
-                })
-            except User.DoesNotExist:
-                pass
+            user = users.get(user_id)
+            if user is None:
+                continue
+            leaderboard_data.append({
+                'userId': user.id,
+                'username': user.username,
+                'ecoPoints': int(total_score),
+                'avatar': user.avatar  # Include avatar nella classifica
+            })
+
+        return Response(leaderboard_data)
+
+
+SLOW_QUERY_ORDERING = {'total': '-total_ms', 'max': '-max_ms', 'count': '-count', 'recent': '-last_seen'}
+
+
+@api_view(['GET'])
+@authentication_classes([TokenAuthentication])
+@permission_classes([IsAdminUser])
+def slow_queries(request):
+    """
+    Query lente aggregate per impronta, con rotte e piano EXPLAIN (solo staff).
+    ?order=total|max|count|recent, ?limit=N (max 200)
+    """
+    ordering = SLOW_QUERY_ORDERING.get(request.query_params.get('order', 'total'))
+    if ordering is None:
+        return Response(
+            {'error': f"order deve essere uno tra {', '.join(SLOW_QUERY_ORDERING)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', 50)), 200))
+    except ValueError:
+        return Response({'error': 'limit non valido'}, status=status.HTTP_400_BAD_REQUEST)
+
+    entries = SlowQuery.objects.order_by(ordering)[:limit]
+    return Response(SlowQuerySerializer(entries, many=True).data)
+
+
+def metrics(request):
+    """
+    Espone le metriche per endpoint in formato Prometheus.
+    Se settings.METRICS_TOKEN è impostato serve l'header "Authorization: Bearer <token>".
+    """
+    expected = getattr(settings, 'METRICS_TOKEN', None)
+    if expected:
+        header = request.headers.get('Authorization', '')
+        if not constant_time_compare(header, f'Bearer {expected}'):
+            return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
 
-        return Response(leaderboard_data)
\ No newline at end of file
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
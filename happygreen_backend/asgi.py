@@ -9,8 +9,26 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'happygreen_backend.settings')
 
-application = get_asgi_application()
+# Come get_asgi_application(), ma con l'handler che esegue i generatori delle
+# risposte in streaming fuori dall'event loop (export dei gruppi)
+django.setup(set_prefix=False)
+
+# Importato dopo il setup di Django perché usa i modelli
+from django.conf import settings  # noqa: E402
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler  # noqa: E402
+
+from core.asgi_handler import StreamingASGIHandler  # noqa: E402
+from core.streams import route_streams  # noqa: E402
+
+django_application = StreamingASGIHandler()
+
+if settings.DEBUG:
+    # Come runserver, in sviluppo serve anche i file statici (admin)
+    django_application = ASGIStaticFilesHandler(django_application)
+
+# Gli stream SSE dei gruppi (/events/groups/<id>/) sono gestiti fuori dalle view Django
+application = route_streams(django_application)
@@ -1,6 +1,9 @@
 from pathlib import Path
+import importlib.util
 import os
 
+from corsheaders.defaults import default_headers
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 AUTH_USER_MODEL = 'core.User'
@@ -63,6 +66,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Prima delle metriche: il salvataggio delle query lente non rientra nelle query della rotta
+    'core.middleware.SlowQueryMiddleware',
+    # Così misura anche il tempo degli altri middleware
+    'core.middleware.MetricsMiddleware',
+    'core.profiling.ProfilingMiddleware',
+    # Dentro le metriche: le query sulle repliche vengono contate con quelle del primario
+    'core.db_routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,9 +83,76 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = list(default_headers) + ['idempotency-key', 'x-profile']
+CORS_EXPOSE_HEADERS = ['idempotent-replayed', 'server-timing', 'x-profile-file']
+
+# Se impostato, /metrics/ richiede "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Profiler a campionamento: SAMPLE_RATE è la frazione di richieste profilate (0 = solo
+# con l'header X-Profile firmato, vedi `manage.py profiling_header <username>`)
+HAPPYGREEN_PROFILING = {
+    'SAMPLE_RATE': float(os.environ.get('HAPPYGREEN_PROFILE_RATE', '0')),
+    'INTERVAL_MS': 5,
+    'OUTPUT_DIR': os.environ.get('HAPPYGREEN_PROFILE_DIR', os.path.join(BASE_DIR, 'profiles')),
+}
+
+# Query più lente della soglia salvate in SlowQuery con il piano EXPLAIN
+# (consultabili con `manage.py slow_queries` o GET /staff/slow-queries/ per lo staff)
+HAPPYGREEN_SLOW_QUERIES = {
+    'ENABLED': os.environ.get('HAPPYGREEN_SLOW_QUERIES', '1') == '1',
+    'THRESHOLD_MS': float(os.environ.get('HAPPYGREEN_SLOW_QUERY_MS', '200')),
+}
+
+# Per quanto tempo una risposta resta associata al suo header Idempotency-Key
+HAPPYGREEN_IDEMPOTENCY_TTL_HOURS = 24
+# Per quanto tempo una richiesta in corso tiene la sua chiave (oltre il timeout dei worker)
+HAPPYGREEN_IDEMPOTENCY_LEASE_SECONDS = 60
+
+# Punti di popolarità per evento e dimezzamento applicato da `manage.py decay_trending_scores`
+HAPPYGREEN_TRENDING = {
+    'WEIGHTS': {'like': 1.0, 'reaction': 1.0, 'comment': 2.0},
+    'HALF_LIFE_HOURS': 24,
+    # Sotto questa soglia il punteggio viene azzerato
+    'MIN_SCORE': 0.01,
+}
+
+# Archiviazione dei post vecchi (manage.py archive_posts, vedi core/archive.py)
+HAPPYGREEN_ARCHIVE = {
+    # Default di --days: post più vecchi di un anno scolastico
+    'AFTER_DAYS': 365,
+    'BATCH_SIZE': 200,
+    'COMPRESSION_LEVEL': 6,
+}
+
+# JSON con orjson (stessi byte di JSONRenderer, vedi core/renderers.py); MessagePack
+# (application/msgpack) solo se il pacchetto facoltativo `msgpack` è installato
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+if importlib.util.find_spec('msgpack') is not None:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append('core.renderers.MessagePackRenderer')
+    REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'].append('core.renderers.MessagePackParser')
+
 ROOT_URLCONF = 'happygreen_backend.urls'
 
 WSGI_APPLICATION = 'happygreen_backend.wsgi.application'
+ASGI_APPLICATION = 'happygreen_backend.asgi.application'
+
+# Pub/sub per gli stream di attività dei gruppi (/events/groups/<id>/).
+# Con più worker usare 'core.events.RedisBackend' con OPTIONS {'url': 'redis://...'}
+HAPPYGREEN_EVENTS = {
+    'BACKEND': os.environ.get('HAPPYGREEN_EVENTS_BACKEND', 'core.events.InMemoryBackend'),
+    'OPTIONS': {},
+}
 
 DATABASES = {
     'default': {
@@ -88,6 +165,39 @@ DATABASES = {
     }
 }
 
+# Repliche in sola lettura per le richieste GET (vedi core/db_routers.py):
+# HAPPYGREEN_DB_REPLICA_HOSTS=replica1,replica2 aggiunge gli alias replica_1, replica_2, ...
+# con le stesse credenziali del primario. Nei test le repliche puntano al database di test di default
+for index, host in enumerate(filter(None, os.environ.get('HAPPYGREEN_DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica_{index}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+# Sharding per gruppo di post, commenti, like e reaction (vedi core/sharding.py):
+# HAPPYGREEN_DB_SHARD_HOSTS=shard1,shard2 aggiunge gli alias shard_1, shard_2, ... ; default è il primo shard.
+# Dopo `migrate --database shard_N` eseguire `manage.py reshard_group --prepare`
+SHARD_ALIASES = []
+for index, host in enumerate(filter(None, os.environ.get('HAPPYGREEN_DB_SHARD_HOSTS', '').split(',')), 1):
+    DATABASES[f'shard_{index}'] = {**DATABASES['default'], 'HOST': host.strip()}
+    SHARD_ALIASES.append(f'shard_{index}')
+DATABASE_ROUTERS = ['core.sharding.ShardRouter', 'core.db_routers.ReplicaRouter']
+
+HAPPYGREEN_REPLICAS = {
+    # Dopo una scrittura il client legge dal primario per questi secondi (read-your-writes)
+    'STICKY_SECONDS': 5,
+    # Oltre questo ritardo una replica non riceve letture
+    'MAX_LAG_SECONDS': 2,
+    'LAG_CHECK_SECONDS': 5,
+}
+
+HAPPYGREEN_SHARDS = {
+    'ALIASES': ['default', *SHARD_ALIASES] if SHARD_ALIASES else [],
+    # Ogni processo rilegge la mappa gruppo -> shard dopo questi secondi; reshard_group aspetta
+    # altrettanto prima di copiare le ultime modifiche e prima di pulire il vecchio shard
+    'MAP_TTL_SECONDS': 30,
+    # Numero massimo di shard: gli id di ogni shard sono ≡ posizione+1 (mod ID_STRIDE)
+    'ID_STRIDE': 16,
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
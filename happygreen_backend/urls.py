@@ -2,10 +2,12 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
+from core import views as core_views
 from happygreen_backend import settings
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics/', core_views.metrics, name='metrics'),
     path('api/', include('core.urls')),  # <-- questa riga importa le rotte del router da core/urls.py
     path('', include('core.urls'))
 ]